@@ -1,9 +1,13 @@
 from datetime import datetime
 from pathlib import Path
 import logging
+import time
 
-from . import state
+from . import debug, state
 from .data import ABDataPoint
+from .estimator import KalmanEstimator
+from .realtime import FlightMode
+from .timing import LoopTimer, TimedServo
 
 logger = logging.getLogger("airbrakes_data")
 
@@ -19,15 +23,47 @@ class Airbrakes:
     SERVO_CLOSED_DUTY = 6.3
     SERVO_OPEN_DUTY = 9.2
 
+    # The most data points to handle in one update. If the loop falls behind, it catches up in
+    # batches instead of making a servo decision for every old data point
+    MAX_BATCH_SIZE = 100
+    # How long an update waits for new data, in seconds
+    DATA_TIMEOUT = 0.1
+
     state = None
     velocity = 0
     altitude = 0
 
     last_data_point = None
 
-    def __init__(self, mock_servo=False, mock_imu=False):
+    # The latency histograms of the control loop, None unless timing is on
+    timer: LoopTimer = None
+    # Real time settings of the control loop, None unless flight mode is on
+    flight_mode: FlightMode = None
+
+    def __init__(
+        self,
+        mock_servo=False,
+        mock_imu=False,
+        simulator="openrocket",
+        log_format="csv",
+        timing=False,
+        timing_log_interval=0.0,
+        realtime=False,
+        replay_log=None,
+        replay_speed=1.0,
+        replay_rate=100.0,
+    ):
+        """
+        :param simulator: what the mock IMU flies, "openrocket", "native" or "replay"
+        :param replay_log: with the replay simulator, the _estLORDlog.csv or .ablog to replay
+        :param replay_speed: how many times faster than real time to replay, 0 for as fast as possible
+        :param replay_rate: the rate in Hz that a replayed CSV log without timestamps was logged at
+        """
         self.ready_to_shutdown = False
 
+        # Fuses the acceleration and altitude into the altitude and velocity the states use
+        self.estimator = KalmanEstimator()
+
         if mock_servo:
             from .mock import MockServoInterface as ServoInterface
         else:
@@ -35,7 +71,23 @@ class Airbrakes:
 
         self.servo = ServoInterface.Servo(self.SERVO_PIN, self.SERVO_OPEN_DUTY, self.SERVO_CLOSED_DUTY)
 
-        if mock_imu:
+        if timing:
+            self.timer = LoopTimer(timing_log_interval)
+            self.servo = TimedServo(self.servo, self.timer)
+
+        if mock_imu and simulator == "replay":
+            from .mock import ReplayMSCLInterface
+
+            self.interface = ReplayMSCLInterface.ReplayMSCLInterface(
+                self.servo, replay_log, replay_speed, sample_rate=replay_rate
+            )
+
+        elif mock_imu and simulator == "native":
+            from .mock import NativeSimulation
+
+            self.interface = NativeSimulation.NativeSimulationInterface(self.servo)
+
+        elif mock_imu:
             from .mock import MockMSCLInterface
 
             self.interface = MockMSCLInterface.MockMSCLInterface(self.servo)
@@ -48,40 +100,97 @@ class Airbrakes:
             log_folder = Path("./logs")
             log_folder.mkdir(parents=True, exist_ok=True)
 
-            self.interface = MSCLInterface.MSCLInterface(
-                "/dev/ttyACM0",
-                open(f"./logs/{now}_rawLORDlog.csv", "w+"),
-                open(f"./logs/{now}_estLORDlog.csv", "w+"),
-            )
+            if log_format == "binary":
+                # See flight_log.py, use Scripts/export_flight_log.py to turn these into CSV
+                self.interface = MSCLInterface.MSCLInterface(
+                    "/dev/ttyACM0",
+                    open(f"./logs/{now}_rawLORDlog.ablog", "wb"),
+                    open(f"./logs/{now}_estLORDlog.ablog", "wb"),
+                    binary_logs=True,
+                )
+            else:
+                self.interface = MSCLInterface.MSCLInterface(
+                    "/dev/ttyACM0",
+                    open(f"./logs/{now}_rawLORDlog.csv", "w+"),
+                    open(f"./logs/{now}_estLORDlog.csv", "w+"),
+                )
 
         self.interface.start_logging_loop_thread()
         
         self.to_state(state.StandbyState)
 
+        # After the standby state so the lookup tables are loaded before the memory gets locked
+        if realtime:
+            self.flight_mode = FlightMode()
+            self.flight_mode.start()
+            acquisition_process = getattr(self.interface, "logging_thread", None)
+            if acquisition_process is not None and acquisition_process.pid is not None:
+                self.flight_mode.setup_acquisition(acquisition_process.pid)
+
     def to_state(self, new_state):
         #if self.state is not None:
         logger.info("State Change,%s", new_state.__name__)
-        print("State Change")
+        debug.info("State Change: %s", new_state.__name__)
+
+        # No garbage collection pauses between liftoff and when the airbrakes are retracted
+        if self.flight_mode is not None:
+            if new_state is state.LiftoffState:
+                self.flight_mode.enter_flight()
+            elif new_state is state.FreefallState:
+                self.flight_mode.exit_flight()
+
         self.state = new_state(self)
 
-    def process_data_point(self, data_point: ABDataPoint):
-        self.state.process(data_point)
+    def process_data_points(self, data_points: list[ABDataPoint]):
+        self.state.process_batch(data_points)
 
     def update(self):
-        data_point = self.interface.pop_data_point()
-        if data_point == "Done":
-            self.ready_to_shutdown = True
-            logger.info("Done")
-        elif data_point is not None:
-            if self.last_data_point is None:
-                self.last_data_point = data_point
-                return
-
-            self.altitude = data_point.altitude
+        timer = self.timer
+        if timer is not None:
+            dequeue_start = time.perf_counter_ns()
+
+        data_points = self.interface.pop_data_points(self.MAX_BATCH_SIZE, self.DATA_TIMEOUT)
+
+        done = bool(data_points) and data_points[-1] == "Done"
+        if done:
+            data_points.pop()
+
+        if self.flight_mode is not None:
+            tick = self.flight_mode.jitter.tick
+            for data_point in data_points:
+                tick(data_point.timestamp)
+
+        if timer is not None:
+            dequeue_end = time.perf_counter_ns()
+            timer.dequeue.record(dequeue_end - dequeue_start)
+            timer.record_samples([data_point.received_time for data_point in data_points], dequeue_end)
+
+        if data_points and self.last_data_point is None:
+            self.last_data_point = data_points.pop(0)
+            self.estimator.reset(self.last_data_point.altitude)
+
+        # Every data point goes into the velocity estimate, but the states
+        # only need to make one decision for the whole batch
+        for data_point in data_points:
+            # So the log and the states see the time of the data point being handled
+            self.interface.last_time = data_point.timestamp
             dt_seconds: float = (
                 data_point.timestamp - self.last_data_point.timestamp
             ) / 10.0**9
-            self.estimate_velocity(data_point.accel, dt_seconds)
+            self.estimator.update(data_point.accel, data_point.altitude, dt_seconds)
+            self.altitude = self.estimator.altitude
+            self.velocity = self.estimator.velocity
+            if debug.level >= debug.VERBOSE:
+                debug.rate_limited(
+                    "data point",
+                    0.1,
+                    debug.VERBOSE,
+                    "accel: %s, dt: %s, altitude: %.2f, velocity: %.2f",
+                    data_point.accel,
+                    dt_seconds,
+                    self.altitude,
+                    self.velocity,
+                )
             logger.info(
                 "Data point,%s,%s,%s",
                 data_point.altitude,
@@ -90,18 +199,35 @@ class Airbrakes:
             )
 
             self.last_data_point = data_point
-            self.process_data_point(data_point)
+
+        if timer is not None:
+            estimate_end = time.perf_counter_ns()
+            timer.estimate.record(estimate_end - dequeue_end)
+
+        if data_points:
+            self.process_data_points(data_points)
+
+        if timer is not None:
+            process_end = time.perf_counter_ns()
+            if data_points:
+                timer.process.record(process_end - estimate_end)
+                timer.update.record(process_end - dequeue_end)
+            timer.maybe_log()
+
+        if done:
+            self.ready_to_shutdown = True
+            logger.info("Done")
 
     def shutdown(self):
         self.interface.stop_logging_loop()
         del self.interface
-
-    def estimate_velocity(self, a: float, dt: float):
-        self.velocity += a * dt
-        print("accel:" + str(a))
-        print("dt:" + str(dt))
-        if abs(self.velocity) < 0.001:
-            self.velocity = 0.0
+        if self.timer is not None:
+            print("Control loop timing:")
+            print(self.timer.report())
+        if self.flight_mode is not None:
+            self.flight_mode.exit_flight()
+            print("Flight mode:")
+            print(self.flight_mode.report())
 
     def get_motor_burn_time(self):
         return self.MOTOR_BURN_TIME
@@ -0,0 +1,149 @@
+"""
+A polynomial in velocity and airbrake extension fitted to the PID lookup table, as an alternative
+to looking the change in altitude up in the table. It's a few dozen bytes instead of a grid, and
+estimating is a handful of multiplies with nothing to search.
+
+Scripts/fit_apogee_model.py fits it by least squares and reports how far it is from the table.
+ControlState uses it instead of the table when its apogee_estimator_name is "model". A model that is
+more than MAX_RESIDUAL off the table anywhere isn't saved, and isn't loaded either.
+"""
+
+from __future__ import annotations
+
+import os
+
+import numpy as np
+
+from .lookup_table_control import TABLE_DIRECTORY, load_compiled_table, save_compiled_table
+
+APOGEE_MODEL_PATH = os.path.join(TABLE_DIRECTORY, "apogee_model.npy")
+# How far in m the model may be from any cell of the table. The table goes from the velocity at the
+# start of control down, so this holds everywhere the model is used.
+MAX_RESIDUAL = 5.0
+
+
+class ApogeeModel:
+    """
+    change_in_altitude = sum of coefficients[i, j] * (velocity * velocity_scale)^i * extension^j
+
+    The velocity is scaled to about 0 to 1 so the powers stay close in size. Like the table, values
+    outside the range the model was fitted on are clamped to its edges, since a polynomial can go
+    anywhere outside of it.
+    """
+
+    def __init__(self, coefficients, velocity_scale: float, velocity_range: tuple, extension_range: tuple):
+        """
+        :param coefficients: 2D array indexed [power of velocity, power of extension]
+        :param velocity_scale: what the velocity is multiplied by before taking its powers
+        :param velocity_range: the (lowest, highest) velocity the model was fitted on
+        :param extension_range: the (lowest, highest) extension the model was fitted on
+        """
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        if self.coefficients.ndim != 2:
+            raise ValueError("The coefficients need a row per power of velocity and a column per power of extension")
+        self.velocity_scale = float(velocity_scale)
+        self.min_velocity, self.max_velocity = (float(velocity) for velocity in velocity_range)
+        self.min_extension, self.max_extension = (float(extension) for extension in extension_range)
+
+        # Highest powers first for Horner's method, as lists since they are read one number at a time
+        self._rows = [row[::-1] for row in self.coefficients[::-1].tolist()]
+        # The extension of the last estimate, and the coefficients of the velocity powers for it
+        self._extension = None
+        self._velocity_coefficients = None
+
+    @property
+    def velocity_degree(self) -> int:
+        return self.coefficients.shape[0] - 1
+
+    @property
+    def extension_degree(self) -> int:
+        return self.coefficients.shape[1] - 1
+
+    @classmethod
+    def load(cls, compiled_path: str = APOGEE_MODEL_PATH, max_residual: float = MAX_RESIDUAL) -> ApogeeModel:
+        """
+        Loads a model that was saved with save
+        :param max_residual: refuses a model that was further than this from its table, in m
+        """
+        data, header = load_compiled_table(compiled_path, "apogee_model")
+        residuals = header.get("residuals")
+        if residuals is not None and residuals["max"] > max_residual:
+            raise ValueError(
+                f"{compiled_path} is up to {residuals['max']:.1f} m off its table, more than the {max_residual:g} m "
+                "it's allowed to be"
+            )
+        return cls(data, header["velocity_scale"], header["velocity_range"], header["extension_range"])
+
+    def save(self, compiled_path: str = APOGEE_MODEL_PATH, source_path: str = None, residuals: dict = None) -> None:
+        """
+        Saves the coefficients the same way as the compiled lookup tables
+        :param compiled_path: the .npy file to write
+        :param source_path: the lookup table CSV the model was fitted to, if any
+        :param residuals: how far the model is from the table, checked by load
+        """
+        header = {
+            "kind": "apogee_model",
+            "velocity_scale": self.velocity_scale,
+            "velocity_range": [self.min_velocity, self.max_velocity],
+            "extension_range": [self.min_extension, self.max_extension],
+        }
+        if residuals is not None:
+            header["residuals"] = residuals
+        save_compiled_table(compiled_path, self.coefficients, header, source_path)
+
+    def estimate(self, current_velocity: float, current_extension: float) -> float:
+        """
+        Estimates the change in altitude of the rocket based on its current
+        velocity and current airbrake extension, same as ApogeeGrid.estimate
+        :param current_velocity: the current velocity in m/s
+        :param current_extension: the current airbrake extension from 0.0 to 1.0
+        :return: the estimated change in altitude
+        """
+        if current_velocity < self.min_velocity:
+            current_velocity = self.min_velocity
+        elif current_velocity > self.max_velocity:
+            current_velocity = self.max_velocity
+        if current_extension < self.min_extension:
+            current_extension = self.min_extension
+        elif current_extension > self.max_extension:
+            current_extension = self.max_extension
+
+        # The extension only changes when the servo is moved, so the polynomial in velocity that it
+        # leaves is kept until it does
+        if current_extension != self._extension:
+            velocity_coefficients = []
+            for row in self._rows:
+                coefficient = 0.0
+                for extension_coefficient in row:
+                    coefficient = coefficient * current_extension + extension_coefficient
+                velocity_coefficients.append(coefficient)
+            self._velocity_coefficients = velocity_coefficients
+            self._extension = current_extension
+
+        velocity = current_velocity * self.velocity_scale
+        change_in_altitude = 0.0
+        for coefficient in self._velocity_coefficients:
+            change_in_altitude = change_in_altitude * velocity + coefficient
+        return change_in_altitude
+
+    def estimate_batch(self, velocities, extensions) -> np.ndarray:
+        """
+        Vectorized version of estimate, for evaluating many (velocity, extension) pairs at once.
+        The inputs are broadcast against each other.
+        :param velocities: array of velocities in m/s
+        :param extensions: array of airbrake extensions from 0.0 to 1.0
+        :return: array of estimated changes in altitude
+        """
+        velocities = np.clip(np.asarray(velocities, dtype=np.float64), self.min_velocity, self.max_velocity)
+        extensions = np.clip(np.asarray(extensions, dtype=np.float64), self.min_extension, self.max_extension)
+        velocities, extensions = np.broadcast_arrays(velocities, extensions)
+        return np.polynomial.polynomial.polyval2d(velocities * self.velocity_scale, extensions, self.coefficients)
+
+
+def load_apogee_model(compiled_path: str = APOGEE_MODEL_PATH) -> ApogeeModel:
+    """
+    Loads the fitted apogee model, see Scripts/fit_apogee_model.py
+    """
+    if not os.path.exists(compiled_path):
+        raise FileNotFoundError(f"{compiled_path} doesn't exist, make it with python -m Scripts.fit_apogee_model")
+    return ApogeeModel.load(compiled_path)
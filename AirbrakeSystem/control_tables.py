@@ -0,0 +1,75 @@
+"""
+Lazily loads the lookup tables used by the control state. Importing AirbrakeSystem doesn't read
+any files (or import numpy), the tables are loaded the first time they are needed and then cached.
+StandbyState warms them up while the rocket is on the pad, so ControlState never waits on a load.
+"""
+
+from __future__ import annotations
+
+import functools
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .apogee_model import ApogeeModel
+    from .lookup_table_control import ApogeeGrid, BangBangTable
+
+
+@functools.lru_cache(maxsize=None)
+def get_apogee_grid() -> ApogeeGrid:
+    """
+    Gets the PID lookup table grid, loading it on the first call
+    """
+    from .lookup_table_control import load_apogee_grid
+
+    return load_apogee_grid()
+
+
+@functools.lru_cache(maxsize=None)
+def get_bang_bang_table() -> BangBangTable:
+    """
+    Gets the bang bang lookup table, loading it on the first call
+    """
+    from .lookup_table_control import load_bang_bang_table
+
+    return load_bang_bang_table()
+
+
+@functools.lru_cache(maxsize=None)
+def get_apogee_model() -> ApogeeModel:
+    """
+    Gets the polynomial fitted to the PID lookup table, loading it on the first call
+    """
+    from .apogee_model import load_apogee_model
+
+    return load_apogee_model()
+
+
+def get_apogee_estimator(name: str = "table") -> ApogeeGrid | ApogeeModel:
+    """
+    Gets what the change in altitude is estimated with, both have the same estimate method
+    :param name: "table" for the PID lookup table or "model" for the polynomial fitted to it
+    """
+    if name == "table":
+        return get_apogee_grid()
+    if name == "model":
+        return get_apogee_model()
+    raise ValueError(f"Unknown apogee estimator: {name}")
+
+
+def warm_up(apogee_estimator_name: str = "table") -> None:
+    """
+    Loads the lookup tables so that later calls return immediately
+    :param apogee_estimator_name: which of the PID lookup table and the fitted model to load,
+        see get_apogee_estimator
+    """
+    get_apogee_estimator(apogee_estimator_name)
+    get_bang_bang_table()
+
+
+def clear() -> None:
+    """
+    Drops the cached tables, e.g. after regenerating them, so they get loaded again on next use
+    """
+    get_apogee_grid.cache_clear()
+    get_apogee_model.cache_clear()
+    get_bang_bang_table.cache_clear()
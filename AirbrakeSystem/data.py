@@ -5,8 +5,67 @@ from msgspec import Struct
 
 
 # Data point format class
-class ABDataPoint(Struct):
+# It only holds numbers, so it can never be part of a reference cycle. With gc=False the garbage
+# collector doesn't track data points, so making them never counts towards a collection.
+class ABDataPoint(Struct, gc=False):
     accel: float
     timestamp: int
     altitude: float
     velocity: float
+    # time.perf_counter_ns() of when the data point was received from the IMU, 0 if unknown (see timing.py)
+    received_time: int = 0
+
+
+class DataPointPool:
+    """
+    A fixed set of data points that get filled in round robin, so that popping data points off the
+    IMU doesn't make new objects for every one of them.
+
+    A data point gets overwritten `size` data points later, so nothing can keep one around for
+    longer than that. Airbrakes only keeps the last one, so the size has to be at least one more
+    than the biggest batch.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.data_points = [ABDataPoint(0.0, 0, 0.0, 0.0) for _ in range(size)]
+        self.index = 0
+        # Handed out by take(), and reused by the next call
+        self.batch: list[ABDataPoint] = []
+
+    def take(self, records) -> list[ABDataPoint]:
+        """
+        Copies data points from the IMU into the pool
+        :param records: structured array of ring_buffer.DATA_POINT_DTYPE, at most `size` long
+        :return: the data points, in a list that is cleared and refilled by the next call
+        """
+        batch = self.batch
+        batch.clear()
+        if len(records) == 0:
+            return batch
+        if len(records) > self.size:
+            raise ValueError(f"Can't take {len(records)} data points from a pool of {self.size}")
+
+        data_points = self.data_points
+        index = self.index
+        size = self.size
+        # A list per field instead of a tuple per data point
+        for accel, timestamp, altitude, velocity, received_time in zip(
+            records["accel"].tolist(),
+            records["timestamp"].tolist(),
+            records["altitude"].tolist(),
+            records["velocity"].tolist(),
+            records["received_time"].tolist(),
+        ):
+            data_point = data_points[index]
+            data_point.accel = accel
+            data_point.timestamp = timestamp
+            data_point.altitude = altitude
+            data_point.velocity = velocity
+            data_point.received_time = received_time
+            batch.append(data_point)
+            index += 1
+            if index == size:
+                index = 0
+        self.index = index
+        return batch
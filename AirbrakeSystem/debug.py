@@ -0,0 +1,87 @@
+"""
+Console output for debugging, with levels and rate limiting.
+
+Printing on the Pi's serial console can block the control loop for milliseconds, so nothing in
+the flight code should call print directly. Messages are only formatted when their level is on:
+
+    debug.info("deploy time: %s", deploy_time)
+
+and anything that runs for every data point should check the level first, so that it costs a
+single comparison in flight:
+
+    if debug.level >= debug.VERBOSE:
+        debug.verbose("accel: %s", accel)
+
+The level is set from main.py, with --quiet for flight mode (no output at all) and --verbose for more.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+
+OFF = 0
+INFO = 1
+VERBOSE = 2
+
+LEVEL_NAMES = {"off": OFF, "info": INFO, "verbose": VERBOSE}
+
+level = INFO
+stream = None
+
+# The last time each rate limited message was written, and how many were skipped since then
+_last_write_times: dict[str, float] = {}
+_suppressed_counts: dict[str, int] = {}
+
+
+def set_level(new_level: int) -> None:
+    global level
+    level = new_level
+
+
+def set_stream(new_stream) -> None:
+    """
+    :param new_stream: where to write the messages, None for sys.stdout
+    """
+    global stream
+    stream = new_stream
+
+
+def write(message_level: int, message: str, *args) -> None:
+    """
+    Writes a message if its level is on, formatting it with `message % args`
+    """
+    if message_level > level:
+        return
+    if args:
+        message = message % args
+    (stream or sys.stdout).write(message + "\n")
+
+
+def info(message: str, *args) -> None:
+    write(INFO, message, *args)
+
+
+def verbose(message: str, *args) -> None:
+    write(VERBOSE, message, *args)
+
+
+def rate_limited(key: str, interval: float, message_level: int, message: str, *args) -> None:
+    """
+    Writes a message at most once every `interval` seconds for each key, and says how many were skipped
+    """
+    if message_level > level:
+        return
+    now = time.monotonic()
+    last_write_time = _last_write_times.get(key)
+    if last_write_time is not None and now - last_write_time < interval:
+        _suppressed_counts[key] = _suppressed_counts.get(key, 0) + 1
+        return
+
+    _last_write_times[key] = now
+    suppressed = _suppressed_counts.pop(key, 0)
+    if args:
+        message = message % args
+    if suppressed:
+        message = f"{message} ({suppressed} more since the last one)"
+    write(message_level, message)
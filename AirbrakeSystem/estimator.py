@@ -0,0 +1,170 @@
+"""
+Kalman filter that estimates the altitude, velocity and acceleration of the rocket from the
+measured acceleration (estLinearAccelX) and the pressure altitude (estPressureAlt).
+
+The state is [altitude, velocity, acceleration] with a constant acceleration model, where the
+acceleration changes by random jerk. Both measurements see one state each and their noise is
+independent, so they are applied as two scalar updates, and the symmetric 3x3 covariance is kept
+as 6 numbers. Everything is plain arithmetic, so there are no matrices to allocate, and the same
+code runs on numpy arrays to filter many flights at once (see Scripts/monte_carlo.py).
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class KalmanEstimator:
+    """
+    Constant acceleration Kalman filter of the altitude and velocity
+    """
+
+    # Standard deviation of the measurement noise of the accelerometer, in m/s^2
+    ACCELERATION_NOISE = 0.5
+    # Standard deviation of the measurement noise of the pressure altitude, in m
+    ALTITUDE_NOISE = 1.0
+    # How fast the acceleration can change, as the spectral density of the jerk, in m/s^3/sqrt(Hz).
+    # Bigger follows the motor burning out faster, smaller lets the altitude correct an accelerometer bias better.
+    JERK_NOISE = 50.0
+
+    def __init__(
+        self,
+        altitude=0.0,
+        acceleration_noise: float = ACCELERATION_NOISE,
+        altitude_noise: float = ALTITUDE_NOISE,
+        jerk_noise: float = JERK_NOISE,
+    ):
+        """
+        :param altitude: the starting altitude, a float or an array with one per flight
+        :param acceleration_noise: standard deviation of the acceleration measurements, in m/s^2
+        :param altitude_noise: standard deviation of the altitude measurements, in m
+        :param jerk_noise: spectral density of the jerk, in m/s^3/sqrt(Hz)
+        """
+        self.acceleration_variance = acceleration_noise**2
+        self.altitude_variance = altitude_noise**2
+        self.jerk_variance = jerk_noise**2
+        self.reset(altitude)
+
+    def reset(self, altitude=0.0) -> None:
+        """
+        Starts over sitting still at the given altitude
+        """
+        # Multiplying by 0.0 keeps the same shape when the altitude is an array
+        zero = altitude * 0.0
+        self.altitude = altitude + zero
+        self.velocity = zero
+        self.acceleration = zero
+
+        # The covariance: p<i><j> is between state i and j, in the order altitude, velocity, acceleration
+        self.p00 = zero + self.altitude_variance
+        self.p01 = zero
+        self.p02 = zero
+        self.p11 = zero + 1.0
+        self.p12 = zero
+        self.p22 = zero + self.acceleration_variance
+
+    def predict(self, dt) -> None:
+        """
+        Moves the state forward by dt seconds
+        """
+        half_dt2 = 0.5 * dt * dt
+        self.altitude = self.altitude + self.velocity * dt + self.acceleration * half_dt2
+        self.velocity = self.velocity + self.acceleration * dt
+
+        # P = F P F^T + Q, with F = [[1, dt, dt^2/2], [0, 1, dt], [0, 0, 1]]
+        fp00 = self.p00 + dt * self.p01 + half_dt2 * self.p02
+        fp01 = self.p01 + dt * self.p11 + half_dt2 * self.p12
+        fp02 = self.p02 + dt * self.p12 + half_dt2 * self.p22
+        fp11 = self.p11 + dt * self.p12
+        fp12 = self.p12 + dt * self.p22
+
+        # Q for white noise jerk
+        q = self.jerk_variance
+        dt2 = dt * dt
+        dt3 = dt2 * dt
+        self.p00 = fp00 + dt * fp01 + half_dt2 * fp02 + q * dt3 * dt2 / 20.0
+        self.p01 = fp01 + dt * fp02 + q * dt2 * dt2 / 8.0
+        self.p02 = fp02 + q * dt3 / 6.0
+        self.p11 = fp11 + dt * fp12 + q * dt3 / 3.0
+        self.p12 = fp12 + q * dt2 / 2.0
+        self.p22 = self.p22 + q * dt
+
+    def update_altitude(self, altitude) -> None:
+        """
+        Corrects the state with a measured altitude
+        """
+        inverse_s = 1.0 / (self.p00 + self.altitude_variance)
+        k0 = self.p00 * inverse_s
+        k1 = self.p01 * inverse_s
+        k2 = self.p02 * inverse_s
+        error = altitude - self.altitude
+        self.altitude = self.altitude + k0 * error
+        self.velocity = self.velocity + k1 * error
+        self.acceleration = self.acceleration + k2 * error
+
+        # P = (I - K H) P, with H picking out the altitude
+        p00, p01, p02 = self.p00, self.p01, self.p02
+        self.p11 = self.p11 - k1 * p01
+        self.p12 = self.p12 - k1 * p02
+        self.p22 = self.p22 - k2 * p02
+        self.p00 = p00 - k0 * p00
+        self.p01 = p01 - k0 * p01
+        self.p02 = p02 - k0 * p02
+
+    def update_acceleration(self, acceleration) -> None:
+        """
+        Corrects the state with a measured acceleration
+        """
+        inverse_s = 1.0 / (self.p22 + self.acceleration_variance)
+        k0 = self.p02 * inverse_s
+        k1 = self.p12 * inverse_s
+        k2 = self.p22 * inverse_s
+        error = acceleration - self.acceleration
+        self.altitude = self.altitude + k0 * error
+        self.velocity = self.velocity + k1 * error
+        self.acceleration = self.acceleration + k2 * error
+
+        # P = (I - K H) P, with H picking out the acceleration
+        p02, p12, p22 = self.p02, self.p12, self.p22
+        self.p00 = self.p00 - k0 * p02
+        self.p01 = self.p01 - k0 * p12
+        self.p11 = self.p11 - k1 * p12
+        self.p02 = p02 - k0 * p22
+        self.p12 = p12 - k1 * p22
+        self.p22 = p22 - k2 * p22
+
+    def update(self, acceleration, altitude, dt) -> None:
+        """
+        Moves forward by dt seconds and corrects with the measurements of one data point
+        """
+        self.predict(dt)
+        self.update_acceleration(acceleration)
+        self.update_altitude(altitude)
+
+    def filter(self, timestamps, accelerations, altitudes) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Runs the filter over a recorded flight, e.g. to replay a log. Time is the last axis, so
+        2D arrays filter a flight per row at once.
+        :param timestamps: in nanoseconds
+        :return: the estimated altitudes, velocities and accelerations at every data point
+        """
+        # Not imported at the top so that importing AirbrakeSystem doesn't load numpy
+        import numpy as np
+
+        timestamps = np.asarray(timestamps)
+        accelerations = np.asarray(accelerations, dtype=np.float64)
+        altitudes = np.asarray(altitudes, dtype=np.float64)
+        dts = np.diff(timestamps, axis=-1, prepend=timestamps[..., :1]) / 1e9
+
+        estimated_altitudes = np.empty(altitudes.shape)
+        estimated_velocities = np.empty(altitudes.shape)
+        estimated_accelerations = np.empty(altitudes.shape)
+        for i in range(altitudes.shape[-1]):
+            self.update(accelerations[..., i], altitudes[..., i], dts[..., i])
+            estimated_altitudes[..., i] = self.altitude
+            estimated_velocities[..., i] = self.velocity
+            estimated_accelerations[..., i] = self.acceleration
+        return estimated_altitudes, estimated_velocities, estimated_accelerations
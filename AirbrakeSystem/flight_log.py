@@ -0,0 +1,218 @@
+"""
+Compact binary flight log format, as an alternative to the CSV text logs.
+
+A log file starts with MAGIC, followed by frames:
+
+    <length: uint16> <tag: uint8> <payload: length - 1 bytes> <crc32 of tag and payload: uint32>
+
+All numbers are little endian. Every payload starts with the timestamp in nanoseconds (int64),
+followed by doubles or UTF-8 text depending on the tag. If we lose power in the middle of
+writing a frame, the reader finds a short or corrupted frame at the end and stops there, so
+everything before it can still be read.
+
+BinaryLogHandler writes the airbrakes_data log messages in this format straight from the log
+record arguments, without formatting them as strings. read_flight_log streams the frames back,
+and export_csv turns a binary log into the same text as the CSV log.
+"""
+
+from __future__ import annotations
+
+import logging
+import struct
+import time
+import zlib
+from typing import BinaryIO, Iterator
+
+MAGIC = b"ABLOG\x01\n"
+
+DATA_POINT = 1
+STATE_CHANGE = 2
+SERVO_CONTROL = 3
+PREDICTED_APOGEE = 4
+TARGET_APOGEE = 5
+MESSAGE = 6
+IMU_HEADER = 7
+IMU_ROW = 8
+
+# The log messages for each tag, used to pick the tag of a log record and to export back to CSV
+MESSAGE_FORMATS = {
+    DATA_POINT: "Data point,%s,%s,%s",
+    STATE_CHANGE: "State Change,%s",
+    SERVO_CONTROL: "Servo Control,%.3f",
+    PREDICTED_APOGEE: "Predicted Apogee,%.3f",
+    TARGET_APOGEE: "Target Apogee,%s",
+}
+MESSAGE_TAGS = {message_format: tag for tag, message_format in MESSAGE_FORMATS.items()}
+
+# Tags whose payload is text after the timestamp, all the others are doubles
+TEXT_TAGS = {STATE_CHANGE, MESSAGE, IMU_HEADER}
+
+_FRAME_HEADER = struct.Struct("<HB")
+_CRC = struct.Struct("<I")
+_TIMESTAMP = struct.Struct("<q")
+_DATA_POINT = struct.Struct("<qddd")
+_VALUE = struct.Struct("<qd")
+
+
+class FlightLogWriter:
+    """
+    Writes frames to a binary file. Nothing is flushed here, that is up to whoever owns the file.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        if file.tell() == 0:
+            file.write(MAGIC)
+
+    def _write_frame(self, tag: int, payload: bytes) -> None:
+        body = bytes((tag,)) + payload
+        self.file.write(_FRAME_HEADER.pack(len(body), tag) + payload + _CRC.pack(zlib.crc32(body)))
+
+    def write_data_point(self, timestamp: int, altitude: float, accel: float, velocity: float) -> None:
+        self._write_frame(DATA_POINT, _DATA_POINT.pack(timestamp, altitude, accel, velocity))
+
+    def write_value(self, tag: int, timestamp: int, value: float) -> None:
+        self._write_frame(tag, _VALUE.pack(timestamp, value))
+
+    def write_values(self, tag: int, timestamp: int, values: list[float]) -> None:
+        self._write_frame(tag, _TIMESTAMP.pack(timestamp) + struct.pack(f"<{len(values)}d", *values))
+
+    def write_text(self, tag: int, timestamp: int, text: str) -> None:
+        self._write_frame(tag, _TIMESTAMP.pack(timestamp) + text.encode("utf-8"))
+
+
+def read_flight_log(file_path: str, chunk_size: int = 1 << 16) -> Iterator[tuple[int, int, tuple | str]]:
+    """
+    Streams the frames of a binary log, stopping at the first incomplete or corrupted frame
+    :param file_path: the binary log
+    :param chunk_size: how many bytes to read from the file at a time
+    :return: (tag, timestamp, values) for every frame, where values is a tuple of floats or a string
+    """
+    with open(file_path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file_path} is not a binary flight log")
+
+        buffer = b""
+        position = 0
+        while True:
+            if len(buffer) - position < _FRAME_HEADER.size + _CRC.size:
+                chunk = file.read(chunk_size)
+                if not chunk and len(buffer) == position:
+                    return
+                buffer = buffer[position:] + chunk
+                position = 0
+                if not chunk and len(buffer) < _FRAME_HEADER.size + _CRC.size:
+                    return
+
+            length, tag = _FRAME_HEADER.unpack_from(buffer, position)
+            frame_end = position + 2 + length + _CRC.size
+            if frame_end > len(buffer):
+                chunk = file.read(max(chunk_size, frame_end - len(buffer)))
+                if not chunk:
+                    # Cut off in the middle of a frame
+                    return
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            body = buffer[position + 2 : frame_end - _CRC.size]
+            (crc,) = _CRC.unpack_from(buffer, frame_end - _CRC.size)
+            if length < 1 + _TIMESTAMP.size or zlib.crc32(body) != crc:
+                return
+            position = frame_end
+
+            (timestamp,) = _TIMESTAMP.unpack_from(body, 1)
+            payload = body[1 + _TIMESTAMP.size :]
+            if tag in TEXT_TAGS:
+                yield tag, timestamp, payload.decode("utf-8")
+            else:
+                yield tag, timestamp, struct.unpack(f"<{len(payload) // 8}d", payload)
+
+
+def format_frame(tag: int, timestamp: int, values: tuple | str) -> str:
+    """
+    Formats a frame the same way as a line of the CSV log
+    """
+    if tag == IMU_HEADER:
+        # The header row of an IMU log already starts with the timestamp column
+        return values
+    if tag in MESSAGE_FORMATS:
+        message = MESSAGE_FORMATS[tag] % ((values,) if isinstance(values, str) else values)
+    elif isinstance(values, str):
+        message = values
+    else:
+        message = ",".join(map(str, values))
+    return f"{timestamp},{message}"
+
+
+def export_csv(binary_path: str, csv_path: str) -> int:
+    """
+    Converts a binary log (airbrakes data or IMU channels) to the CSV log format
+    :return: the number of lines written
+    """
+    lines = 0
+    with open(csv_path, "w") as csv_file:
+        for tag, timestamp, values in read_flight_log(binary_path):
+            csv_file.write(format_frame(tag, timestamp, values) + "\n")
+            lines += 1
+    return lines
+
+
+class BinaryLogHandler(logging.Handler):
+    """
+    Logging handler that writes the airbrakes_data log in the binary format. The known messages
+    (see MESSAGE_FORMATS) are packed straight from the record arguments, anything else is stored as text.
+    Like main.CSVFormatter, the timestamp is the one saved by main.AirbrakesQueueHandler, or otherwise
+    comes from the airbrakes object injected in main.
+    """
+
+    airbrakes = None
+
+    def __init__(self, filename: str, flush_interval: float = 0.5):
+        """
+        :param filename: the binary log to write
+        :param flush_interval: seconds between flushing the file
+        """
+        super().__init__()
+        self.file = open(filename, "wb")
+        self.writer = FlightLogWriter(self.file)
+        self.flush_interval = flush_interval
+        self.last_flush_time = time.monotonic()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if hasattr(record, "last_time"):
+            timestamp = record.last_time
+        elif self.airbrakes is not None:
+            timestamp = self.airbrakes.interface.last_time
+        else:
+            timestamp = None
+        if timestamp is None:
+            return
+        try:
+            tag = MESSAGE_TAGS.get(record.msg) if isinstance(record.msg, str) else None
+            if tag == DATA_POINT:
+                self.writer.write_data_point(timestamp, *record.args)
+            elif tag in TEXT_TAGS:
+                self.writer.write_text(tag, timestamp, str(record.args[0]))
+            elif tag is not None:
+                self.writer.write_value(tag, timestamp, float(record.args[0]))
+            else:
+                self.writer.write_text(MESSAGE, timestamp, record.getMessage())
+
+            now = time.monotonic()
+            if now - self.last_flush_time >= self.flush_interval:
+                self.file.flush()
+                self.last_flush_time = now
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        super().close()
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 from io import TextIOWrapper
 import threading
+import time
 from collections import deque
-from ..data import ABDataPoint
+from ..data import ABDataPoint, DataPointPool
+from ..ring_buffer import SharedRingBuffer
+from ..log_writer import LogWriter
 import mscl
 
-from multiprocessing import Process, Pipe, Value
+from multiprocessing import Process, Value
 
 # TOOD (Before every launch): Make sure this value is correct
 UPSIDE_DOWN = True
@@ -18,22 +21,43 @@ class MSCLInterface:
     Parker-LORD 3DMCX5-AR.
     """
 
+    # Number of data points the control loop can fall behind before the oldest ones are dropped
+    BUFFER_CAPACITY = 4096
+    # How long pop_data_point sleeps between checks when there is no new data, in seconds
+    WAIT_INTERVAL = 0.0005
+    # How often the IMU logs are flushed to the SD card, in seconds
+    LOG_FLUSH_INTERVAL = 1.0
+
     def __init__(
-        self, port, raw_data_logfile: TextIOWrapper, est_data_logfile: TextIOWrapper
+        self, port, raw_data_logfile: TextIOWrapper, est_data_logfile: TextIOWrapper, binary_logs: bool = False
     ):
+        """
+        :param binary_logs: the log files are opened in binary mode and written in the flight_log format
+        """
         # creating data node
         self.connection = mscl.Connection.Serial(port)
         self.node = mscl.InertialNode(self.connection)
         self.raw_data_logfile = raw_data_logfile
         self.est_data_logfile = est_data_logfile
+        self.binary_logs = binary_logs
 
-        self.parent_pipe, self.child_pipe = Pipe()
+        # The IMU process writes the data points here and the control loop reads them, see ring_buffer.py
+        self.data_buffer = SharedRingBuffer(self.BUFFER_CAPACITY)
+        # The popped data points are reused instead of made new for every one, see data.py. One
+        # bigger than the buffer so a full batch never overwrites the data point before it.
+        self.data_point_pool = DataPointPool(self.BUFFER_CAPACITY + 1)
         self.running = Value("b", False)
 
+        # The latest values from the IMU, since a packet doesn't always have every channel
+        self.accel: float = 0.0
+        self.altitude: float = 0.0
+
         # rate in which we poll date  in miliseconds (1/(Hz)*1000)
         self.polling_rate = int(1 / (100) * 1000)
 
         self.last_time: int = 0
+        # When the packets being handled were received from the IMU
+        self.received_time: int = 0
 
     def stop_logging_loop(self):
         """Stops the logging loop."""
@@ -41,6 +65,9 @@ class MSCLInterface:
         self.logging_thread.join()
         self.raw_data_logfile.close()
         self.est_data_logfile.close()
+        if self.data_buffer.overruns:
+            print(f"Dropped {self.data_buffer.overruns} data points because the control loop fell behind")
+        self.data_buffer.close()
 
     def start_logging_loop_thread(self):
         """
@@ -60,12 +87,25 @@ class MSCLInterface:
         self.running.value = True
         counter = 0
 
+        # The files are written by background threads so that polling the IMU never waits on the SD card.
+        # They have to be made here, in the IMU process, since threads don't carry over to a new process.
+        self.raw_log_writer = LogWriter(
+            self.raw_data_logfile, flush_interval=self.LOG_FLUSH_INTERVAL, binary=self.binary_logs
+        )
+        self.est_log_writer = LogWriter(
+            self.est_data_logfile, flush_interval=self.LOG_FLUSH_INTERVAL, binary=self.binary_logs
+        )
+        self.raw_log_writer.start()
+        self.est_log_writer.start()
+
         have_raw = False
         have_est = False
         while self.running.value:
             # get all the data packets from the node with a timeout of the
             # polling rate in milliseconds
             packets: mscl.MipDataPackets = self.node.getDataPackets(self.polling_rate)
+            # For measuring how long it takes the control loop to act on the data, see timing.py
+            self.received_time = time.perf_counter_ns()
 
             packet: mscl.MipDataPacket
             for packet in packets:
@@ -74,14 +114,14 @@ class MSCLInterface:
                     data_point: mscl.MipDataPoint
                     for data_point in packet.data():
                         if data_point.channelName()[:3] != "est":
-                            self.print_headers(packet, self.raw_data_logfile)
+                            self.print_headers(packet, self.raw_log_writer)
                             have_raw = True
                         break
 
                 if not have_est:
                     for data_point in packet.data():
                         if data_point.channelName()[:3] == "est":
-                            self.print_headers(packet, self.est_data_logfile)
+                            self.print_headers(packet, self.est_log_writer)
                             have_est = True
                         break
 
@@ -92,30 +132,56 @@ class MSCLInterface:
                 # also write all other data to file
                 self._write_data_to_file(packet)
 
-    def print_headers(self, packet, logfile):
-        for data_point in packet.data():
-            logfile.write(str(data_point.channelName()) + ",")
-        logfile.write("\n")
-
-    def pop_data_point(self) -> ABDataPoint | None:
-        """Pops a data point off of the databuffer pipe"""
-        try:
-            # TODO: This should always return a data point with all felids filled
-            ret: ABDataPoint = self.parent_pipe.recv()
-            self.last_time = ret.timestamp
-            return ret
-        except IndexError:
-            return None
+        # The process exits without flushing open files, so make sure everything gets written
+        for name, log_writer in (("raw", self.raw_log_writer), ("est", self.est_log_writer)):
+            log_writer.stop()
+            print(
+                f"{name} IMU log: wrote {log_writer.written} rows, "
+                f"dropped {log_writer.dropped}, {log_writer.late} were late"
+            )
+
+    def print_headers(self, packet, log_writer: LogWriter):
+        # The first column is the packet timestamp in nanoseconds
+        log_writer.write_row(["timestamp"] + [data_point.channelName() for data_point in packet.data()])
+
+    def pop_data_point(self) -> ABDataPoint:
+        """Pops the oldest unread data point off of the data buffer, waiting for one if there are none"""
+        data_points = self.data_buffer.drain(1)
+        while len(data_points) == 0:
+            time.sleep(self.WAIT_INTERVAL)
+            data_points = self.data_buffer.drain(1)
+
+        data_point = self.data_point_pool.take(data_points)[0]
+        self.last_time = data_point.timestamp
+        return data_point
+
+    def pop_data_points(self, max_count: int = None, timeout: float = 0.0) -> list[ABDataPoint]:
+        """
+        Pops every unread data point off of the data buffer, oldest first
+        :param max_count: the most data points to pop at once, the rest are left for next time
+        :param timeout: how long to wait for a data point if there are none, in seconds
+        :return: the data points, which is empty if none came in before the timeout. The list is reused by
+            the next call, and the data points are only valid until the buffer has gone around once.
+        """
+        data_points = self.data_buffer.drain(max_count)
+        if len(data_points) == 0 and timeout > 0:
+            deadline = time.monotonic() + timeout
+            while len(data_points) == 0 and time.monotonic() < deadline:
+                time.sleep(self.WAIT_INTERVAL)
+                data_points = self.data_buffer.drain(max_count)
+
+        ret = self.data_point_pool.take(data_points)
+        if ret:
+            self.last_time = ret[-1].timestamp
+        return ret
 
     def _write_data_to_file(self, packet: mscl.MipDataPacket):
-        data_object: ABDataPoint = ABDataPoint(0.0, 0, 0.0)
-        # data_object.altitude = None
-
-        data_object.timestamp = packet.collectedTimestamp().nanoseconds()
+        timestamp = packet.collectedTimestamp().nanoseconds()
 
         isEst = packet.data()[0].channelName()[:3] == "est"
 
-        logfile = self.est_data_logfile if isEst else self.raw_data_logfile
+        log_writer = self.est_log_writer if isEst else self.raw_log_writer
+        row = [timestamp]
 
         # TODO: TEST THIS with the imu
         data_point: mscl.MipDataPoint
@@ -132,17 +198,18 @@ class MSCLInterface:
                 accel: float = data_point.as_float()
                 if UPSIDE_DOWN:
                     accel = -accel
-                data_object.accel = accel
+                self.accel = accel
                 contains_data = True
 
             elif channel == "estPressureAlt":
-                data_object.altitude = data_point.as_float()
+                self.altitude = data_point.as_float()
                 contains_data = True
 
-            # if the data object is not empty
-            if contains_data:
-                # send the processed data to the databuffer
-                self.child_pipe.send(data_object)
+            row.append(data_point.as_float())
+
+        # The row is formatted and written by the log writer's thread
+        log_writer.write_row(row)
 
-            logfile.write(str(data_point.as_float()) + ",")
-        logfile.write("\n")
+        # if the packet had any of the data we use, send the processed data to the databuffer
+        if contains_data:
+            self.data_buffer.push(self.accel, timestamp, self.altitude, 0.0, self.received_time)
@@ -0,0 +1,214 @@
+"""
+Launch detection from the rolling average of the acceleration, in constant time per data point.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import deque
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class RollingStatistics:
+    """
+    Mean and variance of the last `window` values, updated in constant time per value. Uses
+    Welford's method, adapted to a sliding window: the new value replaces the oldest one in the
+    mean and in the sum of squared differences from the mean. Unlike a running sum of squares, that
+    doesn't lose the variance to cancellation when the mean is large compared to the spread (9.8
+    m/s^2 of gravity with a little noise on it). Rounding errors would still slowly build up, so
+    both are recomputed from the window every RENORMALIZE_INTERVAL values.
+    """
+
+    RENORMALIZE_INTERVAL = 10000
+
+    def __init__(self, window: int, initial: float = None):
+        """
+        :param window: how many of the latest values to keep
+        :param initial: if given, the window starts out full of this value, otherwise it starts empty
+        """
+        if window < 1:
+            raise ValueError("The window needs at least one value")
+        self.window = window
+        if initial is None:
+            self.values = [0.0] * window
+            self.count = 0
+        else:
+            self.values = [float(initial)] * window
+            self.count = window
+        self.index = 0
+        self.mean = 0.0
+        # Sum of the squared differences of the values from the mean
+        self.squared_deviations = 0.0
+        self.renormalize()
+
+    @classmethod
+    def from_seconds(cls, window_seconds: float, sample_rate: float, initial: float = None) -> RollingStatistics:
+        """
+        :param window_seconds: length of the window in seconds
+        :param sample_rate: data points per second
+        """
+        return cls(max(1, round(window_seconds * sample_rate)), initial)
+
+    def add(self, value: float) -> None:
+        old_value = self.values[self.index]
+        self.values[self.index] = value
+        self.index += 1
+        if self.index == self.window:
+            self.index = 0
+
+        old_mean = self.mean
+        if self.count < self.window:
+            self.count += 1
+            self.mean += (value - old_mean) / self.count
+            self.squared_deviations += (value - old_mean) * (value - self.mean)
+        else:
+            self.mean += (value - old_value) / self.window
+            self.squared_deviations += (value - old_value) * (value - self.mean + old_value - old_mean)
+
+        self.added_since_renormalize += 1
+        if self.added_since_renormalize >= self.RENORMALIZE_INTERVAL:
+            self.renormalize()
+
+    def renormalize(self) -> None:
+        """
+        Recomputes the mean and the squared deviations from the values in the window
+        """
+        values = self.values if self.count == self.window else self.values[: self.count]
+        if values:
+            self.mean = math.fsum(values) / len(values)
+            self.squared_deviations = math.fsum((value - self.mean) ** 2 for value in values)
+        else:
+            self.mean = 0.0
+            self.squared_deviations = 0.0
+        self.added_since_renormalize = 0
+
+    @property
+    def full(self) -> bool:
+        return self.count == self.window
+
+    @property
+    def variance(self) -> float:
+        if self.count == 0:
+            return 0.0
+        # Can come out slightly negative from rounding when every value is the same
+        return max(self.squared_deviations / self.count, 0.0)
+
+    @property
+    def standard_deviation(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class LaunchDetector:
+    """
+    Detects launch when the magnitude of the rolling average acceleration reaches the threshold.
+
+    We have to use the absolute value of the acceleration because the actual acceleration will be
+    a large negative number if the IMU is upside down, so this works for both cases.
+    """
+
+    def __init__(
+        self,
+        window: int,
+        threshold: float,
+        median_window: int = 1,
+        confirmations: int = 1,
+    ):
+        """
+        :param window: number of data points in the rolling average
+        :param threshold: magnitude of the average acceleration that means launch, in m/s^2
+        :param median_window: if more than 1, each acceleration is replaced by the median of the last
+            this many, which throws out single spikes (e.g. from bumping the rocket on the pad)
+        :param confirmations: how many data points in a row have to be over the threshold
+        """
+        # Starts out full of zeros, so the average ramps up from 0 instead of jumping on the first data point
+        self.statistics = RollingStatistics(window, initial=0.0)
+        self.threshold = threshold
+        self.median_window = median_window
+        self.recent = deque(maxlen=median_window)
+        self.confirmations = confirmations
+        self.count_over_threshold = 0
+
+    @classmethod
+    def from_seconds(
+        cls, window_seconds: float, sample_rate: float, threshold: float, median_window: int = 1, confirmations: int = 1
+    ) -> LaunchDetector:
+        """
+        :param window_seconds: length of the rolling average in seconds
+        :param sample_rate: data points per second
+        """
+        return cls(max(1, round(window_seconds * sample_rate)), threshold, median_window, confirmations)
+
+    @property
+    def average_acceleration(self) -> float:
+        return self.statistics.mean
+
+    def update(self, acceleration: float) -> bool:
+        """
+        Adds an acceleration to the rolling average
+        :return: whether the rocket has launched
+        """
+        if self.median_window > 1:
+            self.recent.append(acceleration)
+            acceleration = sorted(self.recent)[len(self.recent) // 2]
+
+        self.statistics.add(acceleration)
+        if abs(self.statistics.mean) >= self.threshold:
+            self.count_over_threshold += 1
+        else:
+            self.count_over_threshold = 0
+        return self.count_over_threshold >= self.confirmations
+
+
+class LaunchDetectorArray:
+    """
+    LaunchDetector for many rockets at once, for Scripts/monte_carlo.py. Each update takes an array
+    with an acceleration per rocket, and every rocket is detected the same as if it had its own
+    LaunchDetector.
+    """
+
+    def __init__(self, detector: LaunchDetector, count: int):
+        """
+        :param detector: the detector to copy the settings of, e.g. StandbyState.make_launch_detector()
+        :param count: how many rockets
+        """
+        # Not imported at the top so that importing AirbrakeSystem doesn't load numpy
+        import numpy as np
+
+        self._np = np
+        self.window = detector.statistics.window
+        self.threshold = detector.threshold
+        self.median_window = detector.median_window
+        self.confirmations = detector.confirmations
+        # Column per data point in the window, which starts out full of zeros like LaunchDetector's
+        self.values = np.zeros((count, self.window))
+        self.total = np.zeros(count)
+        self.recent = np.zeros((count, self.median_window))
+        self.updates = 0
+        self.count_over_threshold = np.zeros(count, dtype=np.int64)
+
+    @property
+    def average_acceleration(self) -> np.ndarray:
+        return self.total / self.window
+
+    def update(self, accelerations: np.ndarray) -> np.ndarray:
+        """
+        Adds an acceleration per rocket to the rolling averages
+        :return: whether each rocket has launched
+        """
+        if self.median_window > 1:
+            self.recent[:, self.updates % self.median_window] = accelerations
+            # Same as sorted(recent)[len(recent) // 2], including before the median window is full
+            recent_count = min(self.updates + 1, self.median_window)
+            accelerations = self._np.sort(self.recent[:, :recent_count], axis=1)[:, recent_count // 2]
+
+        index = self.updates % self.window
+        self.total += accelerations - self.values[:, index]
+        self.values[:, index] = accelerations
+        self.updates += 1
+
+        over_threshold = abs(self.total / self.window) >= self.threshold
+        self.count_over_threshold = self._np.where(over_threshold, self.count_over_threshold + 1, 0)
+        return self.count_over_threshold >= self.confirmations
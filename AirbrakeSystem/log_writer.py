@@ -0,0 +1,132 @@
+"""
+Writes log rows to a file from a background thread, so that formatting and file I/O don't slow
+down whatever is producing the rows (e.g. the loop polling the IMU for packets).
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from io import TextIOWrapper
+
+from .flight_log import IMU_HEADER, IMU_ROW, FlightLogWriter
+
+
+class LogWriter:
+    """
+    Rows are put on a bounded queue and a thread writes them to the file in batches. If the
+    queue is full the row is dropped instead of waiting, and counted in `dropped`. Rows that
+    sit in the queue for more than `late_threshold` seconds before being written are counted
+    in `late`. The file is flushed to disk every `flush_interval` seconds and when stopped.
+
+    With `binary`, the file has to be opened in binary mode and the rows are written as
+    flight_log frames: a row of strings is the header, the other rows start with the timestamp.
+    """
+
+    def __init__(
+        self,
+        logfile: TextIOWrapper,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        late_threshold: float = 0.5,
+        binary: bool = False,
+    ):
+        """
+        :param logfile: the file to write to, which is closed when the writer is stopped
+        :param max_queue_size: the most rows that can be waiting to be written
+        :param batch_size: the most rows to write at once
+        :param flush_interval: seconds between flushing the file to disk
+        :param late_threshold: seconds a row can wait before it counts as late
+        :param binary: write the rows in the binary flight log format instead of CSV
+        """
+        self.logfile = logfile
+        self.queue = queue.Queue(max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.late_threshold = late_threshold
+        self.binary_writer = FlightLogWriter(logfile) if binary else None
+
+        self.written = 0
+        self.dropped = 0
+        self.late = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def write_row(self, values: list) -> bool:
+        """
+        Queues a row to be written as comma separated values. Never blocks.
+        :return: False if the row was dropped because the queue is full
+        """
+        try:
+            self.queue.put_nowait((time.monotonic(), values))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stop(self) -> None:
+        """
+        Writes everything that is still queued, then flushes and closes the file
+        """
+        # This one waits for space, the stop signal can't be dropped
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self) -> None:
+        last_flush_time = time.monotonic()
+        running = True
+        while running:
+            try:
+                rows = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                rows = []
+
+            while rows and rows[-1] is not None and len(rows) < self.batch_size:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if rows and rows[-1] is None:
+                rows.pop()
+                running = False
+
+            if rows:
+                self._write_rows(rows)
+
+            now = time.monotonic()
+            if not running or now - last_flush_time >= self.flush_interval:
+                self._flush()
+                last_flush_time = now
+
+        self.logfile.close()
+
+    def _write_rows(self, rows: list) -> None:
+        now = time.monotonic()
+        for queued_time, _ in rows:
+            if now - queued_time > self.late_threshold:
+                self.late += 1
+
+        if self.binary_writer is not None:
+            for _, values in rows:
+                if isinstance(values[0], str):
+                    self.binary_writer.write_text(IMU_HEADER, 0, ",".join(values))
+                else:
+                    self.binary_writer.write_values(IMU_ROW, values[0], values[1:])
+        else:
+            self.logfile.write("".join(",".join(map(str, values)) + ",\n" for _, values in rows))
+        self.written += len(rows)
+
+    def _flush(self) -> None:
+        self.logfile.flush()
+        try:
+            # Makes sure the data is actually on the SD card if we lose power
+            os.fsync(self.logfile.fileno())
+        except (OSError, ValueError):
+            pass
@@ -1,39 +1,131 @@
+from __future__ import annotations
+
+import bisect
 import csv
-import math
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import debug
+
+# The tables live next to this file, so they are found no matter which directory we are run from
+TABLE_DIRECTORY = os.path.dirname(__file__)
+PID_LOOKUP_TABLE_PATH = os.path.join(TABLE_DIRECTORY, "lookup_table.csv")
+BANG_BANG_LOOKUP_TABLE_PATH = os.path.join(TABLE_DIRECTORY, "bang_bang_lookup_table.csv")
+
+# The compiled tables are made from the CSVs by generate_lookup_table.py. Each one is a .npy file
+# that gets memory mapped, with a .json header next to it describing the axes and where it came from
+COMPILED_PID_LOOKUP_TABLE_PATH = os.path.join(TABLE_DIRECTORY, "lookup_table.npy")
+COMPILED_BANG_BANG_LOOKUP_TABLE_PATH = os.path.join(TABLE_DIRECTORY, "bang_bang_lookup_table.npy")
+# 2 added PID grids that aren't evenly spaced
+COMPILED_TABLE_VERSION = 2
 
 
-def load_sorted_pid_lookup_table() -> list:
+def load_sorted_pid_lookup_table(file_path: str = PID_LOOKUP_TABLE_PATH) -> list:
     """
     Loads the lookup table that was generated with generate_lookup_table.py.
     It is sorted by velocities in ascending order.
     :return: [[vel1, [[ext1, est_change_in_altitude1], [ext2, est_change_in_altitude2]...]], [vel2, ...]]
     """
     read_data = []
-    with open("AirbrakeSystem/lookup_table.csv", 'r', newline='') as csvfile:
+    with open(file_path, 'r', newline='') as csvfile:
         reader = csv.reader(csvfile)
         next(reader)  # Skip header row
         for row in reader:
             x_value = float(row[0])
-            y_values = eval(row[1])  # Use eval to convert string representation of list to list
+            # The list of extension entries is written as a python list, which is also valid JSON
+            y_values = json.loads(row[1])
             read_data.append([x_value, y_values])
         return read_data[::-1]
 
 
-def get_bordering_extension_entries(extension_entries: list, current_extension: float) -> list:
+def hash_file(file_path: str) -> str:
+    """
+    Gets the SHA-256 of a file, used to record which CSV a compiled table was made from
+    """
+    with open(file_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def get_compiled_header_path(compiled_path: str) -> str:
+    """
+    Gets the path of the .json header that goes with a compiled table
+    """
+    return os.path.splitext(compiled_path)[0] + ".json"
+
+
+def save_compiled_table(compiled_path: str, data: np.ndarray, header: dict, source_path: str = None) -> None:
+    """
+    Writes a compiled lookup table and its header
+    :param compiled_path: the .npy file to write the table values to
+    :param data: the table values
+    :param header: describes the table, e.g. its kind and axes
+    :param source_path: the CSV the table was made from, if any
+    """
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    header = {"version": COMPILED_TABLE_VERSION, "shape": list(data.shape), **header}
+    if source_path is not None:
+        # Stored relative to the compiled table so the header is the same on every computer
+        header["source"] = os.path.relpath(source_path, os.path.dirname(os.path.abspath(compiled_path)))
+        header["source_sha256"] = hash_file(source_path)
+
+    np.save(compiled_path, data)
+    with open(get_compiled_header_path(compiled_path), "w") as header_file:
+        json.dump(header, header_file, indent=4)
+
+
+def load_compiled_table(compiled_path: str, kind: str) -> tuple[np.ndarray, dict]:
+    """
+    Memory maps a compiled lookup table, so only the parts that get read are loaded
+    :param compiled_path: the .npy file of the table
+    :param kind: the kind of table that is expected, e.g. "pid" or "bang_bang"
+    :return: the table values and the header
+    """
+    with open(get_compiled_header_path(compiled_path), "r") as header_file:
+        header = json.load(header_file)
+    if header.get("version") != COMPILED_TABLE_VERSION or header.get("kind") != kind:
+        raise ValueError(f"{compiled_path} is not a version {COMPILED_TABLE_VERSION} {kind} table")
+
+    data = np.load(compiled_path, mmap_mode="r")
+    if list(data.shape) != header["shape"]:
+        raise ValueError(f"{compiled_path} does not match the shape in its header")
+    return data, header
+
+
+def is_compiled_table_current(compiled_path: str, source_path: str) -> bool:
+    """
+    Checks that a compiled table was made from its CSV as the CSV is now, so that a regenerated
+    CSV isn't hidden by an old compiled table
+    :return: False if the table isn't compiled or the CSV changed since, True otherwise (also if there is no CSV)
+    """
+    try:
+        with open(get_compiled_header_path(compiled_path), "r") as header_file:
+            header = json.load(header_file)
+    except (OSError, ValueError):
+        return False
+    if not os.path.exists(compiled_path):
+        return False
+    if not os.path.exists(source_path):
+        return True
+    return header.get("source_sha256") == hash_file(source_path)
+
+
+def _use_compiled_table(compiled_path: str, csv_path: str) -> bool:
     """
-    Gets the extension entries below and above the current extension
-    :param extension_entries: the upper or lower extension entries list
-    :param current_extension: the current extension of the airbrakes
-    :return: [lower_extension_entry, upper_extension_entry]
+    Whether to load a table from its compiled file instead of the CSV, saying so if the compiled one is out of date
     """
-    # To be safe, has default values for max extension
-    bordering_extension_entries = [extension_entries[-2], extension_entries[-1]]
-    for i in range(len(extension_entries)):
-        extension = extension_entries[i][0]
-        if current_extension < extension:
-            bordering_extension_entries = [extension_entries[i - 1], extension_entries[i]]
-            break
-    return bordering_extension_entries
+    if not os.path.exists(compiled_path):
+        return False
+    if is_compiled_table_current(compiled_path, csv_path):
+        return True
+    debug.info(
+        "%s doesn't match %s, loading the CSV instead (compile it with python -m Scripts.generate_lookup_table -c)",
+        compiled_path,
+        csv_path,
+    )
+    return False
 
 
 def linearly_interpolate(lower_x: float, lower_y: float, upper_x: float, upper_y: float, mid_x: float) -> float:
@@ -48,61 +140,194 @@ def linearly_interpolate(lower_x: float, lower_y: float, upper_x: float, upper_y
     return (mid_x - lower_x) * slope + lower_y
 
 
-def estimate_change_in_altitude(lookup_table: list, current_velocity: float, current_extension) -> float:
-    """
-    Estimates the change in altitude of the rocket based on its current 
-    velocity and current airbrake extension.
-    :param lookup_table: the lookup table to use for estimation
-    :param current_velocity: the current velocity in m/s
-    :param current_extension: the current airbrake extension from 0.0 to 1.0
-    :return: the estimated change in altitude
-    """
-    max_velocity = lookup_table[-1][0]
-    min_velocity = lookup_table[0][0]
-    # Clamps the velocity to be within the lookup table
-    current_velocity = max(min(current_velocity, max_velocity), min_velocity)
-    # Because the velocities in the table have a step of 1, we can index it like this
-    lower_velocity = math.floor(current_velocity)
-    upper_velocity = math.ceil(current_velocity)
-    lower_velocity_entry = lookup_table[lower_velocity - 1][1]
-    upper_velocity_entry = lookup_table[upper_velocity - 1][1]
-    # Gets the interpolated value between extension entries for the lower velocity
-    lower_lower_extension, lower_upper_extension = get_bordering_extension_entries(lower_velocity_entry, current_extension)
-    lower_interpolated_change_in_altitude = linearly_interpolate(
-        lower_lower_extension[0],
-        lower_lower_extension[1],
-        lower_upper_extension[0],
-        lower_upper_extension[1],
-        current_extension
-    )
-    # Gets the interpolated value between extension entries for the upper velocity
-    upper_lower_extension, upper_upper_extension = get_bordering_extension_entries(upper_velocity_entry, current_extension)
-    upper_interpolated_change_in_altitude = linearly_interpolate(
-        upper_lower_extension[0],
-        upper_lower_extension[1],
-        upper_upper_extension[0],
-        upper_upper_extension[1],
-        current_extension
-    )
-    # Gets the interpolated value between the upper and lower velocity
-    interpolated_change_in_altitude = linearly_interpolate(
-        lower_velocity,
-        lower_interpolated_change_in_altitude,
-        upper_velocity,
-        upper_interpolated_change_in_altitude,
-        current_velocity
-    )
-    return interpolated_change_in_altitude
+class ApogeeGrid:
+    """
+    The PID lookup table stored as a (velocity, extension) grid, so that estimating the change in
+    altitude is a bilinear interpolation instead of a walk through nested lists. The grid points
+    don't have to be evenly spaced, e.g. a table made with generate_lookup_table.py --adaptive has
+    more of them where the change in altitude curves. Finding the cell is a binary search on each
+    axis, which for tables this size costs about the same as working it out from the spacing.
+    """
+
+    def __init__(self, velocities, extensions, changes_in_altitude):
+        """
+        :param velocities: the velocities of the grid rows in ascending order
+        :param extensions: the airbrake extensions of the grid columns in ascending order
+        :param changes_in_altitude: 2D array of estimated changes in altitude, indexed [velocity, extension]
+        """
+        self.velocities = np.asarray(velocities, dtype=np.float64)
+        self.extensions = np.asarray(extensions, dtype=np.float64)
+        # Stays a view of the memory mapped file if it was loaded from one, see load
+        self.changes_in_altitude = np.ascontiguousarray(changes_in_altitude, dtype=np.float64)
+
+        if self.changes_in_altitude.shape != (len(self.velocities), len(self.extensions)):
+            raise ValueError("The grid values do not match the velocity and extension axes")
+        if len(self.velocities) < 2 or len(self.extensions) < 2:
+            raise ValueError("The grid needs at least two velocities and two extensions")
+        if np.any(np.diff(self.velocities) <= 0) or np.any(np.diff(self.extensions) <= 0):
+            raise ValueError("Grid axes must be strictly ascending")
+
+        self.max_velocity_index = len(self.velocities) - 1
+        self.max_extension_index = len(self.extensions) - 1
+
+        # Indexing a numpy array one element at a time is slow, so the single point lookup used every
+        # data point reads the axes from lists (they are small) and the grid through a memoryview,
+        # which is about as fast as a list but reads the memory map instead of copying the grid
+        self._velocities = self.velocities.tolist()
+        self._extensions = self.extensions.tolist()
+        self._values = memoryview(self.changes_in_altitude.reshape(-1))
+        self._row_length = len(self.extensions)
+
+    @classmethod
+    def from_lookup_table(cls, lookup_table: list) -> ApogeeGrid:
+        """
+        Makes a grid out of a lookup table loaded with load_sorted_pid_lookup_table
+        :param lookup_table: [[vel1, [[ext1, est_change_in_altitude1], ...]], [vel2, ...]]
+        """
+        velocities = [row[0] for row in lookup_table]
+        extensions = [entry[0] for entry in lookup_table[0][1]]
+        if any([entry[0] for entry in row[1]] != extensions for row in lookup_table):
+            raise ValueError("Every velocity in the lookup table needs the same extensions")
+        changes_in_altitude = [[entry[1] for entry in row[1]] for row in lookup_table]
+        return cls(velocities, extensions, changes_in_altitude)
 
+    @classmethod
+    def load(cls, compiled_path: str) -> ApogeeGrid:
+        """
+        Loads a grid that was compiled with save
+        """
+        data, header = load_compiled_table(compiled_path, "pid")
+        velocities = _read_axis(header["axes"]["velocity"])
+        extensions = _read_axis(header["axes"]["extension"])
+        return cls(velocities, extensions, data)
 
-def load_bang_bang_lookup_table() -> list:
+    def save(self, compiled_path: str, source_path: str = None) -> None:
+        """
+        Compiles the grid to a file that can be loaded without parsing a CSV
+        :param compiled_path: the .npy file to write
+        :param source_path: the CSV the grid was made from, if any
+        """
+        header = {
+            "kind": "pid",
+            "axes": {
+                "velocity": _describe_axis(self.velocities),
+                "extension": _describe_axis(self.extensions),
+            },
+        }
+        save_compiled_table(compiled_path, self.changes_in_altitude, header, source_path)
+
+    def estimate(self, current_velocity: float, current_extension: float) -> float:
+        """
+        Estimates the change in altitude of the rocket based on its current
+        velocity and current airbrake extension. Values outside the grid are clamped to its edges.
+        :param current_velocity: the current velocity in m/s
+        :param current_extension: the current airbrake extension from 0.0 to 1.0
+        :return: the estimated change in altitude
+        """
+        velocities = self._velocities
+        upper_index = bisect.bisect_right(velocities, current_velocity)
+        if upper_index == 0:
+            velocity_index, velocity_fraction = 0, 0.0
+        elif upper_index > self.max_velocity_index:
+            velocity_index, velocity_fraction = self.max_velocity_index - 1, 1.0
+        else:
+            velocity_index = upper_index - 1
+            lower_velocity = velocities[velocity_index]
+            velocity_fraction = (current_velocity - lower_velocity) / (velocities[upper_index] - lower_velocity)
+
+        extensions = self._extensions
+        upper_index = bisect.bisect_right(extensions, current_extension)
+        if upper_index == 0:
+            extension_index, extension_fraction = 0, 0.0
+        elif upper_index > self.max_extension_index:
+            extension_index, extension_fraction = self.max_extension_index - 1, 1.0
+        else:
+            extension_index = upper_index - 1
+            lower_extension = extensions[extension_index]
+            extension_fraction = (current_extension - lower_extension) / (extensions[upper_index] - lower_extension)
+
+        values = self._values
+        lower_index = velocity_index * self._row_length + extension_index
+        upper_index = lower_index + self._row_length
+        # Interpolates between the extensions for the lower and upper velocity, then between the velocities
+        lower = values[lower_index]
+        lower += (values[lower_index + 1] - lower) * extension_fraction
+        upper = values[upper_index]
+        upper += (values[upper_index + 1] - upper) * extension_fraction
+        return lower + (upper - lower) * velocity_fraction
+
+    def estimate_batch(self, velocities, extensions) -> np.ndarray:
+        """
+        Vectorized version of estimate, for evaluating many (velocity, extension) pairs at once,
+        e.g. when replaying a flight log. The inputs are broadcast against each other.
+        :param velocities: array of velocities in m/s
+        :param extensions: array of airbrake extensions from 0.0 to 1.0
+        :return: array of estimated changes in altitude
+        """
+        velocities, extensions = np.broadcast_arrays(
+            np.asarray(velocities, dtype=np.float64), np.asarray(extensions, dtype=np.float64)
+        )
+        velocity_index, velocity_fraction = _get_cell_positions(velocities, self.velocities)
+        extension_index, extension_fraction = _get_cell_positions(extensions, self.extensions)
+
+        grid = self.changes_in_altitude
+        lower = grid[velocity_index, extension_index]
+        lower += (grid[velocity_index, extension_index + 1] - lower) * extension_fraction
+        upper = grid[velocity_index + 1, extension_index]
+        upper += (grid[velocity_index + 1, extension_index + 1] - upper) * extension_fraction
+        return lower + (upper - lower) * velocity_fraction
+
+
+def _describe_axis(axis: np.ndarray) -> dict:
+    """
+    Describes a grid axis for the header of a compiled table, as its start and step if it's evenly
+    spaced so the header stays readable, and as a list of every value if it isn't
+    """
+    steps = np.diff(axis)
+    step = float(steps.mean())
+    if np.allclose(steps, step, rtol=1e-6, atol=1e-9):
+        return {"start": float(axis[0]), "step": step, "count": len(axis)}
+    return {"values": axis.tolist()}
+
+
+def _read_axis(description: dict) -> np.ndarray:
+    """
+    Gets the values of a grid axis from its description in the header, see _describe_axis
+    """
+    if "values" in description:
+        return np.asarray(description["values"], dtype=np.float64)
+    return description["start"] + description["step"] * np.arange(description["count"])
+
+
+def _get_cell_positions(values: np.ndarray, axis: np.ndarray) -> tuple:
+    """
+    Gets the index of the lower grid point and the fraction of the way to the upper grid point
+    for every value, clamping values outside the axis to its edges
+    """
+    values = np.clip(values, axis[0], axis[-1])
+    indices = np.clip(np.searchsorted(axis, values, side="right") - 1, 0, len(axis) - 2)
+    return indices, (values - axis[indices]) / (axis[indices + 1] - axis[indices])
+
+
+def load_apogee_grid(
+    compiled_path: str = COMPILED_PID_LOOKUP_TABLE_PATH, csv_path: str = PID_LOOKUP_TABLE_PATH
+) -> ApogeeGrid:
+    """
+    Loads the PID lookup table grid, using the compiled table if it's up to date with the CSV and the CSV otherwise
+    """
+    if _use_compiled_table(compiled_path, csv_path):
+        return ApogeeGrid.load(compiled_path)
+    return ApogeeGrid.from_lookup_table(load_sorted_pid_lookup_table(csv_path))
+
+
+def load_bang_bang_lookup_table(file_path: str = BANG_BANG_LOOKUP_TABLE_PATH) -> list:
     """
     Loads the lookup table that was generated with generate_lookup_table.py for a bang bang controller.
     It is sorted by velocities in ascending order.
     :return: [[vel1, change_in_alt1], [vel2, change_in_alt2]...]
     """
     read_data = []
-    with open("AirbrakeSystem/bang_bang_lookup_table.csv", 'r', newline='') as csvfile:
+    with open(file_path, 'r', newline='') as csvfile:
         reader = csv.reader(csvfile)
         next(reader)  # Skip header row
         for row in reader:
@@ -112,8 +337,101 @@ def load_bang_bang_lookup_table() -> list:
         return read_data[::-1]
 
 
-def get_bang_bang_change_in_altitude(lookup_table: list, current_velocity: float) -> float:
-    for i in range(len(lookup_table) - 1):
-        if lookup_table[i][0] < current_velocity < lookup_table[i + 1][0]:
-            return linearly_interpolate(lookup_table[i][0], lookup_table[i][1],
-                                        lookup_table[i + 1][0], lookup_table[i + 1][1], current_velocity)
+class BangBangTable:
+    """
+    The bang bang lookup table stored as arrays sorted by velocity. Lookups are a binary search,
+    so their cost barely depends on the resolution of the table, and velocities outside the table
+    are clamped to its first or last entry so that there is always an estimate.
+    """
+
+    def __init__(self, velocities, changes_in_altitude, sort: bool = True):
+        """
+        :param velocities: the velocities of the table entries
+        :param changes_in_altitude: the change in altitude to apogee for each velocity
+        :param sort: whether the entries still have to be sorted by velocity, which the compiled tables already are
+        """
+        velocities = np.ascontiguousarray(velocities, dtype=np.float64)
+        changes_in_altitude = np.ascontiguousarray(changes_in_altitude, dtype=np.float64)
+        if velocities.shape != changes_in_altitude.shape or len(velocities) == 0:
+            raise ValueError("The table needs the same, non-zero number of velocities and changes in altitude")
+
+        if sort:
+            # Sorts the entries and drops repeated velocities so the velocities are strictly increasing
+            velocities, unique_indices = np.unique(velocities, return_index=True)
+            changes_in_altitude = changes_in_altitude[unique_indices]
+        # Views of the memory mapped file if it was loaded from one, see load
+        self.velocities = velocities
+        self.changes_in_altitude = changes_in_altitude
+
+        # Memoryviews are about as fast as lists for looking up one value at a time, and unlike
+        # lists they read the memory map instead of copying the table
+        self._velocities = memoryview(self.velocities)
+        self._changes_in_altitude = memoryview(self.changes_in_altitude)
+        self._last_index = len(self.velocities) - 1
+
+    @classmethod
+    def from_lookup_table(cls, lookup_table: list) -> BangBangTable:
+        """
+        Makes a table out of a lookup table loaded with load_bang_bang_lookup_table
+        :param lookup_table: [[vel1, change_in_alt1], [vel2, change_in_alt2]...]
+        """
+        return cls([row[0] for row in lookup_table], [row[1] for row in lookup_table])
+
+    @classmethod
+    def load(cls, compiled_path: str) -> BangBangTable:
+        """
+        Loads a table that was compiled with save
+        """
+        data, _ = load_compiled_table(compiled_path, "bang_bang")
+        # save only writes tables that are already sorted
+        return cls(data[0], data[1], sort=False)
+
+    def save(self, compiled_path: str, source_path: str = None) -> None:
+        """
+        Compiles the table to a file that can be loaded without parsing a CSV
+        :param compiled_path: the .npy file to write
+        :param source_path: the CSV the table was made from, if any
+        """
+        header = {"kind": "bang_bang", "rows": ["velocity", "change_in_altitude"]}
+        save_compiled_table(
+            compiled_path, np.stack([self.velocities, self.changes_in_altitude]), header, source_path
+        )
+
+    def estimate(self, current_velocity: float) -> float:
+        """
+        Estimates the change in altitude to apogee if the airbrakes were fully deployed
+        :param current_velocity: the current velocity in m/s
+        :return: the estimated change in altitude
+        """
+        upper_index = bisect.bisect_right(self._velocities, current_velocity)
+        if upper_index == 0:
+            return self._changes_in_altitude[0]
+        if upper_index > self._last_index:
+            return self._changes_in_altitude[self._last_index]
+        return linearly_interpolate(
+            self._velocities[upper_index - 1],
+            self._changes_in_altitude[upper_index - 1],
+            self._velocities[upper_index],
+            self._changes_in_altitude[upper_index],
+            current_velocity,
+        )
+
+    def estimate_batch(self, velocities) -> np.ndarray:
+        """
+        Vectorized version of estimate, for evaluating many velocities at once
+        :param velocities: array of velocities in m/s
+        :return: array of estimated changes in altitude
+        """
+        # np.interp does a binary search for every value and clamps at the ends, same as estimate
+        return np.interp(velocities, self.velocities, self.changes_in_altitude)
+
+
+def load_bang_bang_table(
+    compiled_path: str = COMPILED_BANG_BANG_LOOKUP_TABLE_PATH, csv_path: str = BANG_BANG_LOOKUP_TABLE_PATH
+) -> BangBangTable:
+    """
+    Loads the bang bang lookup table, using the compiled table if it's up to date with the CSV and the CSV otherwise
+    """
+    if _use_compiled_table(compiled_path, csv_path):
+        return BangBangTable.load(compiled_path)
+    return BangBangTable.from_lookup_table(load_bang_bang_lookup_table(csv_path))
@@ -5,7 +5,8 @@ Simulates the IMU interface for the rocket using OpenRocket
 import os
 import sys
 import threading
-from queue import Queue
+import time
+from queue import Empty, Queue
 
 from AirbrakeSystem.data import ABDataPoint
 
@@ -52,7 +53,7 @@ class Airbrakes(orhelper.AbstractSimulationListener):
         altitude = status.getRocketPosition().z
         velocity = status.getRocketVelocity().z
 
-        data_point = ABDataPoint(self.acceleration, timestamp, altitude, velocity)
+        data_point = ABDataPoint(self.acceleration, timestamp, altitude, velocity, time.perf_counter_ns())
         # put in the queue
         # since the queue is size 1, this will block until the data point is popped
         self.queue.put(data_point)
@@ -110,6 +111,27 @@ class MockMSCLInterface:
         # print(dp)
         return dp
 
+    def pop_data_points(self, max_count: int = None, timeout: float = 0.0) -> list[ABDataPoint | str]:
+        """
+        Pops every data point the simulation has ready, oldest first. The list ends with "Done"
+        once the simulation is over.
+        :param max_count: the most data points to pop at once
+        :param timeout: how long to wait for a data point if there are none, in seconds
+        """
+        data_points = []
+        try:
+            data_points.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            while data_points[-1] != "Done" and (max_count is None or len(data_points) < max_count):
+                data_points.append(self.queue.get_nowait())
+        except Empty:
+            pass
+
+        for dp in reversed(data_points):
+            if dp != "Done":
+                self.last_time = dp.timestamp
+                break
+        return data_points
+
     def start_logging_loop_thread(self):
         pass
 
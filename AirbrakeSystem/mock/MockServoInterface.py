@@ -1,5 +1,7 @@
 import logging
 
+from AirbrakeSystem import debug
+
 logger = logging.getLogger("airbrakes_data")
 
 
@@ -12,9 +14,7 @@ class Servo:
         self.servo_min_duty = min_duty  # 3.5
         # maximum duty cycle for right stop (determined with trial and error)
         self.servo_max_duty = max_duty  # 11.5
-        print(
-            f"Set up servo with pin: {servo_pin}, minDuty: {min_duty}, maxDuty: {max_duty}"
-        )
+        debug.info("Set up servo with pin: %s, minDuty: %s, maxDuty: %s", servo_pin, min_duty, max_duty)
 
     def set_command(self, command):
         command = float(command)
@@ -0,0 +1,309 @@
+"""
+Simulates the IMU interface for the rocket with a simple 1D flight model written in python,
+as a fast alternative to OpenRocket that doesn't need a JVM.
+
+The rocket is a point mass flying straight up its launch angle, with a J420R thrust curve,
+mass that goes down as the propellant burns, drag from the body and the airbrakes, and the
+ISA troposphere for air density. The numbers come from the last simulation in
+Purple Nurple_Airbrakes.ork, and it gets within a few meters of the OpenRocket apogee.
+
+The model works on floats for a single flight, or on numpy arrays to fly many at once.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import time
+
+import numpy as np
+
+from AirbrakeSystem.data import ABDataPoint
+
+GRAVITY = 9.80665
+
+# International Standard Atmosphere, valid up to 11 km
+SEA_LEVEL_TEMPERATURE = 288.15  # K
+SEA_LEVEL_PRESSURE = 101325.0  # Pa
+TEMPERATURE_LAPSE_RATE = 0.0065  # K/m
+AIR_GAS_CONSTANT = 287.05287  # J/(kg K)
+PRESSURE_EXPONENT = GRAVITY / (AIR_GAS_CONSTANT * TEMPERATURE_LAPSE_RATE)
+
+# AeroTech J420R thrust curve, in seconds and newtons, sampled from the OpenRocket simulation
+# and scaled below to the rated total impulse of the motor
+THRUST_CURVE_TIMES = np.array(
+    [0.0, 0.02, 0.101, 0.211, 0.315, 0.418, 0.522, 0.623, 0.731, 0.837, 0.944, 1.046, 1.156, 1.266, 1.369,
+     1.475, 1.581, 1.695]
+)
+THRUST_CURVE_FORCES = np.array(
+    [0.0, 450.0, 559.945, 522.089, 531.521, 535.138, 531.8, 524.602, 511.006, 489.396, 456.343, 415.875,
+     372.253, 335.537, 300.851, 133.007, 6.53, 0.0]
+)
+TOTAL_IMPULSE = 650.0  # N s
+BURN_TIME = float(THRUST_CURVE_TIMES[-1])
+# The impulse delivered up to each point of the thrust curve, used for the propellant mass
+_IMPULSES = np.concatenate(
+    [[0.0], np.cumsum(np.diff(THRUST_CURVE_TIMES) * (THRUST_CURVE_FORCES[1:] + THRUST_CURVE_FORCES[:-1]) / 2)]
+)
+THRUST_CURVE_FORCES *= TOTAL_IMPULSE / _IMPULSES[-1]
+_IMPULSE_FRACTIONS = _IMPULSES / _IMPULSES[-1]
+
+
+def get_air_density(altitude):
+    """
+    Gets the air density in kg/m^3 at an altitude in meters above sea level
+    """
+    temperature = SEA_LEVEL_TEMPERATURE - TEMPERATURE_LAPSE_RATE * altitude
+    pressure = SEA_LEVEL_PRESSURE * (temperature / SEA_LEVEL_TEMPERATURE) ** PRESSURE_EXPONENT
+    return pressure / (AIR_GAS_CONSTANT * temperature)
+
+
+class RocketModel:
+    """
+    The physical parameters of the rocket. The dispersion parameters can be floats, or arrays
+    with one entry per flight when flying many flights at once.
+    """
+
+    WET_MASS = 4.6  # kg
+    DRY_MASS = 4.233  # kg
+    REFERENCE_AREA = 0.0081  # m^2, 4 inch body tube
+    DRAG_COEFFICIENT = 0.33
+    # Three plates, each MAX_HEIGHT tall and 0.0254 m wide, sticking out of the body tube
+    AIRBRAKE_AREA = 3 * 0.03 * 0.0254  # m^2
+    AIRBRAKE_DRAG_COEFFICIENT = 0.9
+    # The drogue comes out at apogee, there is no main chute since we only care about the way up
+    DROGUE_AREA = math.pi * (0.4572 / 2) ** 2  # m^2
+    DROGUE_DRAG_COEFFICIENT = 0.75
+
+    def __init__(
+        self,
+        impulse_scale=1.0,
+        drag_scale=1.0,
+        airbrake_drag_scale=1.0,
+        launch_angle=0.0,
+        wind_speed=0.0,
+        launch_altitude=0.0,
+    ):
+        """
+        :param impulse_scale: multiplies the thrust of the motor
+        :param drag_scale: multiplies the drag coefficient of the body
+        :param airbrake_drag_scale: multiplies the drag coefficient of the airbrakes
+        :param launch_angle: angle of the launch rail from vertical in radians
+        :param wind_speed: horizontal wind speed in m/s, which adds to the airspeed
+        :param launch_altitude: altitude of the launch site above sea level in meters
+        """
+        self.impulse_scale = impulse_scale
+        self.body_drag_area = self.DRAG_COEFFICIENT * self.REFERENCE_AREA * drag_scale
+        self.airbrake_drag_area = self.AIRBRAKE_DRAG_COEFFICIENT * self.AIRBRAKE_AREA * airbrake_drag_scale
+        self.drogue_drag_area = self.DROGUE_DRAG_COEFFICIENT * self.DROGUE_AREA
+        # The rocket flies straight along the rail, so only this much of the motion is vertical
+        self.vertical_fraction = np.cos(launch_angle) if isinstance(launch_angle, np.ndarray) else math.cos(launch_angle)
+        self.wind_speed = wind_speed
+        self.launch_altitude = launch_altitude
+
+    def get_thrust(self, time):
+        """
+        Gets the thrust of the motor in newtons, `time` seconds after ignition
+        """
+        return np.interp(time, THRUST_CURVE_TIMES, THRUST_CURVE_FORCES) * self.impulse_scale
+
+    def get_mass(self, time):
+        """
+        Gets the mass of the rocket in kg, `time` seconds after ignition
+        """
+        burned_fraction = np.interp(time, THRUST_CURVE_TIMES, _IMPULSE_FRACTIONS)
+        return self.WET_MASS - (self.WET_MASS - self.DRY_MASS) * burned_fraction
+
+    def get_acceleration(self, time, altitude, velocity, extension, drogue_deployed=False):
+        """
+        Gets the vertical acceleration of the rocket in m/s^2
+        :param time: seconds since ignition
+        :param altitude: altitude above the launch site in meters
+        :param velocity: vertical velocity in m/s
+        :param extension: airbrake extension from 0.0 to 1.0
+        :param drogue_deployed: whether the drogue parachute is out
+        """
+        path_velocity = velocity / self.vertical_fraction
+        drag_area = self.body_drag_area + self.airbrake_drag_area * extension
+        if isinstance(drogue_deployed, np.ndarray):
+            drag_area = np.where(drogue_deployed, drag_area + self.drogue_drag_area, drag_area)
+        elif drogue_deployed:
+            drag_area = drag_area + self.drogue_drag_area
+
+        # The drag acts against the motion along the rail, but grows with the wind as well
+        airspeed = (path_velocity * path_velocity + self.wind_speed * self.wind_speed) ** 0.5
+        drag = 0.5 * get_air_density(self.launch_altitude + altitude) * drag_area * airspeed * path_velocity
+
+        path_force = self.get_thrust(time) - drag
+        return path_force / self.get_mass(time) * self.vertical_fraction - GRAVITY
+
+
+class FlightSimulation:
+    """
+    Flies a single rocket, one time step at a time, reading the airbrake extension every step
+    """
+
+    def __init__(
+        self,
+        model: RocketModel = None,
+        time_step: float = 0.01,
+        pad_time: float = 1.0,
+        acceleration_noise: float = 0.0,
+        altitude_noise: float = 0.0,
+        seed: int = None,
+    ):
+        """
+        :param model: the rocket to fly, defaults to the nominal rocket
+        :param time_step: seconds between data points, 0.01 matches the IMU polling rate
+        :param pad_time: seconds to sit on the pad before ignition
+        :param acceleration_noise: standard deviation of the noise added to the measured acceleration
+        :param altitude_noise: standard deviation of the noise added to the measured altitude
+        :param seed: seed for the sensor noise
+        """
+        self.model = model if model is not None else RocketModel()
+        self.time_step = time_step
+        self.pad_time = pad_time
+        self.acceleration_noise = acceleration_noise
+        self.altitude_noise = altitude_noise
+        self.random = random.Random(seed)
+
+        self.time = 0.0
+        self.altitude = 0.0
+        self.velocity = 0.0
+        self.acceleration = 0.0
+        self.apogee = 0.0
+        self.drogue_deployed = False
+        self.landed = False
+
+    def step(self, extension: float) -> ABDataPoint | None:
+        """
+        Moves the simulation forward by one time step
+        :param extension: the airbrake extension from 0.0 to 1.0 during this step
+        :return: the data point the IMU would report, or None once the rocket has landed
+        """
+        if self.landed:
+            return None
+
+        self.time += self.time_step
+        flight_time = self.time - self.pad_time
+        if flight_time > 0.0:
+            acceleration = float(
+                self.model.get_acceleration(flight_time, self.altitude, self.velocity, extension, self.drogue_deployed)
+            )
+            # The rocket sits on the pad until the thrust is more than its weight
+            if self.altitude <= 0.0 and self.velocity <= 0.0 and acceleration < 0.0:
+                acceleration = 0.0
+                if flight_time > BURN_TIME:
+                    self.landed = True
+            # Semi-implicit Euler, which is stable and plenty accurate at IMU rates
+            self.velocity += acceleration * self.time_step
+            self.altitude += self.velocity * self.time_step
+            self.acceleration = acceleration
+
+            if self.altitude > self.apogee:
+                self.apogee = self.altitude
+            elif self.velocity < 0.0:
+                self.drogue_deployed = True
+
+            if self.altitude < 0.0:
+                self.altitude = 0.0
+                self.velocity = 0.0
+                self.landed = True
+
+        return ABDataPoint(
+            self.acceleration + self.random.gauss(0.0, self.acceleration_noise),
+            int(round(self.time * 1e9)),
+            self.altitude + self.random.gauss(0.0, self.altitude_noise),
+            self.velocity,
+        )
+
+    def run_to_apogee(self, extension: float = 0.0) -> float:
+        """
+        Flies with a fixed extension until the rocket starts coming down
+        :return: the apogee in meters
+        """
+        while not self.landed and not self.drogue_deployed:
+            self.step(extension)
+        return self.apogee
+
+
+class NativeDeploymentSimulator:
+    """
+    Same interface as Scripts.openrocket_simulator.OpenRocketSimulator, for lookup table generation
+    """
+
+    def __init__(self, time_step: float = 0.001):
+        self.time_step = time_step
+
+    def simulate(self, deploy_velocity: float, extension: float) -> float:
+        """
+        Simulates a flight where the airbrakes are deployed to `extension` at `deploy_velocity`
+        :return: the change in altitude from deployment to apogee
+        """
+        simulation = FlightSimulation(time_step=self.time_step, pad_time=0.0)
+        current_extension = 0.0
+        deploy_altitude = None
+        while not simulation.landed and not simulation.drogue_deployed:
+            simulation.step(current_extension)
+            burned_out = simulation.time > BURN_TIME
+            if deploy_altitude is None and burned_out and simulation.velocity <= deploy_velocity:
+                deploy_altitude = simulation.altitude
+                current_extension = extension
+        if deploy_altitude is None:
+            raise RuntimeError(f"The rocket never got to {deploy_velocity} m/s after burnout")
+        return simulation.apogee - deploy_altitude
+
+    def simulate_coast(self, sample_period: float = 0.01) -> tuple[list[float], list[float]]:
+        """
+        Simulates a flight with the airbrakes retracted, for the bang bang table and the fastest
+        velocity the airbrakes can be deployed at
+        :param sample_period: seconds between the recorded data points, 0.01 matches the IMU
+        :return: the altitudes and velocities from burnout until the rocket starts coming down
+        """
+        simulation = FlightSimulation(time_step=self.time_step, pad_time=0.0)
+        steps_per_sample = max(1, round(sample_period / self.time_step))
+        altitudes = []
+        velocities = []
+        step = 0
+        while not simulation.landed and not simulation.drogue_deployed:
+            simulation.step(0.0)
+            if simulation.time > BURN_TIME:
+                if step % steps_per_sample == 0:
+                    altitudes.append(simulation.altitude)
+                    velocities.append(simulation.velocity)
+                step += 1
+        return altitudes, velocities
+
+
+class NativeSimulationInterface:
+    """
+    Mock of the MSCL interface that flies a FlightSimulation as data points are popped,
+    using the current command of the servo as the airbrake extension
+    """
+
+    last_time: int = 0
+
+    def __init__(self, servo, simulation: FlightSimulation = None):
+        self.servo = servo
+        self.simulation = simulation if simulation is not None else FlightSimulation()
+
+    def pop_data_point(self) -> ABDataPoint | str:
+        data_point = self.simulation.step(self.servo.get_command())
+        if data_point is None:
+            return "Done"
+        data_point.received_time = time.perf_counter_ns()
+        self.last_time = data_point.timestamp
+        return data_point
+
+    def pop_data_points(self, max_count: int = None, timeout: float = 0.0) -> list[ABDataPoint | str]:
+        """
+        The simulation only moves forward when asked for data, so there is only ever one data point
+        ready, and the servo command is read before every step. The list is ["Done"] once the rocket has landed.
+        """
+        return [self.pop_data_point()]
+
+    def start_logging_loop_thread(self):
+        pass
+
+    def stop_logging_loop(self):
+        pass
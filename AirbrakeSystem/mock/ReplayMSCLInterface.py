@@ -0,0 +1,255 @@
+"""
+Replays the estimated data log of a flight (the _estLORDlog.csv or .ablog that MSCLInterface
+writes) in place of the IMU, so controller changes can be run against real flight data. The CSV
+logs from before MSCLInterface logged the timestamp of every row are replayed at a fixed rate.
+
+The log is parsed in chunks as it's replayed, the CSV logs through a memory map, so a long log
+never has to fit in memory as python objects. The data points come out at the speed they were
+recorded, a multiple of it, or as fast as the control loop takes them.
+
+The recorded rocket doesn't react to the airbrakes, so the servo commands only show what the
+controller would have done.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import time
+from typing import Iterator
+
+import numpy as np
+
+from AirbrakeSystem import debug
+from AirbrakeSystem.data import ABDataPoint, DataPointPool
+from AirbrakeSystem.flight_log import IMU_HEADER, IMU_ROW, MAGIC, read_flight_log
+from AirbrakeSystem.ring_buffer import DATA_POINT_DTYPE
+
+# The channels the airbrakes use, see MSCLInterface._write_data_to_file
+ACCEL_CHANNEL = "estLinearAccelX"
+ALTITUDE_CHANNEL = "estPressureAlt"
+TIMESTAMP_COLUMN = "timestamp"
+
+# The logs from before the timestamp column was added only have the channels, so their data points
+# are spaced out by the rate the IMU was polled at
+DEFAULT_SAMPLE_RATE = 100.0  # Hz
+
+
+def _find_columns(header: str, log_path: str) -> tuple[bool, int, int]:
+    """
+    :param header: the header row of an IMU log
+    :return: whether the first column is the timestamp, and the columns of the acceleration and the altitude
+    """
+    names = header.rstrip(",\r\n").split(",")
+    if ACCEL_CHANNEL not in names or ALTITUDE_CHANNEL not in names:
+        raise ValueError(f"{log_path} doesn't have {ACCEL_CHANNEL} and {ALTITUDE_CHANNEL}, is it the est log?")
+    return names[0] == TIMESTAMP_COLUMN, names.index(ACCEL_CHANNEL), names.index(ALTITUDE_CHANNEL)
+
+
+def read_csv_log(
+    log_path: str, chunk_size: int = 1 << 20, sample_rate: float = DEFAULT_SAMPLE_RATE
+) -> Iterator[tuple[list, list, list]]:
+    """
+    Streams the timestamps, accelerations and altitudes of a CSV IMU log in chunks
+    :param chunk_size: about how many bytes of the log to parse at a time
+    :param sample_rate: for logs without a timestamp column, how many rows were logged per second
+    :return: (timestamps, accelerations, altitudes) for every chunk
+    """
+    with open(log_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            header_end = log.find(b"\n")
+            if header_end < 0:
+                return
+            has_timestamp, accel_column, altitude_column = _find_columns(log[:header_end].decode("utf-8"), log_path)
+            last_column = max(accel_column, altitude_column)
+            sample_period = int(1e9 / sample_rate)
+            rows = 0
+
+            start = header_end + 1
+            while start < len(log):
+                # Chunks end on a full line
+                end = log.find(b"\n", min(start + chunk_size, len(log) - 1))
+                end = len(log) if end < 0 else end + 1
+                timestamps, accels, altitudes = [], [], []
+                for line in log[start:end].split(b"\n"):
+                    values = line.split(b",")
+                    # Skips blank lines and the last line if the log was cut off in the middle of it
+                    if len(values) <= last_column:
+                        continue
+                    try:
+                        timestamp = int(values[0]) if has_timestamp else (rows + len(timestamps)) * sample_period
+                        accel = float(values[accel_column])
+                        altitude = float(values[altitude_column])
+                    except ValueError:
+                        # Also a cut off line
+                        continue
+                    timestamps.append(timestamp)
+                    accels.append(accel)
+                    altitudes.append(altitude)
+                start = end
+                if timestamps:
+                    rows += len(timestamps)
+                    yield timestamps, accels, altitudes
+
+            if rows == 0 and log[header_end + 1 :].strip():
+                raise ValueError(f"None of the rows of {log_path} could be read")
+
+
+def read_binary_log(log_path: str, chunk_rows: int = 10000) -> Iterator[tuple[list, list, list]]:
+    """
+    Streams the timestamps, accelerations and altitudes of a binary IMU log (see flight_log.py) in chunks
+    :param chunk_rows: how many rows to put in each chunk
+    :return: (timestamps, accelerations, altitudes) for every chunk
+    """
+    accel_column = altitude_column = None
+    timestamps, accels, altitudes = [], [], []
+    for tag, timestamp, values in read_flight_log(log_path):
+        if tag == IMU_HEADER:
+            _, accel_column, altitude_column = _find_columns(values, log_path)
+        elif tag == IMU_ROW:
+            if accel_column is None:
+                raise ValueError(f"{log_path} has rows before its header")
+            # The values don't include the timestamp column
+            timestamps.append(timestamp)
+            accels.append(values[accel_column - 1])
+            altitudes.append(values[altitude_column - 1])
+            if len(timestamps) >= chunk_rows:
+                yield timestamps, accels, altitudes
+                timestamps, accels, altitudes = [], [], []
+    if timestamps:
+        yield timestamps, accels, altitudes
+
+
+def read_log(log_path: str, sample_rate: float = DEFAULT_SAMPLE_RATE) -> Iterator[np.ndarray]:
+    """
+    Streams the data points of an IMU log in either format
+    :param sample_rate: for CSV logs without a timestamp column, how many rows were logged per second
+    :return: structured arrays of ring_buffer.DATA_POINT_DTYPE
+    """
+    with open(log_path, "rb") as file:
+        binary = file.read(len(MAGIC)) == MAGIC
+    chunks = read_binary_log(log_path) if binary else read_csv_log(log_path, sample_rate=sample_rate)
+    for timestamps, accels, altitudes in chunks:
+        chunk = np.zeros(len(timestamps), dtype=DATA_POINT_DTYPE)
+        chunk["timestamp"] = timestamps
+        chunk["accel"] = accels
+        chunk["altitude"] = altitudes
+        yield chunk
+
+
+class ReplayMSCLInterface:
+    """
+    Mock of the MSCL interface that plays back a recorded IMU log
+    """
+
+    last_time: int = 0
+
+    # The most data points popped at once, which is also how many data points the pool holds
+    MAX_BATCH_SIZE = 4096
+
+    def __init__(
+        self,
+        servo,
+        log_path: str,
+        speed: float = 1.0,
+        upside_down: bool = True,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+    ):
+        """
+        :param servo: the servo the airbrakes control, which the replay doesn't use
+        :param log_path: the _estLORDlog.csv or .ablog of the flight
+        :param speed: how many times faster than it was recorded to replay, 0 for as fast as possible
+        :param upside_down: whether the IMU was upside down, like UPSIDE_DOWN in hardware/MSCLInterface.py
+        :param sample_rate: for CSV logs without a timestamp column (the ones from before it was
+            added), how many rows were logged per second
+        """
+        self.servo = servo
+        self.log_path = log_path
+        self.speed = speed
+        self.sign = -1.0 if upside_down else 1.0
+
+        self.chunks = read_log(log_path, sample_rate)
+        self.chunk = np.zeros(0, dtype=DATA_POINT_DTYPE)
+        self.index = 0
+        self.done = False
+        # Same as the real interface, see data.py
+        self.data_point_pool = DataPointPool(self.MAX_BATCH_SIZE + 1)
+
+        # The log time and the clock time of the first data point, set when it's popped
+        self.start_timestamp: int = None
+        self.start_clock: int = None
+        self.replayed = 0
+
+    def _next_chunk(self) -> bool:
+        """
+        :return: False if there is nothing left in the log
+        """
+        while self.index >= len(self.chunk):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return False
+            chunk["accel"] *= self.sign
+            self.chunk = chunk
+            self.index = 0
+        return True
+
+    def _due(self, timestamp: int) -> int:
+        """
+        :return: the perf_counter_ns when a data point should come in
+        """
+        return self.start_clock + int((timestamp - self.start_timestamp) / self.speed)
+
+    def pop_data_point(self) -> ABDataPoint | str:
+        data_points = self.pop_data_points(1, timeout=float("inf"))
+        return data_points[0]
+
+    def pop_data_points(self, max_count: int = None, timeout: float = 0.0) -> list[ABDataPoint | str]:
+        """
+        Pops the data points that are due by now, oldest first. As fast as possible, that's always
+        one data point, like a loop that keeps up with the IMU. The list ends with "Done" once the
+        whole log has been replayed.
+        :param max_count: the most data points to pop at once
+        :param timeout: how long to wait for a data point if there are none, in seconds
+        """
+        if self.done or not self._next_chunk():
+            self.done = True
+            return ["Done"]
+
+        max_count = self.MAX_BATCH_SIZE if max_count is None else min(max_count, self.MAX_BATCH_SIZE)
+        now = time.perf_counter_ns()
+        if self.start_clock is None:
+            self.start_timestamp = int(self.chunk["timestamp"][self.index])
+            self.start_clock = now
+
+        if self.speed <= 0:
+            count = 1
+        else:
+            # Waits for the next data point if none are due yet
+            due = self._due(int(self.chunk["timestamp"][self.index]))
+            if due > now:
+                if due - now > timeout * 1e9:
+                    time.sleep(timeout)
+                    return []
+                time.sleep((due - now) / 1e9)
+                now = time.perf_counter_ns()
+            # Everything recorded up to now, as long as it's in this chunk
+            latest_timestamp = self.start_timestamp + int((now - self.start_clock) * self.speed)
+            timestamps = self.chunk["timestamp"][self.index : self.index + max_count]
+            count = max(1, int(np.searchsorted(timestamps, latest_timestamp, side="right")))
+
+        records = self.chunk[self.index : self.index + count]
+        records["received_time"] = now
+        self.index += count
+        self.replayed += count
+
+        data_points = self.data_point_pool.take(records)
+        self.last_time = data_points[-1].timestamp
+        return data_points
+
+    def start_logging_loop_thread(self):
+        pass
+
+    def stop_logging_loop(self):
+        debug.info("Replayed %s data points from %s", self.replayed, self.log_path)
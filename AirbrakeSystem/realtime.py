@@ -0,0 +1,246 @@
+"""
+Real time "flight mode" for the control loop (main.py --realtime).
+
+- The control loop and the IMU process are pinned to their own CPU cores
+- Both ask for SCHED_FIFO priority, or failing that a lower nice value
+- All memory is locked in RAM with mlockall, so the loop never waits on a page fault
+- The garbage collector is off from liftoff until freefall, and everything from setup is frozen
+- The time between the IMU timestamps of the data points is tracked, so data points that the IMU
+  process was late on or lost show up
+
+None of this needs to work for the airbrakes to fly, and most of it needs root, so anything that
+isn't permitted or supported is skipped and reported instead of raising.
+
+On Linux the CPU affinity and the scheduling policy belong to a thread, not a process. Setting
+them for a pid (or 0) only changes that process's main thread, which is the control loop here and
+the loop polling the IMU in the IMU process. Threads started by it afterwards inherit them, but
+threads that are already running keep the defaults: the QueueListener that writes the logs in
+this process, and the LogWriter threads in the IMU process if they started before
+setup_acquisition. Those only write files, so it's fine (better, even) that they stay off the real
+time cores and priorities.
+"""
+
+from __future__ import annotations
+
+import gc
+import math
+import os
+import time
+
+from . import debug
+from .timing import LatencyHistogram, format_duration
+
+# From sys/mman.h
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+DEFAULT_PRIORITY = 50
+
+
+def get_available_cpus() -> list[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return []
+
+
+def set_cpu_affinity(cpu: int, pid: int = 0) -> str:
+    """
+    Pins the main thread of a process to one CPU core, see the top of this file for other threads
+    :param pid: the process, 0 for this one
+    :return: what happened, for the report
+    """
+    try:
+        os.sched_setaffinity(pid, {cpu})
+        return f"pinned to CPU {cpu}"
+    except AttributeError:
+        return "CPU affinity isn't supported here"
+    except OSError as error:
+        return f"couldn't pin to CPU {cpu}: {error.strerror}"
+
+
+def set_realtime_priority(priority: int = DEFAULT_PRIORITY, pid: int = 0) -> str:
+    """
+    Asks for SCHED_FIFO scheduling, and if that's not allowed, for the lowest nice value we can get.
+    Like set_cpu_affinity, it only applies to the main thread of the process.
+    :param pid: the process, 0 for this one
+    :return: what happened, for the report
+    """
+    try:
+        os.sched_setscheduler(pid, os.SCHED_FIFO, os.sched_param(priority))
+        return f"SCHED_FIFO priority {priority}"
+    except AttributeError:
+        fifo_error = "not supported"
+    except OSError as error:
+        fifo_error = error.strerror
+
+    try:
+        current = os.getpriority(os.PRIO_PROCESS, pid)
+    except (AttributeError, OSError):
+        return f"no SCHED_FIFO ({fifo_error}) and couldn't change the nice value"
+
+    # Unprivileged processes can't lower their nice value, so try the most negative first
+    for niceness in (-20, -10, -5):
+        if niceness >= current:
+            break
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, niceness)
+            return f"no SCHED_FIFO ({fifo_error}), nice {niceness}"
+        except OSError:
+            continue
+    return f"no SCHED_FIFO ({fifo_error}), staying at nice {current}"
+
+
+def lock_memory() -> str:
+    """
+    Locks all current and future memory of this process in RAM
+    :return: what happened, for the report
+    """
+    # Not imported at the top so that importing AirbrakeSystem doesn't pay for ctypes
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        mlockall = libc.mlockall
+    except (OSError, AttributeError):
+        return "mlockall isn't available here"
+
+    if mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        return f"couldn't lock memory: {os.strerror(ctypes.get_errno())}"
+    return "memory locked"
+
+
+class JitterMonitor:
+    """
+    Keeps track of how far the time between consecutive data points strays from the expected
+    period. It goes by the IMU timestamps, so a data point that was lost shows up as an interval
+    of two periods.
+    """
+
+    def __init__(self, expected_period: float):
+        """
+        :param expected_period: seconds between data points from the IMU
+        """
+        self.expected_period_ns = int(expected_period * 1e9)
+        self.deviation = LatencyHistogram("jitter")
+        self.last_time = None
+        # Welford's running mean and variance of the intervals
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max_interval = 0
+
+    def tick(self, timestamp: int = None) -> None:
+        """
+        Call for every data point, in order
+        :param timestamp: the timestamp of the data point in nanoseconds, perf_counter_ns if not given
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter_ns()
+        if self.last_time is not None:
+            interval = timestamp - self.last_time
+            self.deviation.record(abs(interval - self.expected_period_ns))
+            self.count += 1
+            delta = interval - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (interval - self.mean)
+            if interval > self.max_interval:
+                self.max_interval = interval
+        self.last_time = timestamp
+
+    def report(self) -> str:
+        if self.count == 0:
+            return "jitter: no data"
+        standard_deviation = math.sqrt(self.m2 / self.count)
+        return (
+            f"interval: mean {format_duration(self.mean)}, std {format_duration(standard_deviation)}, "
+            f"max {format_duration(self.max_interval)} (expected {format_duration(self.expected_period_ns)})\n"
+            + self.deviation.format_buckets()
+        )
+
+
+class FlightMode:
+    """
+    Sets up the control loop process for real time, as much as it's allowed to
+    """
+
+    def __init__(
+        self,
+        control_cpu: int = None,
+        acquisition_cpu: int = None,
+        priority: int = DEFAULT_PRIORITY,
+        lock: bool = True,
+        expected_period: float = 0.01,
+    ):
+        """
+        :param control_cpu: the core for the control loop, defaults to the last one
+        :param acquisition_cpu: the core for the IMU process, defaults to the one before the last
+        :param priority: SCHED_FIFO priority of the control loop, the IMU process gets one more
+        :param lock: whether to lock the memory in RAM
+        :param expected_period: seconds between data points from the IMU
+        """
+        cpus = get_available_cpus()
+        # Leaves the first cores for the OS and everything else
+        if control_cpu is None and len(cpus) >= 2:
+            control_cpu = cpus[-1]
+        if acquisition_cpu is None and len(cpus) >= 3:
+            acquisition_cpu = cpus[-2]
+        self.control_cpu = control_cpu
+        self.acquisition_cpu = acquisition_cpu
+        self.priority = priority
+        self.lock = lock
+
+        self.jitter = JitterMonitor(expected_period)
+        self.gc_disabled = False
+        self.report_lines: list[str] = []
+
+    def _report(self, line: str) -> None:
+        self.report_lines.append(line)
+        debug.info("Flight mode: %s", line)
+
+    def start(self) -> None:
+        """
+        Applies everything to this process. Call it after the lookup tables are loaded, since the
+        memory lock also pins everything allocated up to now.
+        """
+        if self.control_cpu is not None:
+            self._report("control loop " + set_cpu_affinity(self.control_cpu))
+        else:
+            self._report("control loop not pinned, there aren't enough CPU cores")
+        self._report("control loop " + set_realtime_priority(self.priority))
+        if self.lock:
+            self._report(lock_memory())
+
+        # Collecting now, on the pad, and freezing what's left means the collector never has to
+        # go through the lookup tables and everything else from setup again
+        gc.collect()
+        gc.freeze()
+
+    def setup_acquisition(self, pid: int) -> None:
+        """
+        Applies the CPU and priority to the IMU process
+        """
+        if self.acquisition_cpu is not None:
+            self._report("IMU process main thread " + set_cpu_affinity(self.acquisition_cpu, pid))
+        # Higher than the control loop, since it has to keep up with the IMU or lose data
+        self._report("IMU process main thread " + set_realtime_priority(self.priority + 1, pid))
+
+    def enter_flight(self) -> None:
+        """
+        Turns off the garbage collector for the flight
+        """
+        if not self.gc_disabled:
+            gc.disable()
+            self.gc_disabled = True
+
+    def exit_flight(self) -> None:
+        """
+        Turns the garbage collector back on once the airbrakes are done
+        """
+        if self.gc_disabled:
+            gc.enable()
+            self.gc_disabled = False
+
+    def report(self) -> str:
+        return "\n".join(self.report_lines + [self.jitter.report()])
@@ -0,0 +1,162 @@
+"""
+A fixed size ring buffer of data points in shared memory, for getting data from the IMU process
+to the control loop without pickling or a system call per data point.
+
+There must be exactly one process writing (the IMU process) and one reading (the control loop).
+The writer never waits: if the reader falls more than `capacity` data points behind, the oldest
+data points are overwritten and counted as overruns when the reader catches up.
+"""
+
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# The layout of one data point in the buffer, same fields as ABDataPoint
+DATA_POINT_DTYPE = np.dtype(
+    [
+        ("accel", np.float64),
+        ("timestamp", np.int64),
+        ("altitude", np.float64),
+        ("velocity", np.float64),
+        ("received_time", np.int64),
+    ]
+)
+
+# The counters live in their own cache line in front of the data points
+HEADER_SIZE = 64
+# Index of the number of data points ever written in the header
+WRITE_COUNT = 0
+
+
+class SharedRingBuffer:
+    """
+    Single producer, single consumer ring buffer of DATA_POINT_DTYPE records in shared memory.
+
+    The writer fills in a slot and only then bumps the write count, so everything below the write
+    count is complete. The write count is a single aligned 8 byte word, so it is never torn. The
+    reader keeps its own read count, and after copying checks the write count again to throw away
+    anything the writer lapped while it was copying.
+
+    Objects of this class can be pickled to send them to another process, and will attach to the
+    same shared memory there.
+    """
+
+    def __init__(self, capacity: int = 4096, name: str = None):
+        """
+        :param capacity: how many data points fit in the buffer before old ones get overwritten
+        :param name: the name of an existing buffer to attach to, or None to make a new one
+        """
+        self.capacity = capacity
+        self.owner = name is None
+        size = HEADER_SIZE + capacity * DATA_POINT_DTYPE.itemsize
+        self._shared_memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self._attach()
+
+        if self.owner:
+            self._counters[:] = 0
+
+    def _attach(self):
+        buffer = self._shared_memory.buf
+        self._counters = np.ndarray((HEADER_SIZE // 8,), dtype=np.uint64, buffer=buffer)
+        self._slots = np.ndarray((self.capacity,), dtype=DATA_POINT_DTYPE, buffer=buffer, offset=HEADER_SIZE)
+        # Only used by the reader
+        self.read_count = 0
+        self.overruns = 0
+
+    def __getstate__(self):
+        return {"name": self._shared_memory.name, "capacity": self.capacity}
+
+    def __setstate__(self, state):
+        self.capacity = state["capacity"]
+        self.owner = False
+        self._shared_memory = shared_memory.SharedMemory(name=state["name"])
+        self._attach()
+
+    @property
+    def name(self) -> str:
+        return self._shared_memory.name
+
+    @property
+    def write_count(self) -> int:
+        """
+        Number of data points ever written to the buffer
+        """
+        return int(self._counters[WRITE_COUNT])
+
+    def push(
+        self, accel: float, timestamp: int, altitude: float, velocity: float, received_time: int = 0
+    ) -> None:
+        """
+        Writes a data point to the buffer. Only call this from the writing process.
+        """
+        write_count = int(self._counters[WRITE_COUNT])
+        self._slots[write_count % self.capacity] = (accel, timestamp, altitude, velocity, received_time)
+        # Publishes the data point, the slot has to be fully written before this
+        self._counters[WRITE_COUNT] = write_count + 1
+
+    def pending(self) -> int:
+        """
+        Number of data points written since the last read, including ones that were overwritten
+        """
+        return self.write_count - self.read_count
+
+    def latest(self) -> np.void | None:
+        """
+        Gets a copy of the newest data point without marking anything as read
+        :return: the data point, or None if nothing has been written yet
+        """
+        while True:
+            write_count = self.write_count
+            if write_count == 0:
+                return None
+            latest = self._slots[(write_count - 1) % self.capacity].copy()
+            # The slot gets reused once the writer has gone all the way around the buffer, so make
+            # sure that didn't start while we were copying it
+            if self.write_count - write_count < self.capacity - 1:
+                return latest
+
+    def drain(self, max_count: int = None) -> np.ndarray:
+        """
+        Gets a copy of every data point written since the last read, oldest first, and marks them as read
+        :param max_count: the most data points to read at once, the rest are left for next time
+        :return: structured array of DATA_POINT_DTYPE, which is empty if there was nothing new
+        """
+        write_count = self.write_count
+        # Skips anything that was already overwritten
+        if write_count - self.read_count > self.capacity:
+            self.overruns += write_count - self.read_count - self.capacity
+            self.read_count = write_count - self.capacity
+
+        end_count = write_count if max_count is None else min(write_count, self.read_count + max_count)
+        if end_count == self.read_count:
+            return self._slots[:0].copy()
+
+        start = self.read_count % self.capacity
+        end = end_count % self.capacity
+        if start < end:
+            data_points = self._slots[start:end].copy()
+        else:
+            data_points = np.concatenate([self._slots[start:], self._slots[:end]])
+
+        # Throws away the data points that were overwritten while we were copying them. The writer
+        # could also be in the middle of writing over the slot after those.
+        lapped = self.write_count - self.capacity - self.read_count + 1
+        if lapped > 0:
+            lapped = min(lapped, len(data_points))
+            self.overruns += lapped
+            data_points = data_points[lapped:]
+
+        self.read_count = end_count
+        return data_points
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory, and frees it if this is the buffer that made it
+        """
+        # The numpy views have to go before the shared memory can be closed
+        del self._counters, self._slots
+        self._shared_memory.close()
+        if self.owner:
+            self._shared_memory.unlink()
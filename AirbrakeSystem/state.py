@@ -1,7 +1,6 @@
 from __future__ import annotations
 import logging
 from typing import TYPE_CHECKING
-from AirbrakeSystem.lookup_table_control import *
 import time
 
 if TYPE_CHECKING:
@@ -9,6 +8,8 @@ if TYPE_CHECKING:
 
 from .data import ABDataPoint
 from .control import PID
+from . import control_tables, debug
+from .launch_detector import LaunchDetector
 
 logger = logging.getLogger("airbrakes_data")
 
@@ -24,6 +25,34 @@ class AirbrakeState:
     def __init__(self, airbrakes: Airbrakes):
         self.airbrakes = airbrakes
 
+    def process_batch(self, data_points: list[ABDataPoint]):
+        """
+        Handles all the data points that came in since the last update. Most states only need
+        to act on the newest one, so a backlog of data doesn't hold up the servo.
+        """
+        self.airbrakes.interface.last_time = data_points[-1].timestamp
+        self.process(data_points[-1])
+
+    def process_each(self, data_points: list[ABDataPoint]):
+        """
+        Handles the data points one at a time, for states that have to see every one of them. The
+        time is moved to each data point as it's handled, so a state change partway through the
+        batch happens at the time of the data point that caused it, and the new state gets the
+        rest of the batch.
+        """
+        airbrakes = self.airbrakes
+        interface = airbrakes.interface
+        for index, data_point in enumerate(data_points):
+            interface.last_time = data_point.timestamp
+            self.process(data_point)
+            if airbrakes.state is not self:
+                if index + 1 < len(data_points):
+                    airbrakes.state.process_batch(data_points[index + 1 :])
+                return
+
+    def process(self, data_point: ABDataPoint):
+        pass
+
 
 class StandbyState(AirbrakeState):
     """
@@ -38,39 +67,30 @@ class StandbyState(AirbrakeState):
 
         airbrakes.servo.set_command(0)
 
-        # We create an array to store the last n accelerations
-        # in order to find the moving average.
-        # We store an index to replace a different value in the array
-        # every time, looping back at the end
-        self.index = 0
-        self.accelerations = [0.0] * StandbyState.AVERAGE_COUNT
+        self.launch_detector = StandbyState.make_launch_detector()
+
+        # Load the lookup tables now while we are waiting on the pad, instead of at import
+        # or when the control state starts
+        control_tables.warm_up(ControlState.apogee_estimator_name)
 
         super().__init__(airbrakes)
 
+    @staticmethod
+    def make_launch_detector() -> LaunchDetector:
+        """
+        Keeps the moving average of the last n accelerations, see launch_detector.py. Also used by
+        Scripts/monte_carlo.py so it detects launch the same way.
+        """
+        return LaunchDetector(StandbyState.AVERAGE_COUNT, StandbyState.ACCELERATION_REQUIREMENT)
+
+    def process_batch(self, data_points: list[ABDataPoint]):
+        # Launch detection needs every acceleration for the rolling average
+        self.process_each(data_points)
+
     def process(self, data_point: ABDataPoint):
-        # Get the acceleration
-        accel = data_point.accel
-
-        # Add it to the spot in the array, so that we can
-        # calculate the rolling average
-        self.accelerations[self.index] = accel
-        # Move the index to the next spot, wrapping around
-        self.index = (self.index + 1) % StandbyState.AVERAGE_COUNT
-
-        # print(self.accelerations)
-
-        average_acceleration = sum(self.accelerations) / StandbyState.AVERAGE_COUNT
-
-        # We have to use the absolute value of acceleration here because
-        # the actual acceleration will be a large negative number.
-        # If you were standing on the IMU, you would feel heavier when
-        # liftoff happens, so acceleration goes from -9.8 -> -15 (or some number).
-        # Really, it should be `average_acceleration <= StandbyState.ACCELERATION_REQUIREMENT`
-        # where the requirement is also negative, but this way works for both cases
-        if abs(average_acceleration) >= StandbyState.ACCELERATION_REQUIREMENT:
-            print("LIFTOFF")
-            print(f"Acceleration is {average_acceleration}")
-            print(f"Average acceleration is {self.accelerations}")
+        if self.launch_detector.update(data_point.accel):
+            debug.info("LIFTOFF")
+            debug.info("Average acceleration is %s", self.launch_detector.average_acceleration)
             self.airbrakes.to_state(LiftoffState)
 
 
@@ -80,9 +100,14 @@ class LiftoffState(AirbrakeState):
     """
 
     def __init__(self, airbrakes: Airbrakes):
+        # The time of the data point that liftoff was detected on, see process_each
         self.start_time = airbrakes.interface.last_time
         super().__init__(airbrakes)
 
+    def process_batch(self, data_points: list[ABDataPoint]):
+        # So control starts on the first data point after the burn, not at the end of its batch
+        self.process_each(data_points)
+
     def process(self, data_point: ABDataPoint):
         airbrakes = self.airbrakes
         current_time = data_point.timestamp
@@ -93,33 +118,17 @@ class LiftoffState(AirbrakeState):
             airbrakes.to_state(ControlState)
 
 
-LOOKUP_TABLE_PATH = "lookup_table.csv"
-
-# Ideally this wouldn't be called on open, but I don't want to block
-lookup_table = []
-with open(LOOKUP_TABLE_PATH, "r") as lookup_table_f:
-    for line in lookup_table_f.readlines()[1:]:
-        lookup_table.append([float(x) for x in line.strip().split(",")])
-
-
-def get_row(velocity):
-    error = 0.75
-    # return [
-    #     x * error for x in min(lookup_table, key=lambda x: abs(x[0] - velocity))[1:]
-    # ]
-    return 10 * [999.0]
-
-
 class ControlState(AirbrakeState):
     """Where we actually do the control loop"""
 
     alt_readings = [0.0] * 50
     idx = 0
     max_altitude = 0
-    change_in_altitude_lookup_table = load_sorted_pid_lookup_table()
-    bang_bang_lookup_table = load_bang_bang_lookup_table()
     target_apogee = 700.0
     last_altitude = 0
+    # What the predicted apogee comes from, "table" for the PID lookup table or "model" for the
+    # polynomial fitted to it (see apogee_model.py)
+    apogee_estimator_name = "table"
 
     airbrakes: Airbrakes
 
@@ -127,45 +136,40 @@ class ControlState(AirbrakeState):
     hard_coded_deploy_length = 0.5
 
     def __init__(self, airbrakes: Airbrakes):
-        print(f"deploy time: {airbrakes.interface.last_time / 1e9}")
         logger.info("Target Apogee,%s", ControlState.target_apogee)
         self.airbrakes = airbrakes
+        # These were already loaded by StandbyState, so this doesn't touch the disk
+        self.apogee_estimator = control_tables.get_apogee_estimator(ControlState.apogee_estimator_name)
+        self.bang_bang_table = control_tables.get_bang_bang_table()
 
         self.deploy_time: float = airbrakes.interface.last_time / 1.0e9
-        print(f"deploy time: {self.deploy_time}")
-        airbrakes.servo.set_degrees(airbrakes.SERVO_ON_ANGLE)
+        debug.info("deploy time: %s", self.deploy_time)
+        airbrakes.servo.set_command(1.0)
         super().__init__(airbrakes)
 
     def process(self, data_point: ABDataPoint):
         current_velocity = self.airbrakes.velocity
         current_extension = self.airbrakes.servo.get_command()
-        estimated_apogee = self.airbrakes.altitude + estimate_change_in_altitude(
-            self.change_in_altitude_lookup_table, current_velocity, current_extension
+        estimated_apogee = self.airbrakes.altitude + self.apogee_estimator.estimate(
+            current_velocity, current_extension
         )
 
         logger.info("Predicted Apogee,%.3f", estimated_apogee)
         logger.info("Servo Control,%.3f", current_extension)
 
-        estimated_change_in_altitude = get_bang_bang_change_in_altitude(
-            self.bang_bang_lookup_table, current_velocity
-        )
+        estimated_change_in_altitude = self.bang_bang_table.estimate(current_velocity)
 
-        if estimated_change_in_altitude is not None:
+        if estimated_change_in_altitude + self.airbrakes.altitude <= self.target_apogee:
+            # Deploys the airbrakes regardless for the first .5s
             if (
-                get_bang_bang_change_in_altitude(
-                    self.bang_bang_lookup_table, current_velocity
-                )
-                + self.airbrakes.altitude
-                <= self.target_apogee
+                self.airbrakes.interface.last_time / 1.0e9 - self.deploy_time
+                <= self.hard_coded_deploy_length
             ):
-                # Deploys the airbrakes regardless for the first .5s
-                if (self.airbrakes.interface.last_time / 1.0e9 - self.deploy_time
-            <= self.hard_coded_deploy_length ):
-                    self.airbrakes.servo.set_command(1.0)
-                else:
-                    self.airbrakes.servo.set_command(0.0)
-            else:
                 self.airbrakes.servo.set_command(1.0)
+            else:
+                self.airbrakes.servo.set_command(0.0)
+        else:
+            self.airbrakes.servo.set_command(1.0)
 
         # Deploys the airbrakes regardless for the first .5s
         #if (
@@ -182,14 +186,15 @@ class ControlState(AirbrakeState):
 
         # Checks if we are more than 30 meters below apogee
         if data_point.altitude <= self.max_altitude - 30:
-            print(f"apogee: {data_point.altitude} m")
+            debug.info("apogee: %s m", data_point.altitude)
             self.airbrakes.to_state(FreefallState)
 
 
 class FreefallState(AirbrakeState):
     def __init__(self, airbrakes: Airbrakes):
-        print(f"retract time: {airbrakes.interface.last_time / 1e9}")
+        debug.info("retract time: %s", airbrakes.interface.last_time / 1e9)
         airbrakes.servo.set_command(0)
+        super().__init__(airbrakes)
 
     def process(self, data_point: ABDataPoint):
         pass
@@ -0,0 +1,170 @@
+"""
+Latency instrumentation for the control loop.
+
+Durations are recorded in nanoseconds (from time.perf_counter_ns) into histograms with a bucket
+per power of two, which is just an integer bit_length and a list increment per sample, so it can
+stay on during a flight. perf_counter_ns is CLOCK_MONOTONIC on Linux, which is the same clock in
+every process, so the IMU process can stamp when it got a packet and the control loop can tell how
+old the data point is when it gets acted on.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+logger = logging.getLogger("airbrakes_timing")
+
+BUCKET_COUNT = 64
+
+
+def format_duration(nanoseconds: float) -> str:
+    if nanoseconds < 1e3:
+        return f"{nanoseconds:.0f}ns"
+    if nanoseconds < 1e6:
+        return f"{nanoseconds / 1e3:.1f}us"
+    if nanoseconds < 1e9:
+        return f"{nanoseconds / 1e6:.2f}ms"
+    return f"{nanoseconds / 1e9:.2f}s"
+
+
+class LatencyHistogram:
+    """
+    Histogram of durations where bucket i counts the durations d with 2^(i-1) <= d < 2^i ns
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, nanoseconds: int) -> None:
+        if nanoseconds < 0:
+            nanoseconds = 0
+        self.buckets[min(nanoseconds.bit_length(), BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def percentile(self, percent: float) -> int:
+        """
+        :return: the upper bound of the bucket the percentile falls in, in nanoseconds
+        """
+        if self.count == 0:
+            return 0
+        target = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return min(1 << index, self.max)
+        return self.max
+
+    def summary(self) -> str:
+        if self.count == 0:
+            return f"{self.name}: no samples"
+        return (
+            f"{self.name}: n={self.count} mean={format_duration(self.total / self.count)} "
+            f"p50<={format_duration(self.percentile(50))} p99<={format_duration(self.percentile(99))} "
+            f"p99.9<={format_duration(self.percentile(99.9))} max={format_duration(self.max)}"
+        )
+
+    def format_buckets(self) -> str:
+        lines = [self.summary()]
+        for index, bucket_count in enumerate(self.buckets):
+            if bucket_count:
+                lower = 0 if index == 0 else 1 << (index - 1)
+                lines.append(
+                    f"  {format_duration(lower):>8} - {format_duration(1 << index):>8}: {bucket_count}"
+                )
+        return "\n".join(lines)
+
+
+class LoopTimer:
+    """
+    The latency histograms of each stage of Airbrakes.update:
+    - dequeue: time spent in pop_data_points, including waiting for data
+    - estimate: velocity estimation and logging of the batch
+    - process: the state deciding what to do with the batch
+    - servo: a servo.set_command call
+    - update: from getting the batch to being done with it, not counting the dequeue
+    - sample age: from the IMU process getting a data point to the control loop popping it
+    - servo age: from the IMU process getting the newest data point to commanding the servo with it
+    """
+
+    def __init__(self, log_interval: float = 0.0):
+        """
+        :param log_interval: seconds between logging the summaries, 0 to only print them at shutdown
+        """
+        self.dequeue = LatencyHistogram("dequeue")
+        self.estimate = LatencyHistogram("estimate")
+        self.process = LatencyHistogram("process")
+        self.servo = LatencyHistogram("servo")
+        self.update = LatencyHistogram("update")
+        self.sample_age = LatencyHistogram("sample age")
+        self.servo_age = LatencyHistogram("servo age")
+
+        self.log_interval = log_interval
+        self.last_log_time = time.monotonic()
+        # When the IMU process got the newest data point being handled, 0 if unknown
+        self.newest_received_time = 0
+
+    @property
+    def histograms(self) -> list[LatencyHistogram]:
+        return [
+            self.dequeue,
+            self.estimate,
+            self.process,
+            self.servo,
+            self.update,
+            self.sample_age,
+            self.servo_age,
+        ]
+
+    def record_samples(self, received_times: list[int], dequeue_time: int) -> None:
+        """
+        Records the age of each data point in a batch when it got popped
+        :param received_times: perf_counter_ns of when the IMU process got each data point, 0 if unknown
+        :param dequeue_time: perf_counter_ns of when the batch got popped
+        """
+        for received_time in received_times:
+            if received_time:
+                self.sample_age.record(dequeue_time - received_time)
+        if received_times:
+            self.newest_received_time = received_times[-1]
+
+    def maybe_log(self) -> None:
+        if self.log_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self.last_log_time >= self.log_interval:
+            self.last_log_time = now
+            for histogram in self.histograms:
+                logger.info(histogram.summary())
+
+    def report(self) -> str:
+        return "\n".join(histogram.format_buckets() for histogram in self.histograms)
+
+
+class TimedServo:
+    """
+    Wraps a servo to record how long set_command takes, and how old the data it's acting on is
+    """
+
+    def __init__(self, servo, timer: LoopTimer):
+        self._servo = servo
+        self._timer = timer
+
+    def set_command(self, command):
+        start = time.perf_counter_ns()
+        self._servo.set_command(command)
+        end = time.perf_counter_ns()
+        self._timer.servo.record(end - start)
+        if self._timer.newest_received_time:
+            self._timer.servo_age.record(end - self._timer.newest_received_time)
+
+    def __getattr__(self, name):
+        return getattr(self._servo, name)
@@ -0,0 +1,35 @@
+"""
+Converts binary flight logs (main.py --log_format binary) to the CSV logs that plot_data.py reads.
+
+Run as `python -m Scripts.export_flight_log logs/2024-06-01_12-00-00.ablog`
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+from AirbrakeSystem.flight_log import export_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts binary flight logs to CSV")
+    parser.add_argument("logs", nargs="+", help="Binary logs to convert")
+    parser.add_argument(
+        "-o", "--output", default=None, help="CSV file to write, only when converting one log (default: next to the log)"
+    )
+    args = parser.parse_args()
+
+    if args.output is not None and len(args.logs) > 1:
+        parser.error("--output only works with a single log")
+
+    for log_path in args.logs:
+        # The airbrakes data log was .log as CSV, the IMU logs were .csv
+        default_extension = ".csv" if "LORDlog" in os.path.basename(log_path) else ".log"
+        csv_path = args.output or os.path.splitext(log_path)[0] + default_extension
+        lines = export_csv(log_path, csv_path)
+        print(f"Wrote {lines} lines to {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
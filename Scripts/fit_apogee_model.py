@@ -0,0 +1,145 @@
+"""
+Fits the apogee model (AirbrakeSystem/apogee_model.py) to the PID lookup table by least squares,
+prints how far it is from the table and saves it next to the table. If the model is more than
+MAX_RESIDUAL (apogee_model.py) off any cell of the table, it's not saved.
+
+Run as `python -m Scripts.fit_apogee_model`, or with e.g. `--velocity_degree 4` to try other
+polynomials. generate_lookup_table.py also refits it every time it compiles the tables.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+import numpy as np
+
+from AirbrakeSystem.apogee_model import APOGEE_MODEL_PATH, MAX_RESIDUAL, ApogeeModel
+from AirbrakeSystem.lookup_table_control import PID_LOOKUP_TABLE_PATH, ApogeeGrid, load_sorted_pid_lookup_table
+
+# Cubic in velocity and linear in extension fits the OpenRocket table about as closely as its noise
+DEFAULT_VELOCITY_DEGREE = 3
+DEFAULT_EXTENSION_DEGREE = 1
+# Width of the velocity bands in the residual report, in m/s
+REPORT_BAND_WIDTH = 25.0
+
+
+def fit_apogee_model(
+    grid: ApogeeGrid, velocity_degree: int = DEFAULT_VELOCITY_DEGREE, extension_degree: int = DEFAULT_EXTENSION_DEGREE
+) -> ApogeeModel:
+    """
+    Finds the polynomial coefficients that are closest to every cell of the grid
+    :param grid: the PID lookup table
+    :param velocity_degree: the highest power of velocity in the polynomial
+    :param extension_degree: the highest power of extension in the polynomial
+    """
+    if len(grid.velocities) <= velocity_degree or len(grid.extensions) <= extension_degree:
+        raise ValueError("The table needs more velocities and extensions than the degrees of the polynomial")
+
+    velocity_scale = 1.0 / grid.velocities[-1]
+    velocities, extensions = np.meshgrid(grid.velocities * velocity_scale, grid.extensions, indexing="ij")
+    # A column per term, ordered the same as the coefficients when they are flattened
+    terms = np.polynomial.polynomial.polyvander2d(velocities.ravel(), extensions.ravel(), [velocity_degree, extension_degree])
+    coefficients, *_ = np.linalg.lstsq(terms, grid.changes_in_altitude.ravel(), rcond=None)
+    return ApogeeModel(
+        coefficients.reshape(velocity_degree + 1, extension_degree + 1),
+        velocity_scale,
+        (grid.velocities[0], grid.velocities[-1]),
+        (grid.extensions[0], grid.extensions[-1]),
+    )
+
+
+def get_residuals(model: ApogeeModel, grid: ApogeeGrid) -> np.ndarray:
+    """
+    :return: the model minus the table for every cell, indexed [velocity, extension]
+    """
+    velocities, extensions = np.meshgrid(grid.velocities, grid.extensions, indexing="ij")
+    return model.estimate_batch(velocities, extensions) - grid.changes_in_altitude
+
+
+def summarize_residuals(residuals: np.ndarray) -> dict:
+    return {"rms": float(np.sqrt(np.mean(residuals**2))), "max": float(np.max(np.abs(residuals)))}
+
+
+def get_worst_cell(grid: ApogeeGrid, residuals: np.ndarray) -> tuple[float, float]:
+    """
+    :return: the velocity and extension where the model is furthest from the table
+    """
+    worst_velocity, worst_extension = np.unravel_index(np.argmax(np.abs(residuals)), residuals.shape)
+    return float(grid.velocities[worst_velocity]), float(grid.extensions[worst_extension])
+
+
+def print_report(model: ApogeeModel, grid: ApogeeGrid, residuals: np.ndarray) -> None:
+    print(
+        f"Fitted {model.coefficients.size} coefficients (velocity degree {model.velocity_degree}, "
+        f"extension degree {model.extension_degree}) to {residuals.size} cells"
+    )
+    print(f"{'velocity':<16}{'rms':>9}{'max':>9}")
+    band_starts = np.arange(grid.velocities[0] // REPORT_BAND_WIDTH, grid.velocities[-1] // REPORT_BAND_WIDTH + 1)
+    for band_start in band_starts * REPORT_BAND_WIDTH:
+        in_band = (grid.velocities >= band_start) & (grid.velocities < band_start + REPORT_BAND_WIDTH)
+        if in_band.any():
+            summary = summarize_residuals(residuals[in_band])
+            band = f"{band_start:.0f}-{band_start + REPORT_BAND_WIDTH:.0f} m/s"
+            print(f"{band:<16}{summary['rms']:>9.2f}{summary['max']:>9.2f}")
+    summary = summarize_residuals(residuals)
+    print(f"{'all':<16}{summary['rms']:>9.2f}{summary['max']:>9.2f}")
+    worst_velocity, worst_extension = get_worst_cell(grid, residuals)
+    print(
+        f"Furthest from the table at {worst_velocity:g} m/s and {worst_extension:g} extension, "
+        f"by {summary['max']:.2f} m"
+    )
+
+
+def fit_and_save(
+    csv_path: str = PID_LOOKUP_TABLE_PATH,
+    model_path: str = APOGEE_MODEL_PATH,
+    velocity_degree: int = DEFAULT_VELOCITY_DEGREE,
+    extension_degree: int = DEFAULT_EXTENSION_DEGREE,
+    max_residual: float = MAX_RESIDUAL,
+) -> ApogeeModel:
+    """
+    Fits the model to the lookup table CSV, prints the residuals and saves it
+    :param max_residual: how far in m the model may be from any cell of the table
+    :raises ValueError: if the model is further than that, in which case nothing is saved
+    """
+    grid = ApogeeGrid.from_lookup_table(load_sorted_pid_lookup_table(csv_path))
+    model = fit_apogee_model(grid, velocity_degree, extension_degree)
+    residuals = get_residuals(model, grid)
+    print_report(model, grid, residuals)
+
+    summary = summarize_residuals(residuals)
+    summary["worst_velocity"], summary["worst_extension"] = get_worst_cell(grid, residuals)
+    if summary["max"] > max_residual:
+        raise ValueError(
+            f"The model is up to {summary['max']:.1f} m off the table (at {summary['worst_velocity']:g} m/s), "
+            f"more than the {max_residual:g} m it's allowed to be, so it wasn't saved"
+        )
+    model.save(model_path, csv_path, summary)
+    print(f"Saved the model to {model_path}")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fits the apogee model to the PID lookup table")
+    parser.add_argument("--table", default=PID_LOOKUP_TABLE_PATH, help="The PID lookup table CSV")
+    parser.add_argument("-o", "--output", default=APOGEE_MODEL_PATH, help="The .npy file to save the model to")
+    parser.add_argument("--velocity_degree", type=int, default=DEFAULT_VELOCITY_DEGREE)
+    parser.add_argument("--extension_degree", type=int, default=DEFAULT_EXTENSION_DEGREE)
+    parser.add_argument(
+        "--max_residual",
+        type=float,
+        default=MAX_RESIDUAL,
+        help="Don't save the model if it's further than this from any cell of the table, in m",
+    )
+    args = parser.parse_args()
+
+    try:
+        fit_and_save(args.table, args.output, args.velocity_degree, args.extension_degree, args.max_residual)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,88 @@
-import concurrent.futures
+from __future__ import annotations
+
+import argparse
 import csv
-import sys
-import subprocess
 import os
 import time
 
+import numpy as np
+
+from AirbrakeSystem.apogee_model import APOGEE_MODEL_PATH
+from AirbrakeSystem.lookup_table_control import (
+    BANG_BANG_LOOKUP_TABLE_PATH,
+    COMPILED_BANG_BANG_LOOKUP_TABLE_PATH,
+    COMPILED_PID_LOOKUP_TABLE_PATH,
+    PID_LOOKUP_TABLE_PATH,
+    TABLE_DIRECTORY,
+    ApogeeGrid,
+    BangBangTable,
+    get_compiled_header_path,
+    load_bang_bang_lookup_table,
+    load_sorted_pid_lookup_table,
+)
+from Scripts.fit_apogee_model import fit_and_save
+from Scripts.log_catalog import LogCatalog
+from Scripts.lookup_table_engine import DEFAULT_CHECKPOINT_PATH, simulate_cells, simulate_coast
+
 
 VELOCITY_STEP = 1  # Keep this at 1 for quick look up table indexing
 FILEPATH = "AirbrakeSystem/lookup_table.csv"
 # This will only be used for when we do apogee estimation for PID control
 EXTENSIONS = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+# The coarse grid that --adaptive starts from, and how fine it can get. The default smallest steps
+# keep it from ever simulating more cells than the evenly spaced table.
+COARSE_VELOCITY_STEP = 16
+COARSE_EXTENSIONS = [0.0, 0.5, 1.0]
+MIN_VELOCITY_STEP = 1.0
+MIN_EXTENSION_STEP = 0.125
+# How far off (in meters) linear interpolation can be before --adaptive adds grid points. It should
+# be more than the noise of the simulator, or it refines everything down to the smallest steps.
+# With the native simulator, 0.25 is about as accurate as the evenly spaced table with 40% of the simulations.
+DEFAULT_TOLERANCE = 0.25
 
 
-def get_log_lines(file_path: str = "logs/lookup_table_logs/vel0.0ext0.0.log") -> list[str]:
-    with open(file_path, "r") as file:
-        return file.readlines()
-
-
-def get_control_state_index(lines: list[str]) -> int:
-    for i in range(len(lines)):
-        parts = lines[i].strip().split(",")
-        if parts[2] == "ControlState":
-            return i
-
-
-def get_change_in_altitude(lines: list[str], current_velocity: float) -> float:
-    last_altitude = 0
-    deploy_altitude = None
-    for i in range(0, len(lines)):
-        parts = lines[i].strip().split(",")
-        if parts[1] != "Data point":
-            continue
-        current_altitude = float(parts[2])
-        if deploy_altitude is None and float(parts[4]) <= current_velocity:
-            deploy_altitude = current_altitude
-        # Checks for reaching apogee
-        if current_altitude <= last_altitude:
-            print("apogee " + str(current_altitude))
-            return current_altitude - deploy_altitude
-        last_altitude = current_altitude
-
-
-def launch_sim(deploy_velocity: float = 0, extension_percent: float = 0) -> None:
-    file_path = "main.py"
-    # Arguments to pass to the Python script
-    script_args = ["-si", "-v", str(deploy_velocity), "-e", str(extension_percent)]
-    venv_dir = ".venv"
-    # Activate the virtual environment
-    venv_activate = os.path.join(venv_dir, "Scripts", "activate") if sys.platform == "win32" else os.path.join(venv_dir, "bin", "activate")
-    try:
-        # Run the activate command
-        activate_cmd = f"call {venv_activate}" if sys.platform == "win32" else f"source {venv_activate}"
-        subprocess.run(activate_cmd, shell=True, check=True)
-        # Run the Python script externally with arguments and capture its output
-        process = subprocess.Popen([sys.executable, file_path] + script_args, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE, text=True)
-
-        # Use .communicate() instead of .wait() as it will cause a deadlock
-        process.communicate()
-
-        # Check if the process exited successfully
-        if process.returncode == 0:
-            print(f"Simulation with a velocity {deploy_velocity} and an extension {extension_percent} ran successfully.")
-        else:
-            print("Simulation failed.")
-    except FileNotFoundError:
-        print("File not found or command not found.")
-    except OSError as e:
-        print(f"Error starting the process: {e}")
+def get_table_path(directory: str, path: str) -> str:
+    """
+    Gets where one of the lookup table files goes when they are written to another directory
+    :param path: where it goes in the repo, e.g. PID_LOOKUP_TABLE_PATH
+    """
+    return os.path.join(directory, os.path.basename(path))
+
+
+def load_control_data_points(file_path: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :return: the altitudes and velocities of the data points in the control state of a simulation log
+    """
+    # Loaded from the cache if the log hasn't changed since the last run, see log_catalog.py
+    df, state_changes, _ = LogCatalog().load(file_path)
+    control_start = next(timestamp for timestamp, name in state_changes if name == "Control")
+    # The data point with the same timestamp as the state change was logged before it
+    data_points = df.loc[df.index > control_start, ["altitude", "velocity"]].dropna()
+    return data_points["altitude"].to_numpy(), data_points["velocity"].to_numpy()
+
+
+def get_changes_in_altitude(altitudes: np.ndarray, velocities: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds how much altitude the rocket gains from every velocity on its way up to apogee, all in one go
+    :param altitudes: of the data points from the start of control
+    :param velocities: of the same data points
+    :return: the velocities while the rocket is still going up, and the change in altitude from
+        the first data point at or below each of them to apogee
+    """
+    # Apogee is the first data point that isn't higher than the one before
+    not_higher = np.flatnonzero(altitudes[1:] <= altitudes[:-1])
+    apogee_index = not_higher[0] + 1 if len(not_higher) else len(altitudes) - 1
+
+    # Every velocity until the first one that isn't positive
+    not_positive = np.flatnonzero(velocities <= 0)
+    deploy_velocities = velocities[: not_positive[0] if len(not_positive) else len(velocities)]
+
+    # The lowest velocity so far only goes down, so the first data point at or below a velocity
+    # is where it drops to that velocity
+    lowest_velocities = np.minimum.accumulate(velocities[: apogee_index + 1])
+    deploy_indices = np.searchsorted(-lowest_velocities, -deploy_velocities, side="left")
+    deploy_indices = np.minimum(deploy_indices, apogee_index)
+    return deploy_velocities, altitudes[apogee_index] - altitudes[deploy_indices]
 
 
 def write_lookup_table_to_csv(file_path: str, lookup_table: list):
@@ -79,76 +94,266 @@ def write_lookup_table_to_csv(file_path: str, lookup_table: list):
             writer.writerow([x_value, y_values])
 
 
-def generate_pid_lookup_table(max_velocity: float, control_state_index: int):
-    # Makes the skeleton lookup table
+def generate_pid_lookup_table(
+    max_velocity: float,
+    simulator_name: str = "openrocket",
+    workers: int | None = None,
+    checkpoint_path: str | None = DEFAULT_CHECKPOINT_PATH,
+    file_path: str = PID_LOOKUP_TABLE_PATH,
+):
+    velocities = [float(velocity) for velocity in range(int(max_velocity), 0, -VELOCITY_STEP)]
+    cells = [(velocity, extension) for velocity in velocities for extension in EXTENSIONS]
+
+    # Every simulation runs in a worker process, see lookup_table_engine.py
+    results = simulate_cells(cells, simulator_name, workers, checkpoint_path)
+
     lookup_table = [
-        [float(velocity), [[extension, 0.0] for extension in EXTENSIONS]]
-        for velocity in range(int(max_velocity), 0, -VELOCITY_STEP)
+        [velocity, [[extension, results[(velocity, extension)]] for extension in EXTENSIONS]]
+        for velocity in velocities
     ]
+    write_lookup_table_to_csv(file_path, lookup_table)
 
-    # Create a thread pool
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit tasks to the thread pool
-        futures = []
-        for i in range(len(lookup_table)):
-            velocity = lookup_table[i][0]
-            for j in range(len(lookup_table[i][1])):
-                extension = lookup_table[i][1][j][0]
-                future = executor.submit(launch_sim, velocity, extension)
-                futures.append(future)
-
-    # Wait for all tasks to complete
-    concurrent.futures.wait(futures)
-
-    # Fills up the lookup table
-    for i in range(len(lookup_table)):
-        velocity = lookup_table[i][0]
-        for j in range(len(lookup_table[i][1])):
-            extension = lookup_table[i][1][j][0]
-            lines = get_log_lines(f"logs/lookup_table_logs/vel{velocity}ext{extension}.log")
-            # Only gets the lines after the control state
-            lines = lines[control_state_index + 1:]
-            change_in_altitude = get_change_in_altitude(lines, velocity)
-            lookup_table[i][1][j][1] = change_in_altitude
-
-    print(lookup_table)
-
-    write_lookup_table_to_csv("AirbrakeSystem/pid_lookup_table.csv", lookup_table)
-
-
-def generate_bang_bang_lookup_table(log_lines: list[str], control_state_index: int):
-    control_lines = log_lines[control_state_index + 1:]
-    lookup_table = []
-    for line in control_lines:
-        if line.split(",")[1] != "Data point":
-            continue
-        velocity = float(line.split(",")[4])
-        if velocity > 0:
-            lookup_table.append([velocity, get_change_in_altitude(control_lines, velocity)])
-        else:
+
+def _get_midpoint(interval: tuple[float, float]) -> float:
+    # Rounded so the grid points print nicely and match the checkpoint on the next run
+    return round((interval[0] + interval[1]) / 2, 6)
+
+
+def refine_pid_grid(
+    velocities: list[float],
+    extensions: list[float],
+    simulate,
+    tolerance: float = DEFAULT_TOLERANCE,
+    min_velocity_step: float = MIN_VELOCITY_STEP,
+    min_extension_step: float = MIN_EXTENSION_STEP,
+) -> tuple[list[float], list[float], dict]:
+    """
+    Refines a coarse grid by halving its intervals where linear interpolation is off. Every round
+    simulates the middle of each interval that is still being refined, and the difference between
+    that and the interpolation from the ends of the interval is its error. Only the intervals where
+    the error is over the tolerance get halved again, so the grid ends up with more points where
+    the change in altitude curves and fewer where it's close to a straight line.
+
+    The grid stays a full grid (every velocity has every extension), so a new extension is
+    simulated at every velocity and the other way around.
+    :param velocities: the velocities of the coarse grid
+    :param extensions: the extensions of the coarse grid
+    :param simulate: takes a list of (velocity, extension) cells and returns {cell: change_in_altitude}
+    :param tolerance: the most error in meters that an interval can have without being halved
+    :param min_velocity_step: velocity intervals aren't halved below this
+    :param min_extension_step: extension intervals aren't halved below this
+    :return: the velocities and extensions of the refined grid in ascending order, and the
+        change in altitude of every cell
+    """
+    velocities = sorted(set(velocities))
+    extensions = sorted(set(extensions))
+    results = dict(simulate([(velocity, extension) for velocity in velocities for extension in extensions]))
+
+    refining_velocities = list(zip(velocities, velocities[1:]))
+    refining_extensions = list(zip(extensions, extensions[1:]))
+    round_number = 0
+    while True:
+        refining_velocities = [
+            interval for interval in refining_velocities if (interval[1] - interval[0]) / 2 >= min_velocity_step
+        ]
+        refining_extensions = [
+            interval for interval in refining_extensions if (interval[1] - interval[0]) / 2 >= min_extension_step
+        ]
+        if not refining_velocities and not refining_extensions:
             break
+        round_number += 1
+        print(
+            f"Round {round_number}: refining {len(refining_velocities)} velocity and "
+            f"{len(refining_extensions)} extension intervals of a {len(velocities)}x{len(extensions)} grid"
+        )
 
-        print(lookup_table)
+        velocities = sorted(set(velocities) | {_get_midpoint(interval) for interval in refining_velocities})
+        extensions = sorted(set(extensions) | {_get_midpoint(interval) for interval in refining_extensions})
+        cells = [(velocity, extension) for velocity in velocities for extension in extensions]
+        results.update(simulate([cell for cell in cells if cell not in results]))
 
-        write_lookup_table_to_csv("AirbrakeSystem/bang_bang_lookup_table.csv", lookup_table)
+        # The biggest error along the whole row or column decides if an interval is halved again
+        next_velocities = []
+        for lower, upper in refining_velocities:
+            middle = _get_midpoint((lower, upper))
+            error = max(
+                abs(results[(middle, extension)] - (results[(lower, extension)] + results[(upper, extension)]) / 2)
+                for extension in extensions
+            )
+            if error > tolerance:
+                next_velocities += [(lower, middle), (middle, upper)]
+        next_extensions = []
+        for lower, upper in refining_extensions:
+            middle = _get_midpoint((lower, upper))
+            error = max(
+                abs(results[(velocity, middle)] - (results[(velocity, lower)] + results[(velocity, upper)]) / 2)
+                for velocity in velocities
+            )
+            if error > tolerance:
+                next_extensions += [(lower, middle), (middle, upper)]
+        refining_velocities, refining_extensions = next_velocities, next_extensions
 
+    grid = {
+        (velocity, extension): results[(velocity, extension)] for velocity in velocities for extension in extensions
+    }
+    return velocities, extensions, grid
 
-def main():
-    # Runs the sim once to get some starting values
-    launch_sim()
-    log_lines = get_log_lines()
-    control_state_index = get_control_state_index(log_lines)
-    max_velocity = float(log_lines[control_state_index + 1].split(",")[4])
 
-    # This took my computer about 30 minutes
-    # generate_pid_lookup_table(max_velocity, control_state_index)
+def generate_adaptive_pid_lookup_table(
+    max_velocity: float,
+    simulator_name: str = "openrocket",
+    workers: int | None = None,
+    checkpoint_path: str | None = DEFAULT_CHECKPOINT_PATH,
+    tolerance: float = DEFAULT_TOLERANCE,
+    file_path: str = PID_LOOKUP_TABLE_PATH,
+):
+    """
+    Same as generate_pid_lookup_table, but starts from a coarse grid and only adds velocities and
+    extensions where they are needed, see refine_pid_grid
+    """
+    velocities = [float(velocity) for velocity in range(int(max_velocity), 0, -COARSE_VELOCITY_STEP)]
+    if velocities[-1] != 1.0:
+        # Down to the same velocity as the evenly spaced table
+        velocities.append(1.0)
 
-    # This took my computer 5 seconds
-    generate_bang_bang_lookup_table(log_lines, control_state_index)
+    def simulate(cells):
+        results = simulate_cells(cells, simulator_name, workers, checkpoint_path)
+        return {cell: results[cell] for cell in cells}
+
+    velocities, extensions, results = refine_pid_grid(velocities, COARSE_EXTENSIONS, simulate, tolerance)
+
+    lookup_table = [
+        [velocity, [[extension, results[(velocity, extension)]] for extension in extensions]]
+        for velocity in reversed(velocities)
+    ]
+    write_lookup_table_to_csv(file_path, lookup_table)
+    print(
+        f"Wrote a {len(velocities)}x{len(extensions)} grid to {file_path}, "
+        f"the evenly spaced one is {int(max_velocity)}x{len(EXTENSIONS)}"
+    )
+
+
+def generate_bang_bang_lookup_table(
+    altitudes: np.ndarray, velocities: np.ndarray, file_path: str = BANG_BANG_LOOKUP_TABLE_PATH
+):
+    """
+    :param altitudes: of the data points from the start of control, see get_changes_in_altitude
+    :param velocities: of the same data points
+    """
+    velocities, changes_in_altitude = get_changes_in_altitude(altitudes, velocities)
+    lookup_table = [[velocity, change] for velocity, change in zip(velocities.tolist(), changes_in_altitude.tolist())]
+    write_lookup_table_to_csv(file_path, lookup_table)
+    print(f"Wrote {len(lookup_table)} rows to {file_path}")
+
+
+def compile_lookup_tables(directory: str = TABLE_DIRECTORY):
+    """
+    Compiles the lookup table CSVs into the memory mapped format that the airbrakes load at runtime
+    :param directory: where the CSVs are and the compiled tables go
+    """
+    pid_path = get_table_path(directory, PID_LOOKUP_TABLE_PATH)
+    compiled_pid_path = get_table_path(directory, COMPILED_PID_LOOKUP_TABLE_PATH)
+    apogee_grid = ApogeeGrid.from_lookup_table(load_sorted_pid_lookup_table(pid_path))
+    apogee_grid.save(compiled_pid_path, pid_path)
+    print(f"Compiled {pid_path} to {compiled_pid_path}")
+
+    bang_bang_path = get_table_path(directory, BANG_BANG_LOOKUP_TABLE_PATH)
+    compiled_bang_bang_path = get_table_path(directory, COMPILED_BANG_BANG_LOOKUP_TABLE_PATH)
+    bang_bang_table = BangBangTable.from_lookup_table(load_bang_bang_lookup_table(bang_bang_path))
+    bang_bang_table.save(compiled_bang_bang_path, bang_bang_path)
+    print(f"Compiled {bang_bang_path} to {compiled_bang_bang_path}")
+
+    # So the apogee model always matches the table, or there's none if it can't be fitted closely enough
+    model_path = get_table_path(directory, APOGEE_MODEL_PATH)
+    try:
+        fit_and_save(pid_path, model_path)
+    except ValueError as error:
+        print(error)
+        for path in (model_path, get_compiled_header_path(model_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main(args):
+    # One flight with the airbrakes retracted gives the bang bang table, and its velocity at
+    # burnout is the fastest the airbrakes can be deployed at
+    if args.log is None or (args.pid and args.max_velocity is None):
+        altitudes, velocities = (np.array(values) for values in simulate_coast(args.simulator))
+        max_velocity = float(velocities[0])
+    if args.max_velocity is not None:
+        max_velocity = args.max_velocity
+    if args.log is not None:
+        # Or the bang bang table comes from the control state of a recorded flight
+        altitudes, velocities = load_control_data_points(args.log)
+
+    if args.pid:
+        pid_path = get_table_path(args.output_directory, PID_LOOKUP_TABLE_PATH)
+        checkpoint_path = None if args.no_checkpoint else args.checkpoint
+        if checkpoint_path is not None and args.restart and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        if args.adaptive:
+            generate_adaptive_pid_lookup_table(
+                max_velocity, args.simulator, args.workers, checkpoint_path, args.tolerance, pid_path
+            )
+        else:
+            generate_pid_lookup_table(max_velocity, args.simulator, args.workers, checkpoint_path, pid_path)
+
+    generate_bang_bang_lookup_table(
+        altitudes, velocities, get_table_path(args.output_directory, BANG_BANG_LOOKUP_TABLE_PATH)
+    )
+
+    compile_lookup_tables(args.output_directory)
+
+
+parser = argparse.ArgumentParser(description="Generates the lookup tables used for airbrake control")
+parser.add_argument("-c", "--compile_only", action="store_true", help="Only compile the existing lookup table CSVs")
+parser.add_argument("-p", "--pid", action="store_true", help="Also generate the PID lookup table")
+parser.add_argument(
+    "--simulator", default="openrocket", choices=["openrocket", "native"], help="Simulator used for the lookup tables"
+)
+parser.add_argument("-w", "--workers", type=int, default=None, help="Number of simulation processes")
+parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="File that finished simulations are saved to")
+parser.add_argument("--no_checkpoint", action="store_true", help="Don't save or resume from a checkpoint")
+parser.add_argument(
+    "--adaptive",
+    action="store_true",
+    help="Start the PID lookup table from a coarse grid and only add points where it curves",
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=DEFAULT_TOLERANCE,
+    help="Interpolation error in meters that --adaptive refines the grid down to",
+)
+parser.add_argument("--restart", action="store_true", help="Ignore the existing checkpoint and start over")
+parser.add_argument(
+    "--max_velocity",
+    type=float,
+    default=None,
+    help="Fastest velocity in the PID lookup table, defaults to the velocity at burnout. Lower it for a quick, "
+    "small table",
+)
+parser.add_argument(
+    "--log",
+    default=None,
+    help="Make the bang bang table from the control state of this flight log instead of a simulated flight",
+)
+parser.add_argument(
+    "-o",
+    "--output_directory",
+    default=TABLE_DIRECTORY,
+    help="Where the lookup tables and the apogee model are written, and read from with -c",
+)
 
 
 if __name__ == "__main__":
+    # Parsed here so that main can be imported, e.g. by benchmarks/lookup_table_generation.py
+    args = parser.parse_args()
+
     start_time = time.time()
-    main()
+    if args.compile_only:
+        compile_lookup_tables(args.output_directory)
+    else:
+        main(args)
     end_time = time.time()
     print("lookup table generation took " + str(end_time - start_time) + "seconds")
@@ -0,0 +1,192 @@
+"""
+Loads the airbrakes data logs that main.py writes, either format, into a dataframe for analysis.
+
+    from Scripts.log_analysis import load_flight_log
+    df, state_changes, target_apogee = load_flight_log("logs/2024-06-01_12-00-00.log")
+
+A CSV log is read with pandas in chunks, so only the numbers are ever kept in memory and none of
+it is parsed line by line in python. Each kind of line becomes a column, and the lines with the
+same timestamp are merged into one row.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from AirbrakeSystem.flight_log import (
+    DATA_POINT,
+    MAGIC,
+    MESSAGE_FORMATS,
+    STATE_CHANGE,
+    TARGET_APOGEE,
+    read_flight_log,
+)
+
+# The columns of a data point line, after the timestamp and "Data point"
+DATA_POINT_COLUMNS = ["altitude", "acceleration", "velocity"]
+# Always in the dataframe, even if the log doesn't have any of them
+COLUMNS = DATA_POINT_COLUMNS + [
+    "predicted_apogee",
+    "predicted_apogee0",
+    "predicted_apogee1",
+    "servo_control",
+    "average_altitude",
+]
+
+DEFAULT_CHUNK_SIZE = 500_000
+
+
+def format_name(name: str) -> str:
+    return name.lower().replace(" ", "_")
+
+
+def _is_binary(file_path: str) -> bool:
+    with open(file_path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def _read_csv_chunks(file_path: str, chunk_size: int):
+    """
+    :return: (timestamp, event, first value, second value, third value) dataframes of up to chunk_size lines
+    """
+    return pd.read_csv(
+        file_path,
+        header=None,
+        names=["timestamp", "event", "value", "value1", "value2"],
+        # The first value is also the name of the state for state changes, so it's parsed later
+        dtype={"timestamp": np.int64, "event": "category", "value": str, "value1": np.float64, "value2": np.float64},
+        skip_blank_lines=True,
+        # e.g. a line that was cut off in the middle of a number when the power went out
+        on_bad_lines="skip",
+        # Exactly the numbers that were logged, the default can be off in the last digit
+        float_precision="round_trip",
+        chunksize=chunk_size,
+        engine="c",
+    )
+
+
+def _read_binary_chunks(file_path: str, chunk_size: int):
+    """
+    Same as _read_csv_chunks for a binary log, see AirbrakeSystem/flight_log.py
+    """
+    # Turns the tags back into the names used in the CSV logs
+    event_names = {tag: message_format.split(",")[0] for tag, message_format in MESSAGE_FORMATS.items()}
+    columns = {"timestamp": [], "event": [], "value": [], "value1": [], "value2": []}
+
+    def to_chunk():
+        chunk = pd.DataFrame(columns)
+        for name in columns:
+            columns[name] = []
+        return chunk
+
+    for tag, timestamp, values in read_flight_log(file_path):
+        if tag not in event_names:
+            continue
+        if tag == DATA_POINT:
+            value, value1, value2 = values
+        elif isinstance(values, str):
+            value, value1, value2 = values, np.nan, np.nan
+        else:
+            value, value1, value2 = values[0], np.nan, np.nan
+        columns["timestamp"].append(timestamp)
+        columns["event"].append(event_names[tag])
+        columns["value"].append(str(value))
+        columns["value1"].append(value1)
+        columns["value2"].append(value2)
+        if len(columns["timestamp"]) >= chunk_size:
+            yield to_chunk()
+    if columns["timestamp"]:
+        yield to_chunk()
+
+
+def load_flight_log(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[pd.DataFrame, list, float]:
+    """
+    Parses an airbrakes data log, either CSV or binary
+    :param chunk_size: how many lines to parse at a time
+    :return: a dataframe indexed by timestamp with a column per value, the (timestamp, state name)
+        of every state change, and the target apogee (None if the log doesn't have one)
+    """
+    if _is_binary(file_path):
+        chunks = _read_binary_chunks(file_path, chunk_size)
+    else:
+        chunks = _read_csv_chunks(file_path, chunk_size)
+    data_point_name = MESSAGE_FORMATS[DATA_POINT].split(",")[0]
+    state_change_name = MESSAGE_FORMATS[STATE_CHANGE].split(",")[0]
+    target_apogee_name = MESSAGE_FORMATS[TARGET_APOGEE].split(",")[0]
+
+    data_points = []
+    values = []
+    state_changes = []
+    target_apogee = None
+    for chunk in chunks:
+        events = chunk["event"].astype(str)
+
+        is_data_point = events == data_point_name
+        data_point = chunk.loc[is_data_point, ["timestamp", "value", "value1", "value2"]]
+        data_point.columns = ["timestamp"] + DATA_POINT_COLUMNS
+        data_point["altitude"] = pd.to_numeric(data_point["altitude"], errors="coerce")
+        data_points.append(data_point)
+
+        is_state_change = events == state_change_name
+        for timestamp, name in zip(chunk.loc[is_state_change, "timestamp"], chunk.loc[is_state_change, "value"]):
+            # Without the "State" suffix
+            state_changes.append((int(timestamp), name.removesuffix("State")))
+
+        is_target_apogee = events == target_apogee_name
+        if is_target_apogee.any():
+            target_apogee = float(chunk.loc[is_target_apogee, "value"].iloc[-1])
+
+        # Everything else is a single number, e.g. "Servo Control,1.000"
+        other = chunk.loc[~(is_data_point | is_state_change | is_target_apogee), ["timestamp", "value"]]
+        other = other.assign(
+            name=events[other.index].map(format_name), value=pd.to_numeric(other["value"], errors="coerce")
+        )
+        values.append(other.dropna(subset=["value"]))
+
+    data_points = pd.concat(data_points) if data_points else pd.DataFrame(columns=["timestamp"] + DATA_POINT_COLUMNS)
+    values = pd.concat(values) if values else pd.DataFrame(columns=["timestamp", "name", "value"])
+
+    # A column per kind of line, with the first value of each timestamp
+    df = pd.concat(
+        [
+            data_points.groupby("timestamp").first(),
+            values.pivot_table(index="timestamp", columns="name", values="value", aggfunc="first"),
+        ],
+        axis=1,
+    ).sort_index()
+    df.columns.name = None
+    df.index.name = "timestamp"
+    for column in COLUMNS:
+        if column not in df:
+            df[column] = np.nan
+    df = df[COLUMNS + [column for column in df.columns if column not in COLUMNS]]
+
+    return df, state_changes, target_apogee
+
+
+def downsample(df: pd.DataFrame, max_points: int = 10000) -> pd.DataFrame:
+    """
+    Thins out a dataframe for plotting, keeping the smallest and biggest value of every column in
+    each stretch of rows so that peaks (like apogee) don't get lost
+    :param max_points: the most rows to keep
+    """
+    if len(df) <= max_points:
+        return df
+    # Up to two rows per column from each bucket, and its first row
+    bucket_count = max(1, (max_points - 1) // (2 * len(df.columns) + 1))
+    bucket_size = -(-len(df) // bucket_count)
+    bucket_count = -(-len(df) // bucket_size)
+    # Padded with NaN to a whole number of buckets, so each bucket is a row
+    values = np.full((bucket_count * bucket_size, len(df.columns)), np.nan)
+    values[: len(df)] = df.to_numpy(dtype=np.float64, na_value=np.nan)
+    buckets = values.reshape(bucket_count, bucket_size, len(df.columns))
+    starts = np.arange(bucket_count)[:, None] * bucket_size
+
+    # The first and last row, and where each column is smallest and biggest in each bucket. A
+    # bucket without any values for a column just keeps its first row.
+    keep = [starts.ravel(), [len(df) - 1]]
+    keep.append((starts + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)).ravel())
+    keep.append((starts + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)).ravel())
+    keep = np.unique(np.concatenate(keep))
+    return df.iloc[keep[keep < len(df)]]
@@ -0,0 +1,272 @@
+"""
+Keeps track of the airbrakes data logs, so that each one only has to be parsed once.
+
+The first time a log is loaded, its columns are saved to an .npz file in logs/.cache, named after
+the hash of the log. After that it's loaded from there as long as the log hasn't changed, which is
+checked with its size and modification time, and the hash if those don't match. An index of every
+flight with a summary (target apogee, state changes, max altitude) is kept next to them.
+
+    python -m Scripts.log_catalog             # index the logs folder and list the flights
+    python -m Scripts.log_catalog --rebuild   # parse every log again
+
+Logs from outside the folder can be loaded through the catalog too. They are indexed by their
+absolute path, and scanning the folder only forgets them once they are deleted.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from Scripts.log_analysis import load_flight_log
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Where main.py writes the logs when it's run from the repo root
+DEFAULT_LOG_FOLDER = os.path.join(REPO_ROOT, "logs")
+CACHE_FOLDER_NAME = ".cache"
+INDEX_FILE_NAME = "index.json"
+# Bump this when the sidecar layout changes, so the old ones are parsed again
+SIDECAR_VERSION = 1
+
+LOG_EXTENSIONS = (".log", ".ablog")
+
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    file_hash = hashlib.sha1()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def is_flight_log(file_name: str) -> bool:
+    """
+    The airbrakes data logs, not the IMU logs (which are .csv, or LORDlog.ablog in binary)
+    """
+    return file_name.endswith(LOG_EXTENSIONS) and "LORDlog" not in file_name
+
+
+def save_sidecar(file_path: str, df: pd.DataFrame, state_changes: list, target_apogee: float | None) -> None:
+    columns = {f"column_{name}": df[name].to_numpy() for name in df.columns}
+    temporary_path = file_path + ".tmp.npz"
+    np.savez(
+        temporary_path,
+        version=SIDECAR_VERSION,
+        timestamp=df.index.to_numpy(dtype=np.int64),
+        columns=np.array(list(df.columns)),
+        state_change_times=np.array([timestamp for timestamp, _ in state_changes], dtype=np.int64),
+        state_change_names=np.array([name for _, name in state_changes], dtype=str),
+        target_apogee=np.nan if target_apogee is None else target_apogee,
+        **columns,
+    )
+    # So a half written sidecar is never loaded
+    os.replace(temporary_path, file_path)
+
+
+def load_sidecar(file_path: str) -> tuple[pd.DataFrame, list, float | None]:
+    """
+    :return: the same as log_analysis.load_flight_log
+    """
+    with np.load(file_path) as sidecar:
+        if int(sidecar["version"]) != SIDECAR_VERSION:
+            raise ValueError(f"{file_path} is from an older version")
+        df = pd.DataFrame(
+            {name: sidecar[f"column_{name}"] for name in sidecar["columns"]},
+            index=pd.Index(sidecar["timestamp"], name="timestamp"),
+        )
+        state_changes = [
+            (int(timestamp), str(name))
+            for timestamp, name in zip(sidecar["state_change_times"], sidecar["state_change_names"])
+        ]
+        target_apogee = float(sidecar["target_apogee"])
+    return df, state_changes, None if np.isnan(target_apogee) else target_apogee
+
+
+def summarize(df: pd.DataFrame, state_changes: list, target_apogee: float | None) -> dict:
+    """
+    :return: what the index keeps about a flight
+    """
+    altitudes = df["altitude"].dropna()
+    return {
+        "target_apogee": target_apogee,
+        "state_changes": [[timestamp, name] for timestamp, name in state_changes],
+        "max_altitude": float(altitudes.max()) if len(altitudes) else None,
+        "data_points": int(len(altitudes)),
+        "duration": float((df.index[-1] - df.index[0]) / 1e9) if len(df) else 0.0,
+    }
+
+
+class LogCatalog:
+    """
+    The index of the logs in a folder and their cached columns
+    """
+
+    def __init__(self, log_folder: str = DEFAULT_LOG_FOLDER):
+        self.log_folder = log_folder
+        self.cache_folder = os.path.join(log_folder, CACHE_FOLDER_NAME)
+        self.index_path = os.path.join(self.cache_folder, INDEX_FILE_NAME)
+        self.index = self._read_index()
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self) -> None:
+        os.makedirs(self.cache_folder, exist_ok=True)
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.index, file, indent=4, sort_keys=True)
+        os.replace(temporary_path, self.index_path)
+
+    def _key(self, file_path: str) -> str:
+        """
+        :return: the path of the log in the folder, or its absolute path if it's somewhere else
+        """
+        file_path = os.path.abspath(file_path)
+        log_folder = os.path.abspath(self.log_folder)
+        try:
+            if os.path.commonpath([file_path, log_folder]) == log_folder:
+                return os.path.relpath(file_path, log_folder)
+        except ValueError:
+            # On another drive
+            pass
+        return file_path
+
+    def _is_outside(self, key: str) -> bool:
+        return os.path.isabs(key)
+
+    def _sidecar_path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_folder, f"{file_hash}.npz")
+
+    def is_up_to_date(self, file_path: str) -> bool:
+        """
+        :return: whether the log is in the index and has a sidecar, without checking the hash
+        """
+        entry = self.index.get(self._key(file_path))
+        if entry is None:
+            return False
+        stat = os.stat(file_path)
+        return (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns) and os.path.exists(
+            self._sidecar_path(entry["hash"])
+        )
+
+    def load(self, file_path: str, rebuild: bool = False) -> tuple[pd.DataFrame, list, float | None]:
+        """
+        Loads a log from its sidecar, or parses it and makes the sidecar if it doesn't have an up to date one
+        :param rebuild: parse the log even if it has a sidecar
+        :return: the same as log_analysis.load_flight_log
+        """
+        stat = os.stat(file_path)
+        key = self._key(file_path)
+        entry = self.index.get(key)
+
+        if entry is not None and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            file_hash = entry["hash"]
+        else:
+            # Changed, new, or just touched, which the hash tells apart
+            file_hash = hash_file(file_path)
+
+        sidecar_path = self._sidecar_path(file_hash)
+        if not rebuild and os.path.exists(sidecar_path):
+            try:
+                flight = load_sidecar(sidecar_path)
+            except (OSError, ValueError, KeyError):
+                flight = None
+            if flight is not None:
+                if entry is None or entry["hash"] != file_hash or entry["mtime_ns"] != stat.st_mtime_ns:
+                    self._add(key, stat, file_hash, flight)
+                return flight
+
+        flight = load_flight_log(file_path)
+        os.makedirs(self.cache_folder, exist_ok=True)
+        save_sidecar(sidecar_path, *flight)
+        self._add(key, stat, file_hash, flight)
+        return flight
+
+    def _add(self, key: str, stat: os.stat_result, file_hash: str, flight: tuple) -> None:
+        old_entry = self.index.get(key)
+        self.index[key] = {
+            "hash": file_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            **summarize(*flight),
+        }
+        self._write_index()
+
+        # The log changed, e.g. a simulation log that gets written over every run
+        if old_entry is not None and old_entry["hash"] != file_hash:
+            if all(entry["hash"] != old_entry["hash"] for entry in self.index.values()):
+                try:
+                    os.remove(self._sidecar_path(old_entry["hash"]))
+                except OSError:
+                    pass
+
+    def scan(self, rebuild: bool = False) -> dict:
+        """
+        Indexes every flight log in the folder, and forgets the ones that are gone along with the
+        sidecars nothing uses anymore. Logs from outside the folder are kept as long as they exist.
+        :return: the index, by the path of the log in the folder (or the absolute path of the ones outside it)
+        """
+        found = set()
+        for directory, directory_names, file_names in os.walk(self.log_folder):
+            directory_names[:] = [name for name in directory_names if name != CACHE_FOLDER_NAME]
+            for file_name in file_names:
+                if is_flight_log(file_name):
+                    file_path = os.path.join(directory, file_name)
+                    found.add(self._key(file_path))
+                    if rebuild or not self.is_up_to_date(file_path):
+                        self.load(file_path, rebuild)
+
+        removed = {
+            key for key in self.index if key not in found and not (self._is_outside(key) and os.path.isfile(key))
+        }
+        for key in removed:
+            del self.index[key]
+        if removed:
+            self._write_index()
+
+        used = {f"{entry['hash']}.npz" for entry in self.index.values()}
+        if os.path.isdir(self.cache_folder):
+            for file_name in os.listdir(self.cache_folder):
+                if file_name.endswith(".npz") and file_name not in used:
+                    os.remove(os.path.join(self.cache_folder, file_name))
+        return self.index
+
+    def newest(self) -> str | None:
+        """
+        :return: the path of the most recently written flight log in the folder, not counting subfolders
+        """
+        if not os.path.isdir(self.log_folder):
+            return None
+        file_paths = [
+            os.path.join(self.log_folder, file_name)
+            for file_name in os.listdir(self.log_folder)
+            if is_flight_log(file_name) and os.path.isfile(os.path.join(self.log_folder, file_name))
+        ]
+        return max(file_paths, key=os.path.getmtime, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexes the flight logs and lists them")
+    parser.add_argument("-f", "--folder", default=DEFAULT_LOG_FOLDER, help="The logs folder")
+    parser.add_argument("--rebuild", action="store_true", help="Parse every log again")
+    args = parser.parse_args()
+
+    index = LogCatalog(args.folder).scan(args.rebuild)
+    print(f"{'log':<48}{'target':>9}{'max alt':>9}{'points':>9}{'seconds':>9}")
+    for key, entry in sorted(index.items()):
+        target_apogee = "-" if entry["target_apogee"] is None else f"{entry['target_apogee']:.1f}"
+        max_altitude = "-" if entry["max_altitude"] is None else f"{entry['max_altitude']:.1f}"
+        print(f"{key:<48}{target_apogee:>9}{max_altitude:>9}{entry['data_points']:>9}{entry['duration']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
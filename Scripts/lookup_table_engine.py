@@ -0,0 +1,217 @@
+"""
+Runs the simulations for a lookup table in parallel. Every worker process keeps one simulator
+(e.g. a JVM with the rocket already loaded) for all of its simulations, and the results are sent
+straight back instead of going through log files. Finished cells are saved to a checkpoint file
+as they come in, so a generation that gets interrupted can pick up where it left off.
+
+The first line of the checkpoint says which simulator made it and the hash of the rocket it
+simulated (the .ork file, or NativeSimulation.py for the native simulator). A checkpoint from
+another simulator or a changed rocket isn't resumed from, since its cells would be wrong.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import time
+
+from AirbrakeSystem.lookup_table_control import hash_file
+
+DEFAULT_CHECKPOINT_PATH = "logs/lookup_table_logs/checkpoint.jsonl"
+
+# How often to print progress, in seconds
+PROGRESS_INTERVAL = 5.0
+
+# The simulator of this worker process, made once by _init_worker
+_simulator = None
+
+
+def make_simulator(simulator_name: str):
+    """
+    Makes a simulator that has a `simulate(deploy_velocity, extension)` method, which returns the
+    change in altitude from deployment to apogee, and a `simulate_coast()` method, which returns
+    the altitudes and velocities of a flight with the airbrakes retracted
+    :param simulator_name: which simulator to use, "openrocket" or "native"
+    """
+    if simulator_name == "openrocket":
+        from Scripts.openrocket_simulator import OpenRocketSimulator
+
+        return OpenRocketSimulator()
+    if simulator_name == "native":
+        from AirbrakeSystem.mock.NativeSimulation import NativeDeploymentSimulator
+
+        return NativeDeploymentSimulator()
+    raise ValueError(f"Unknown simulator: {simulator_name}")
+
+
+def get_rocket_path(simulator_name: str) -> str:
+    """
+    Gets the file that the simulator's rocket comes from, see make_simulator
+    """
+    if simulator_name == "openrocket":
+        from AirbrakeSystem.mock.MockMSCLInterface import OR_FILE_PATH
+
+        return OR_FILE_PATH
+    if simulator_name == "native":
+        from AirbrakeSystem.mock import NativeSimulation
+
+        return NativeSimulation.__file__
+    raise ValueError(f"Unknown simulator: {simulator_name}")
+
+
+def get_checkpoint_header(simulator_name: str) -> dict:
+    """
+    Gets what the first line of a checkpoint has to match for its cells to be reused
+    """
+    return {"simulator": simulator_name, "rocket_sha256": hash_file(get_rocket_path(simulator_name))}
+
+
+def _init_worker(simulator_name: str) -> None:
+    global _simulator
+    _simulator = make_simulator(simulator_name)
+
+
+def _simulate_cell(cell: tuple[float, float]) -> tuple[float, float, float]:
+    deploy_velocity, extension = cell
+    return deploy_velocity, extension, _simulator.simulate(deploy_velocity, extension)
+
+
+def _simulate_coast() -> tuple[list[float], list[float]]:
+    return _simulator.simulate_coast()
+
+
+def simulate_coast(simulator_name: str = "openrocket") -> tuple[list[float], list[float]]:
+    """
+    Flies the rocket once with the airbrakes retracted. It runs in a worker process like the cells,
+    so this process never starts a JVM.
+    :param simulator_name: which simulator to use, see make_simulator
+    :return: the altitudes and velocities from burnout until the rocket starts coming down
+    """
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=1, mp_context=context, initializer=_init_worker, initargs=(simulator_name,)
+    ) as executor:
+        return executor.submit(_simulate_coast).result()
+
+
+def load_checkpoint(checkpoint_path: str, header: dict) -> dict[tuple[float, float], float]:
+    """
+    Reads the cells that were already simulated from a checkpoint file
+    :param header: what the checkpoint has to have been made with, see get_checkpoint_header
+    :return: {(velocity, extension): change_in_altitude}
+    """
+    completed = {}
+    if not os.path.exists(checkpoint_path) or os.path.getsize(checkpoint_path) == 0:
+        return completed
+
+    with open(checkpoint_path, "r") as checkpoint_file:
+        try:
+            checkpoint_header = json.loads(checkpoint_file.readline())
+        except json.JSONDecodeError:
+            checkpoint_header = None
+        if not isinstance(checkpoint_header, dict) or "velocity" in checkpoint_header:
+            # From before checkpoints had a header
+            problem = "doesn't say which simulator and rocket it's from"
+        elif checkpoint_header.get("simulator") != header["simulator"]:
+            problem = f"is from the {checkpoint_header.get('simulator')} simulator"
+        elif checkpoint_header != header:
+            problem = f"was simulated with a different {os.path.basename(get_rocket_path(header['simulator']))}"
+        else:
+            problem = None
+        if problem is not None:
+            raise ValueError(
+                f"{checkpoint_path} {problem}, run with --restart to start over or use another --checkpoint"
+            )
+
+        for line in checkpoint_file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line can be cut off if we were killed while writing it
+                continue
+            completed[(entry["velocity"], entry["extension"])] = entry["change_in_altitude"]
+    return completed
+
+
+class ProgressReporter:
+    """
+    Prints how many cells are done, how fast they are going and how long is left
+    """
+
+    def __init__(self, total: int, already_done: int):
+        self.total = total
+        self.done = already_done
+        self.simulated = 0
+        self.start_time = time.monotonic()
+        self.last_report_time = self.start_time
+
+    def update(self, force: bool = False) -> None:
+        self.done += 1
+        self.simulated += 1
+        now = time.monotonic()
+        if not force and now - self.last_report_time < PROGRESS_INTERVAL:
+            return
+        self.last_report_time = now
+
+        elapsed = now - self.start_time
+        rate = self.simulated / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total - self.done) / rate if rate > 0 else float("inf")
+        print(f"{self.done}/{self.total} cells, {rate:.2f} simulations/s, {remaining:.0f}s left")
+
+
+def simulate_cells(
+    cells: list[tuple[float, float]],
+    simulator_name: str = "openrocket",
+    workers: int | None = None,
+    checkpoint_path: str | None = DEFAULT_CHECKPOINT_PATH,
+) -> dict[tuple[float, float], float]:
+    """
+    Simulates every (deploy velocity, extension) cell, skipping the ones already in the checkpoint
+    :param cells: the (deploy velocity, extension) pairs to simulate
+    :param simulator_name: which simulator the workers use, see make_simulator
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param checkpoint_path: where finished cells are saved, or None to not save them
+    :return: {(velocity, extension): change_in_altitude} for every cell
+    """
+    header = get_checkpoint_header(simulator_name) if checkpoint_path is not None else None
+    results = load_checkpoint(checkpoint_path, header) if checkpoint_path is not None else {}
+    remaining = [cell for cell in dict.fromkeys(cells) if cell not in results]
+    print(f"{len(cells) - len(remaining)} cells already done, simulating {len(remaining)}")
+    if not remaining:
+        return results
+
+    checkpoint_file = None
+    if checkpoint_path is not None:
+        os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+        checkpoint_file = open(checkpoint_path, "a")
+        if checkpoint_file.tell() == 0:
+            checkpoint_file.write(json.dumps(header) + "\n")
+
+    progress = ProgressReporter(len(cells), len(cells) - len(remaining))
+    # Spawned workers get a clean interpreter, which is needed for each of them to start a JVM
+    context = multiprocessing.get_context("spawn")
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(simulator_name,)
+        ) as executor:
+            futures = [executor.submit(_simulate_cell, cell) for cell in remaining]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    velocity, extension, change_in_altitude = future.result()
+                    results[(velocity, extension)] = change_in_altitude
+                    if checkpoint_file is not None:
+                        entry = {"velocity": velocity, "extension": extension, "change_in_altitude": change_in_altitude}
+                        checkpoint_file.write(json.dumps(entry) + "\n")
+                        checkpoint_file.flush()
+                    progress.update(force=progress.done + 1 == progress.total)
+            except BaseException:
+                # Don't wait for the rest of the simulations, everything finished so far is in the checkpoint
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+
+    return results
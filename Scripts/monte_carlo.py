@@ -0,0 +1,199 @@
+"""
+Flies thousands of dispersed flights at once to see how well the controller hits the target apogee.
+
+Run as `python -m Scripts.monte_carlo -n 10000`
+
+Every flight is a row in numpy arrays. The rocket is the flight model from
+AirbrakeSystem/mock/NativeSimulation.py with a randomly dispersed motor impulse, drag, wind,
+launch angle and sensor noise, and each flight goes through the same
+Standby -> Liftoff -> Control -> Freefall logic as AirbrakeSystem/state.py, written for arrays.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import time
+
+import numpy as np
+
+from AirbrakeSystem import control_tables
+from AirbrakeSystem.airbrakes import Airbrakes
+from AirbrakeSystem.estimator import KalmanEstimator
+from AirbrakeSystem.launch_detector import LaunchDetectorArray
+from AirbrakeSystem.mock.NativeSimulation import RocketModel
+from AirbrakeSystem.state import ControlState, StandbyState
+
+STANDBY = 0
+LIFTOFF = 1
+CONTROL = 2
+FREEFALL = 3
+
+TIME_STEP = 0.01  # Same as the IMU polling rate
+PAD_TIME = 3.0  # Long enough to fill the launch detection window
+MAX_TIME = 60.0
+
+
+class Dispersions:
+    """
+    Standard deviations (or ranges) of the randomized flight parameters
+    """
+
+    def __init__(
+        self,
+        impulse: float = 0.03,
+        drag: float = 0.05,
+        airbrake_drag: float = 0.10,
+        max_wind_speed: float = 8.0,
+        launch_angle: float = np.radians(2.0),
+        acceleration_noise: float = 0.5,
+        altitude_noise: float = 1.0,
+    ):
+        """
+        :param impulse: standard deviation of the motor impulse, as a fraction of nominal
+        :param drag: standard deviation of the body drag coefficient, as a fraction of nominal
+        :param airbrake_drag: standard deviation of the airbrake drag coefficient, as a fraction of nominal
+        :param max_wind_speed: wind speed is uniform between 0 and this, in m/s
+        :param launch_angle: standard deviation of the launch angle from vertical, in radians
+        :param acceleration_noise: standard deviation of the measured acceleration noise, in m/s^2
+        :param altitude_noise: standard deviation of the measured altitude noise, in m
+        """
+        self.impulse = impulse
+        self.drag = drag
+        self.airbrake_drag = airbrake_drag
+        self.max_wind_speed = max_wind_speed
+        self.launch_angle = launch_angle
+        self.acceleration_noise = acceleration_noise
+        self.altitude_noise = altitude_noise
+
+    def sample(self, flights: int, rng: np.random.Generator) -> dict:
+        """
+        Picks the RocketModel parameters of every flight
+        :return: {parameter name: array with an entry per flight}
+        """
+        return {
+            "impulse_scale": rng.normal(1.0, self.impulse, flights),
+            "drag_scale": rng.normal(1.0, self.drag, flights),
+            "airbrake_drag_scale": rng.normal(1.0, self.airbrake_drag, flights),
+            "launch_angle": np.abs(rng.normal(0.0, self.launch_angle, flights)),
+            "wind_speed": rng.uniform(0.0, self.max_wind_speed, flights),
+        }
+
+
+def run_campaign(flights: int, dispersions: Dispersions, target_apogee: float, seed: int = None) -> dict:
+    """
+    Flies every flight until it has passed apogee
+    :return: arrays with an entry per flight: the apogee, the apogee error, whether the airbrakes
+        got to the control state, and the dispersed parameters (launch angle in radians)
+    """
+    rng = np.random.default_rng(seed)
+    parameters = dispersions.sample(flights, rng)
+    # A single model where every parameter is an array, so all the flights are computed together
+    model = RocketModel(**parameters)
+    bang_bang_table = control_tables.get_bang_bang_table()
+
+    # The true state of each rocket
+    altitude = np.zeros(flights)
+    velocity = np.zeros(flights)
+    apogee = np.zeros(flights)
+    past_apogee = np.zeros(flights, dtype=bool)
+
+    # What the airbrakes know, see Airbrakes.update and the states
+    state = np.full(flights, STANDBY)
+    estimator = KalmanEstimator(np.zeros(flights))
+    extension = np.zeros(flights)
+    launch_detector = LaunchDetectorArray(StandbyState.make_launch_detector(), flights)
+    liftoff_time = np.zeros(flights)
+    deploy_time = np.zeros(flights)
+    max_altitude = np.zeros(flights)
+
+    current_time = 0.0
+    while current_time < MAX_TIME and not past_apogee.all():
+        current_time += TIME_STEP
+        flight_time = current_time - PAD_TIME
+
+        # Flies the rockets
+        if flight_time > 0.0:
+            acceleration = model.get_acceleration(flight_time, altitude, velocity, extension)
+            on_pad = (altitude <= 0.0) & (velocity <= 0.0) & (acceleration < 0.0)
+            acceleration = np.where(on_pad, 0.0, acceleration)
+            velocity += acceleration * TIME_STEP
+            altitude += velocity * TIME_STEP
+            apogee = np.maximum(apogee, altitude)
+            past_apogee |= (velocity < 0.0) & (apogee > 0.0)
+        else:
+            acceleration = np.zeros(flights)
+
+        measured_acceleration = acceleration + rng.normal(0.0, dispersions.acceleration_noise, flights)
+        measured_altitude = altitude + rng.normal(0.0, dispersions.altitude_noise, flights)
+
+        # Airbrakes.update, every flight goes through the same Kalman filter at once
+        estimator.update(measured_acceleration, measured_altitude, TIME_STEP)
+
+        # StandbyState, with the same launch detector settings
+        launched = launch_detector.update(measured_acceleration) & (state == STANDBY)
+        state[launched] = LIFTOFF
+        liftoff_time[launched] = current_time
+
+        # LiftoffState, waits for the motor to burn out
+        burned_out = (state == LIFTOFF) & (current_time - liftoff_time > Airbrakes.MOTOR_BURN_TIME)
+        state[burned_out] = CONTROL
+        deploy_time[burned_out] = current_time
+
+        # ControlState, bang bang control with the first bit always deployed
+        controlling = state == CONTROL
+        estimated_apogee = bang_bang_table.estimate_batch(estimator.velocity) + estimator.altitude
+        deploy = (estimated_apogee > target_apogee) | (
+            current_time - deploy_time <= ControlState.hard_coded_deploy_length
+        )
+        extension = np.where(controlling, np.where(deploy, 1.0, 0.0), extension)
+        max_altitude = np.where(controlling, np.maximum(max_altitude, measured_altitude), max_altitude)
+        falling = controlling & (measured_altitude <= max_altitude - 30)
+
+        # FreefallState, retracts the airbrakes
+        state[falling] = FREEFALL
+        extension[falling] = 0.0
+
+    return {"apogee": apogee, "error": apogee - target_apogee, "controlled": state >= CONTROL, **parameters}
+
+
+def print_report(results: dict, target_apogee: float) -> None:
+    error = results["error"]
+    percentiles = np.percentile(error, [1, 5, 25, 50, 75, 95, 99])
+    print(f"Flights: {len(error)}, target apogee: {target_apogee:.1f} m")
+    print(f"Flights that reached the control state: {results['controlled'].mean() * 100:.1f}%")
+    print(f"Apogee error: mean {error.mean():.2f} m, std {error.std():.2f} m, worst {np.abs(error).max():.2f} m")
+    print("Percentiles (m): " + ", ".join(
+        f"p{p}={value:.2f}" for p, value in zip([1, 5, 25, 50, 75, 95, 99], percentiles)
+    ))
+    for tolerance in (5.0, 10.0, 25.0):
+        print(f"Within {tolerance:.0f} m: {(np.abs(error) <= tolerance).mean() * 100:.1f}%")
+
+
+def write_results(file_path: str, results: dict) -> None:
+    columns = ["apogee", "error", "impulse_scale", "drag_scale", "airbrake_drag_scale", "wind_speed", "launch_angle"]
+    with open(file_path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(columns)
+        writer.writerows(zip(*(results[column] for column in columns)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flies many dispersed flights to evaluate the airbrake controller")
+    parser.add_argument("-n", "--flights", type=int, default=1000, help="Number of flights")
+    parser.add_argument("-t", "--target_apogee", type=float, default=ControlState.target_apogee)
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the random dispersions")
+    parser.add_argument("-o", "--output", default=None, help="CSV file to write the result of every flight to")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    results = run_campaign(args.flights, Dispersions(), args.target_apogee, args.seed)
+    print_report(results, args.target_apogee)
+    print(f"Took {time.time() - start_time:.2f} seconds")
+
+    if args.output is not None:
+        write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
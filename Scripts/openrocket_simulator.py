@@ -0,0 +1,135 @@
+"""
+Runs OpenRocket simulations of deploying the airbrakes at a given velocity, for lookup table generation.
+Importing this starts nothing, the JVM is started when an OpenRocketSimulator is made.
+"""
+
+from __future__ import annotations
+
+from AirbrakeSystem.mock.MockMSCLInterface import OR_FILE_PATH, Airbrakes
+
+import orhelper.orhelper as orhelper
+
+
+class DeployListener(orhelper.AbstractSimulationListener):
+    """
+    Deploys the airbrakes to a fixed extension once the rocket has burned out and slowed
+    down to the deploy velocity, then records the altitude gained until apogee
+    """
+
+    fins: any = None
+
+    def __init__(self, deploy_velocity: float, extension: float) -> None:
+        super().__init__()
+
+        self.deploy_velocity = deploy_velocity
+        self.extension = extension
+
+        self.max_velocity = 0.0
+        self.deploy_altitude: float | None = None
+        self.apogee: float | None = None
+
+    # pylint: disable-next=invalid-name
+    def startSimulation(self, status):
+        for component in status.getConfiguration().getActiveComponents():
+            if component.getName() == "Airbrakes":
+                self.fins = component
+                break
+        # The document is reused between simulations, so the airbrakes have to be retracted again
+        self.fins.setHeight(0.0)
+
+    # pylint: disable-next=invalid-name
+    def postStep(self, status):
+        if self.apogee is not None:
+            return
+
+        altitude = status.getRocketPosition().z
+        velocity = status.getRocketVelocity().z
+        self.max_velocity = max(self.max_velocity, velocity)
+
+        if self.deploy_altitude is None:
+            # Only deploy once the motor has burned out and the rocket is slowing down
+            if velocity < self.max_velocity and velocity <= self.deploy_velocity:
+                self.fins.setHeight(Airbrakes.MAX_HEIGHT * self.extension)
+                self.deploy_altitude = altitude
+        elif velocity <= 0.0:
+            self.apogee = altitude
+
+
+class CoastListener(orhelper.AbstractSimulationListener):
+    """
+    Records the altitude and velocity from burnout to apogee, with the airbrakes retracted
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.max_velocity = 0.0
+        self.altitudes: list[float] = []
+        self.velocities: list[float] = []
+        self.done = False
+
+    # pylint: disable-next=invalid-name
+    def startSimulation(self, status):
+        for component in status.getConfiguration().getActiveComponents():
+            if component.getName() == "Airbrakes":
+                component.setHeight(0.0)
+                break
+
+    # pylint: disable-next=invalid-name
+    def postStep(self, status):
+        if self.done:
+            return
+
+        altitude = status.getRocketPosition().z
+        velocity = status.getRocketVelocity().z
+        self.max_velocity = max(self.max_velocity, velocity)
+
+        # Burned out the same way as in DeployListener
+        if velocity < self.max_velocity:
+            self.altitudes.append(altitude)
+            self.velocities.append(velocity)
+            self.done = velocity <= 0.0
+
+
+class OpenRocketSimulator:
+    """
+    Keeps a JVM and the loaded rocket around so that many simulations can be run without paying
+    the start up cost every time. Each process should only make one of these.
+    """
+
+    def __init__(self):
+        self.instance = orhelper.OpenRocketInstance()
+        self.instance.__enter__()
+
+        self.helper = orhelper.Helper(self.instance)
+        doc = self.helper.load_doc(OR_FILE_PATH)
+        self.simulation = doc.getSimulation(doc.getSimulationCount() - 1)
+
+    def simulate(self, deploy_velocity: float, extension: float) -> float:
+        """
+        Simulates a flight where the airbrakes are deployed to `extension` at `deploy_velocity`
+        :return: the change in altitude from deployment to apogee
+        """
+        listener = DeployListener(deploy_velocity, extension)
+        self.helper.run_simulation(self.simulation, listeners=[listener])
+        if listener.deploy_altitude is None or listener.apogee is None:
+            raise RuntimeError(f"The rocket never got to {deploy_velocity} m/s after burnout")
+        return listener.apogee - listener.deploy_altitude
+
+    def simulate_coast(self) -> tuple[list[float], list[float]]:
+        """
+        Simulates a flight with the airbrakes retracted, for the bang bang table and the fastest
+        velocity the airbrakes can be deployed at
+        :return: the altitudes and velocities from burnout until the rocket starts coming down
+        """
+        listener = CoastListener()
+        self.helper.run_simulation(self.simulation, listeners=[listener])
+        if not listener.done:
+            raise RuntimeError("The simulation ended before the rocket got to apogee")
+        return listener.altitudes, listener.velocities
+
+    def close(self):
+        try:
+            self.instance.__exit__(None, None, None)
+        except RuntimeError:
+            pass
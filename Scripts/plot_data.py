@@ -6,175 +6,129 @@ import sys
 import pandas as pd
 import plotly.graph_objects as go
 
+from Scripts.log_analysis import downsample
+from Scripts.log_catalog import LogCatalog
+
 # Run this file after you have run the simulation (python .\main.py -si)
 
-# Read the log file
-if len(sys.argv) < 2:
-    # Get the newest file from the logs folder
-    import os
-
-    logs = os.listdir("./logs")
-    logs.sort()
-    filename = "./logs/" + logs[-1]
-else:
-    filename = sys.argv[1]
-
-print(f"Reading log file: {filename}")
-
-with open(filename, "r") as file:
-    lines = file.readlines()
-
-# Initialize lists to store data
-data = {
-    "timestamp": [],
-    "altitude": [],
-    "acceleration": [],
-    "velocity": [],
-    "predicted_apogee": [],
-    "predicted_apogee0": [],
-    "predicted_apogee1": [],
-    "servo_control": [],
-    "average_altitude": [],
-}
-
-state_changes = []
-
-
-def format_name(name):
-    return name.lower().replace(" ", "_")
-
-
-# Process each line in the log file
-for line in lines:
-    if line.isspace():
-        continue
-
-    parts = line.strip().split(",")
-    timestamp = int(parts[0])
-    data["timestamp"].append(timestamp)
-
-    event_type = parts[1]
-    if event_type == "Data point":
-        data["altitude"].append(float(parts[2]))
-        data["acceleration"].append(float(parts[3]))
-        data["velocity"].append(float(parts[4]))
-    elif event_type == "Target Apogee":
-        target_apogee = float(parts[2])
-    elif event_type == "State Change":
-        data["timestamp"].pop()
-        # remove the 'State' suffix
-        name = parts[2][:-5]
-        state_changes.append((timestamp, name))
-    else:
-        try:
-            data[format_name(event_type)].append(float(parts[2]))
-        except:
-            # make sure the lists are aligned
-            print("Unexpected event type: ", event_type)
-            data["timestamp"].pop()
-
-    for key in data:
-        if len(data[key]) < len(data["timestamp"]):
-            data[key].append(None)
-
-# Create a pandas dataframe
-df = pd.DataFrame(data)
-
-# Merge rows with the same timestamp
-df = df.groupby("timestamp").agg(
-    lambda x: x.dropna().iloc[0] if x.notnull().any() else None
-)
-
-print(df)
-
-# Create traces for Altitude and Acceleration
-trace_altitude = go.Scatter(
-    x=df.index, y=df["altitude"], mode="lines", name="Altitude", line=dict(color="blue")
-)
-trace_accel = go.Scatter(
-    x=df.index,
-    y=df["acceleration"],
-    mode="lines",
-    name="Acceleration",
-    line=dict(color="red"),
-)
-trace_predicted_apogee = go.Scatter(
-    x=df.index,
-    y=df["predicted_apogee"],
-    mode="lines",
-    name="Predicted Apogee",
-    line=dict(color="green"),
-)
-trace_predicted_apogee0 = go.Scatter(
-    x=df.index,
-    y=df["predicted_apogee0"],
-    mode="lines",
-    name="Predicted Apogee0",
-    line=dict(color="green"),
-)
-trace_predicted_apogee1 = go.Scatter(
-    x=df.index,
-    y=df["predicted_apogee1"],
-    mode="lines",
-    name="Predicted Apogee1",
-    line=dict(color="green"),
-)
-trace_servo_control = go.Scatter(
-    x=df.index,
-    y=df["servo_control"],
-    mode="lines",
-    name="Servo Control",
-    line=dict(color="purple"),
-)
-trace_average_altitude = go.Scatter(
-    x=df.index,
-    y=df["average_altitude"],
-    mode="lines",
-    name="Average Altitude",
-    line=dict(color="orange"),
-    visible="legendonly",
-)
-
-# Create layout
-layout = go.Layout(
-    title="Simulation Data Over Time",
-    xaxis=dict(title="Time"),
-    yaxis=dict(title="Simulation Data"),
-)
-
-# Create figure
-fig = go.Figure(
-    data=[
-        trace_altitude,
-        trace_accel,
-        trace_predicted_apogee,
-        trace_predicted_apogee0,
-        trace_predicted_apogee1,
-        trace_servo_control,
-        trace_average_altitude,
-    ],
-    layout=layout,
-)
-
-fig.add_hline(
-    y=target_apogee,
-    line_dash="dot",
-    line_color="green",
-    annotation_text="Target Apogee",
-)
-
-# annotate the state changes on the altitude plot
-for state_change in state_changes:
-    y = df["altitude"][state_change[0]]
-    fig.add_annotation(
-        x=state_change[0],
-        y=y,
-        text=state_change[1],
-        showarrow=True,
-        arrowhead=7,
-        ax=0,
-        ay=-75,
+
+def plot(df: pd.DataFrame, state_changes: list, target_apogee: float, max_points: int = 10000):
+    """
+    :param max_points: the most data points to draw, longer logs are thinned out (see log_analysis.downsample)
+    """
+    altitudes = df["altitude"].dropna()
+    df = downsample(df, max_points)
+
+    # Create traces for Altitude and Acceleration
+    trace_altitude = go.Scatter(
+        x=df.index, y=df["altitude"], mode="lines", name="Altitude", line=dict(color="blue")
+    )
+    trace_accel = go.Scatter(
+        x=df.index,
+        y=df["acceleration"],
+        mode="lines",
+        name="Acceleration",
+        line=dict(color="red"),
+    )
+    trace_predicted_apogee = go.Scatter(
+        x=df.index,
+        y=df["predicted_apogee"],
+        mode="lines",
+        name="Predicted Apogee",
+        line=dict(color="green"),
+    )
+    trace_predicted_apogee0 = go.Scatter(
+        x=df.index,
+        y=df["predicted_apogee0"],
+        mode="lines",
+        name="Predicted Apogee0",
+        line=dict(color="green"),
+    )
+    trace_predicted_apogee1 = go.Scatter(
+        x=df.index,
+        y=df["predicted_apogee1"],
+        mode="lines",
+        name="Predicted Apogee1",
+        line=dict(color="green"),
+    )
+    trace_servo_control = go.Scatter(
+        x=df.index,
+        y=df["servo_control"],
+        mode="lines",
+        name="Servo Control",
+        line=dict(color="purple"),
+    )
+    trace_average_altitude = go.Scatter(
+        x=df.index,
+        y=df["average_altitude"],
+        mode="lines",
+        name="Average Altitude",
+        line=dict(color="orange"),
+        visible="legendonly",
     )
 
-# Show the plot
-fig.show()
+    # Create layout
+    layout = go.Layout(
+        title="Simulation Data Over Time",
+        xaxis=dict(title="Time"),
+        yaxis=dict(title="Simulation Data"),
+    )
+
+    # Create figure
+    fig = go.Figure(
+        data=[
+            trace_altitude,
+            trace_accel,
+            trace_predicted_apogee,
+            trace_predicted_apogee0,
+            trace_predicted_apogee1,
+            trace_servo_control,
+            trace_average_altitude,
+        ],
+        layout=layout,
+    )
+
+    if target_apogee is not None:
+        fig.add_hline(
+            y=target_apogee,
+            line_dash="dot",
+            line_color="green",
+            annotation_text="Target Apogee",
+        )
+
+    # annotate the state changes on the altitude plot
+    for state_change in state_changes:
+        # The last altitude logged before the state change
+        y = altitudes.asof(state_change[0])
+        fig.add_annotation(
+            x=state_change[0],
+            y=y,
+            text=state_change[1],
+            showarrow=True,
+            arrowhead=7,
+            ax=0,
+            ay=-75,
+        )
+
+    # Show the plot
+    fig.show()
+
+
+if __name__ == "__main__":
+    catalog = LogCatalog()
+    # Read the log file
+    if len(sys.argv) < 2:
+        filename = catalog.newest()
+        if filename is None:
+            sys.exit(f"There are no logs in {catalog.log_folder}")
+    else:
+        filename = sys.argv[1]
+
+    print(f"Reading log file: {filename}")
+
+    # Parsed once, then loaded from the cache (see log_catalog.py)
+    df, state_changes, target_apogee = catalog.load(filename)
+
+    print(df)
+
+    plot(df, state_changes, target_apogee)
@@ -0,0 +1,185 @@
+"""
+Checks that the data path from the IMU to the servo doesn't allocate memory that builds up during
+a flight, which is what sets off the garbage collector in the middle of the burn.
+
+Run as `python -m benchmarks.allocations` from the repo root. A recorded flight is written into the
+ring buffer of a real MSCLInterface (on the mscl stand-in) in batches like the IMU process would,
+and Airbrakes.update pops it and runs the states on it. With tracemalloc on, it counts:
+
+- the memory blocks still allocated after the flight that weren't before, from the AirbrakeSystem code
+- the biggest amount of memory allocated at once during an update
+- the updates that handled data points that weren't from the pool (see data.py)
+- the garbage collections that ran during the flight
+
+and exits with an error if any of them is over its budget. By default nothing is logged, like
+main.py with the data logs turned off. --logging sets up the logs like main.py, to see what they cost.
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import contextlib
+import gc
+import io
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from .standins import install
+
+install()
+
+from AirbrakeSystem import Airbrakes, debug  # noqa: E402
+from AirbrakeSystem.hardware.MSCLInterface import MSCLInterface  # noqa: E402
+
+from . import synthetic  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AIRBRAKE_SYSTEM = os.path.join(REPO_ROOT, "AirbrakeSystem")
+
+# Data points the IMU writes between two updates, about 10 ms worth at 1 kHz
+BATCH_SIZE = 10
+# Seconds on the pad before launch. The pool of data points has to have gone around once before
+# measuring, so that everything that is made once has been made.
+PAD_TIME = 45.0
+
+# Budgets for a whole flight of about 5000 data points
+MAX_RETAINED_BLOCKS = 100
+MAX_UPDATE_PEAK_BYTES = 16 * 1024
+MAX_NEW_DATA_POINTS = 0
+MAX_COLLECTIONS = 0
+
+
+def make_airbrakes() -> tuple[Airbrakes, MSCLInterface]:
+    with contextlib.redirect_stdout(io.StringIO()):
+        airbrakes = Airbrakes(mock_servo=False, mock_imu=True, simulator="native")
+    interface = MSCLInterface("/dev/null", open(os.devnull, "w"), open(os.devnull, "w"))
+    atexit.register(interface.data_buffer.close)
+    airbrakes.interface = interface
+    return airbrakes, interface
+
+
+def fly(airbrakes: Airbrakes, interface: MSCLInterface, data_points: list) -> dict:
+    """
+    Feeds the data points through the ring buffer and updates after every batch
+    :return: the counts, see the module docstring
+    """
+    buffer = interface.data_buffer
+    pool_ids = {id(data_point) for data_point in interface.data_point_pool.data_points}
+    warm_up = interface.data_point_pool.size + 100
+
+    def feed(batch):
+        for data_point in batch:
+            buffer.push(data_point.accel, data_point.timestamp, data_point.altitude, 0.0, data_point.received_time)
+
+    # Traced from the start, so that the values replaced in the pool were traced too
+    tracemalloc.start()
+    feed(data_points[:warm_up])
+    while buffer.pending():
+        airbrakes.update()
+    if type(airbrakes.state).__name__ != "StandbyState":
+        raise RuntimeError("Launched during the warm up, the pad time is too short")
+
+    collections = [0]
+
+    def count_collections(phase, info):
+        if phase == "start":
+            collections[0] += 1
+
+    new_data_points = 0
+    update_peak = 0
+    before = tracemalloc.take_snapshot()
+    # Taking the snapshot makes a lot of objects, so the collector starts over after it
+    gc.collect()
+    gc.callbacks.append(count_collections)
+    try:
+        for start in range(warm_up, len(data_points), BATCH_SIZE):
+            feed(data_points[start : start + BATCH_SIZE])
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            airbrakes.update()
+            _, peak = tracemalloc.get_traced_memory()
+            update_peak = max(update_peak, peak - current)
+            if id(airbrakes.last_data_point) not in pool_ids:
+                new_data_points += 1
+    finally:
+        gc.callbacks.remove(count_collections)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    only_airbrakes = [tracemalloc.Filter(True, os.path.join(AIRBRAKE_SYSTEM, "*"))]
+    differences = after.filter_traces(only_airbrakes).compare_to(before.filter_traces(only_airbrakes), "lineno")
+    return {
+        "data_points": len(data_points) - warm_up,
+        "state": type(airbrakes.state).__name__,
+        "retained_blocks": sum(max(difference.count_diff, 0) for difference in differences),
+        "retained": [difference for difference in differences if difference.count_diff > 0],
+        "update_peak": update_peak,
+        "new_data_points": new_data_points,
+        "collections": collections[0],
+    }
+
+
+@contextlib.contextmanager
+def main_logging():
+    """
+    Logs to a temporary folder the same way main.py does
+    """
+    import main as airbrakes_main
+
+    log_directory = tempfile.mkdtemp()
+    shutil.copy(os.path.join(REPO_ROOT, "logging_config.json"), log_directory)
+    original_directory = os.getcwd()
+    os.chdir(log_directory)
+    listener = airbrakes_main.setup_logging("csv", console=False)
+    try:
+        yield airbrakes_main
+    finally:
+        listener.stop()
+        os.chdir(original_directory)
+        shutil.rmtree(log_directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Counts the allocations of the data path during a flight")
+    parser.add_argument("--logging", action="store_true", help="Log like main.py and report what it costs")
+    args = parser.parse_args()
+
+    debug.set_level(debug.OFF)
+    data_points = synthetic.make_flight(pad_time=PAD_TIME)
+    airbrakes, interface = make_airbrakes()
+    if args.logging:
+        with main_logging() as airbrakes_main:
+            airbrakes_main.CSVFormatter.airbrakes = airbrakes
+            airbrakes_main.AirbrakesQueueHandler.airbrakes = airbrakes
+            results = fly(airbrakes, interface, data_points)
+    else:
+        results = fly(airbrakes, interface, data_points)
+
+    print(f"Flew {results['data_points']} data points in batches of {BATCH_SIZE}, ended in {results['state']}")
+    checks = [
+        ("retained blocks", results["retained_blocks"], MAX_RETAINED_BLOCKS),
+        ("biggest update, bytes", results["update_peak"], MAX_UPDATE_PEAK_BYTES),
+        ("updates with new data points", results["new_data_points"], MAX_NEW_DATA_POINTS),
+        ("garbage collections", results["collections"], MAX_COLLECTIONS),
+    ]
+    over_budget = []
+    for name, value, budget in checks:
+        status = "" if value <= budget else "  OVER"
+        if status:
+            over_budget.append(name)
+        print(f"{name:<32}{value:>10}{budget:>10}{status}")
+    for difference in results["retained"][:10]:
+        print(f"  {difference}")
+
+    # The logs are expected to allocate, they are only reported
+    if over_budget and not args.logging:
+        print(f"Over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Checks that nothing gets written to the console during a flight in flight mode (main.py --quiet).
+
+Run as `python -m benchmarks.flight_mode_output` from the repo root. Flies the native simulation
+through Airbrakes with the same logging setup as main.py, counting every write to stdout and
+stderr, and exits with an error if there were any.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+
+from .standins import install
+
+install()
+
+import main as airbrakes_main  # noqa: E402
+from AirbrakeSystem import Airbrakes, debug  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CountingStream:
+    """
+    Counts the writes to a stream, and keeps what was written to show it at the end
+    """
+
+    def __init__(self):
+        self.writes = 0
+        self.text = []
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        self.text.append(text)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def fly_in_flight_mode() -> tuple[int, int, CountingStream]:
+    """
+    :return: the number of data points, and the writes to stdout and stderr while flying
+    """
+    stdout = CountingStream()
+    stderr = CountingStream()
+    original_stdout, original_stderr = sys.stdout, sys.stderr
+    original_directory = os.getcwd()
+
+    # setup_logging reads the config and writes the logs relative to the working directory
+    log_directory = tempfile.mkdtemp()
+    shutil.copy(os.path.join(REPO_ROOT, "logging_config.json"), log_directory)
+    os.chdir(log_directory)
+
+    # Swapped before logging is set up, so a console handler would write to these too
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        debug.set_level(debug.OFF)
+        listener = airbrakes_main.setup_logging("csv", console=False)
+        airbrakes = Airbrakes(mock_servo=True, mock_imu=True, simulator="native")
+        airbrakes_main.CSVFormatter.airbrakes = airbrakes
+        airbrakes_main.AirbrakesQueueHandler.airbrakes = airbrakes
+
+        data_points = 0
+        while not airbrakes.ready_to_shutdown:
+            airbrakes.update()
+            data_points += 1
+        airbrakes.shutdown()
+        listener.stop()
+    finally:
+        sys.stdout, sys.stderr = original_stdout, original_stderr
+        os.chdir(original_directory)
+        shutil.rmtree(log_directory, ignore_errors=True)
+
+    return data_points, stdout.writes + stderr.writes, stdout if stdout.writes else stderr
+
+
+def main():
+    data_points, writes, stream = fly_in_flight_mode()
+    print(f"Flew {data_points} updates in flight mode, {writes} console writes")
+    if writes:
+        print("Written to the console:")
+        print("".join(stream.text[:20]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Benchmarks of the hot paths of the airbrakes, compared against stored baselines.
+
+Run as `python -m benchmarks.hot_paths` from the repo root. Runs offline on any Linux box, the
+hardware libraries are replaced by stand-ins (see standins.py) when they aren't installed.
+
+    python -m benchmarks.hot_paths                 # run everything and compare to the baselines
+    python -m benchmarks.hot_paths -k lookup       # only the benchmarks with "lookup" in the name
+    python -m benchmarks.hot_paths --save          # store the results as the new baselines
+    python -m benchmarks.hot_paths --check         # exit with an error if anything got slower
+
+Each benchmark is a setup function that returns (function to time, number of operations per call),
+and the results are reported as time per operation. The baselines depend on the machine, so only
+compare results from the same one. benchmarks/import_time.py covers the import time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from .standins import install
+
+install()
+
+from AirbrakeSystem import lookup_table_control  # noqa: E402
+from AirbrakeSystem.airbrakes import Airbrakes  # noqa: E402
+from AirbrakeSystem.log_writer import LogWriter  # noqa: E402
+from AirbrakeSystem.state import StandbyState  # noqa: E402
+
+from . import synthetic  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Results more than this fraction away from the baseline are reported as slower or faster
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPEAT = 5
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+@benchmark("apogee_grid.estimate")
+def setup_apogee_grid_estimate():
+    grid = lookup_table_control.load_apogee_grid()
+    inputs = [(20.0 + (i * 7.3) % 230.0, (i % 11) / 10.0) for i in range(1000)]
+
+    def run():
+        estimate = grid.estimate
+        for velocity, extension in inputs:
+            estimate(velocity, extension)
+
+    return run, len(inputs)
+
+
+@benchmark("apogee_model.estimate")
+def setup_apogee_model_estimate():
+    from Scripts.fit_apogee_model import fit_apogee_model
+
+    # Fitted here, since the one for the repo's table is too far off it to be saved. How fast it
+    # estimates doesn't depend on how close it is.
+    model = fit_apogee_model(lookup_table_control.load_apogee_grid())
+    # The servo only moves every so often in flight, so the extension is held for a while at a time
+    inputs = [(20.0 + (i * 7.3) % 230.0, float(i // 100 % 2)) for i in range(1000)]
+
+    def run():
+        estimate = model.estimate
+        for velocity, extension in inputs:
+            estimate(velocity, extension)
+
+    return run, len(inputs)
+
+
+@benchmark("bang_bang_table.estimate")
+def setup_bang_bang_estimate():
+    table = lookup_table_control.load_bang_bang_table()
+    velocities = [(i * 7.3) % 260.0 for i in range(1000)]
+
+    def run():
+        estimate = table.estimate
+        for velocity in velocities:
+            estimate(velocity)
+
+    return run, len(velocities)
+
+
+def make_airbrakes() -> Airbrakes:
+    """
+    Airbrakes with the real servo code (on the GPIO stand-in) and no IMU
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Airbrakes(mock_servo=False, mock_imu=True, simulator="native")
+
+
+@benchmark("standby_state.process")
+def setup_standby_process():
+    airbrakes = make_airbrakes()
+    standby_state = StandbyState(airbrakes)
+    data_points = synthetic.make_pad_data_points(1000)
+
+    def run():
+        process = standby_state.process
+        for data_point in data_points:
+            process(data_point)
+
+    return run, len(data_points)
+
+
+@benchmark("airbrakes.update")
+def setup_airbrakes_update():
+    data_points = synthetic.make_flight()
+
+    def run():
+        # A new one every time, since the flight goes through all the states
+        airbrakes = make_airbrakes()
+        airbrakes.interface = synthetic.RecordedInterface(data_points)
+        with contextlib.redirect_stdout(io.StringIO()):
+            while not airbrakes.ready_to_shutdown:
+                airbrakes.update()
+
+    return run, len(data_points)
+
+
+@benchmark("msclinterface.write_data_to_file")
+def setup_write_data_to_file():
+    from AirbrakeSystem.hardware.MSCLInterface import MSCLInterface
+
+    packets = synthetic.make_est_packets(synthetic.make_flight()[:1000])
+    interface = MSCLInterface("/dev/null", open(os.devnull, "w"), open(os.devnull, "w"))
+    # A big queue so that rows aren't dropped when the writer thread falls behind
+    interface.est_log_writer = LogWriter(open(os.devnull, "w"), max_queue_size=len(packets) * 100)
+    interface.est_log_writer.start()
+    atexit.register(interface.data_buffer.close)
+    atexit.register(interface.est_log_writer.stop)
+
+    def run():
+        write_data_to_file = interface._write_data_to_file
+        for packet in packets:
+            write_data_to_file(packet)
+        # Keeps the ring buffer from counting everything as an overrun
+        interface.data_buffer.drain()
+
+    return run, len(packets)
+
+
+@benchmark("lookup_tables.load_compiled")
+def setup_load_compiled():
+    def run():
+        lookup_table_control.load_apogee_grid()
+        lookup_table_control.load_bang_bang_table()
+
+    return run, 1
+
+
+@benchmark("lookup_tables.load_csv")
+def setup_load_csv():
+    def run():
+        lookup_table_control.ApogeeGrid.from_lookup_table(lookup_table_control.load_sorted_pid_lookup_table())
+        lookup_table_control.BangBangTable.from_lookup_table(lookup_table_control.load_bang_bang_lookup_table())
+
+    return run, 1
+
+
+@benchmark("log_analysis.load_flight_log")
+def setup_load_flight_log():
+    from Scripts.log_analysis import load_flight_log
+
+    log_path = os.path.join(tempfile.mkdtemp(), "flight.log")
+    synthetic.write_data_log(log_path, synthetic.make_flight())
+
+    def run():
+        load_flight_log(log_path)
+
+    return run, 1
+
+
+def run_benchmark(name: str, repeat: int = DEFAULT_REPEAT) -> dict:
+    """
+    :return: the median and min time per operation in nanoseconds, and how many times it ran per repeat
+    """
+    function, operations = BENCHMARKS[name]()
+    timer = timeit.Timer(function)
+    # Enough runs per repeat to take at least 0.2 seconds
+    number, _ = timer.autorange()
+    times = [time / number / operations * 1e9 for time in timer.repeat(repeat, number)]
+    return {"median_ns": statistics.median(times), "min_ns": min(times), "number": number}
+
+
+def load_baselines(file_path: str = BASELINES_PATH) -> dict:
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, "r") as file:
+        return json.load(file)
+
+
+def save_baselines(results: dict, file_path: str = BASELINES_PATH) -> None:
+    baselines = load_baselines(file_path)
+    baselines.setdefault("benchmarks", {}).update(results)
+    baselines["machine"] = f"{platform.machine()} {platform.processor() or platform.platform()}"
+    baselines["python"] = platform.python_version()
+    with open(file_path, "w") as file:
+        json.dump(baselines, file, indent=4, sort_keys=True)
+        file.write("\n")
+
+
+def format_time(nanoseconds: float) -> str:
+    if nanoseconds < 1e3:
+        return f"{nanoseconds:.1f} ns"
+    if nanoseconds < 1e6:
+        return f"{nanoseconds / 1e3:.2f} us"
+    return f"{nanoseconds / 1e6:.2f} ms"
+
+
+def compare(results: dict, baselines: dict, threshold: float) -> tuple[list[str], list[str]]:
+    """
+    :return: the lines of the report, and the names of the benchmarks that got slower
+    """
+    lines = [f"{'benchmark':<36}{'median/op':>14}{'baseline':>14}{'change':>10}"]
+    slower = []
+    for name, result in results.items():
+        baseline = baselines.get("benchmarks", {}).get(name)
+        if baseline is None:
+            lines.append(f"{name:<36}{format_time(result['median_ns']):>14}{'-':>14}{'new':>10}")
+            continue
+
+        ratio = result["median_ns"] / baseline["median_ns"]
+        status = ""
+        if ratio > 1 + threshold:
+            status = "  SLOWER"
+            slower.append(name)
+        elif ratio < 1 - threshold:
+            status = "  faster"
+        lines.append(
+            f"{name:<36}{format_time(result['median_ns']):>14}{format_time(baseline['median_ns']):>14}"
+            f"{(ratio - 1) * 100:>+9.0f}%{status}"
+        )
+    return lines, slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the hot paths of the airbrakes")
+    parser.add_argument("-k", "--filter", default="", help="Only run the benchmarks with this in their name")
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT, help="Number of timed repeats")
+    parser.add_argument("--save", action="store_true", help="Store the results as the baselines")
+    parser.add_argument("--check", action="store_true", help="Exit with an error if a benchmark got slower")
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=DEFAULT_THRESHOLD, help="Fraction of change that gets reported"
+    )
+    parser.add_argument("--baselines", default=BASELINES_PATH, help="File the baselines are stored in")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = {}
+    for name in names:
+        results[name] = run_benchmark(name, args.repeat)
+        print(f"{name}: {format_time(results[name]['median_ns'])} per operation", file=sys.stderr)
+
+    baselines = load_baselines(args.baselines)
+    lines, slower = compare(results, baselines, args.threshold)
+    print("\n".join(lines))
+    if baselines:
+        print(f"Baselines from {baselines.get('machine')}, python {baselines.get('python')}")
+
+    if args.save:
+        save_baselines(results, args.baselines)
+        print(f"Saved the baselines to {args.baselines}")
+
+    if args.check and slower:
+        print(f"Slower than the baseline: {', '.join(slower)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
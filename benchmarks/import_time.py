@@ -0,0 +1,63 @@
+"""
+Measures how long `import AirbrakeSystem` takes in a fresh interpreter.
+
+Run as `python -m benchmarks.import_time` from the repo root. Exits with an error if the median
+import time is over the budget, e.g. because something started loading files at import again.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fresh interpreters that only import AirbrakeSystem and print how long it took in nanoseconds
+IMPORT_SCRIPT = (
+    "import time; start = time.perf_counter_ns(); import AirbrakeSystem; "
+    "print(time.perf_counter_ns() - start)"
+)
+
+DEFAULT_RUNS = 10
+# Generous enough for the Pi, but far below what loading the lookup tables at import used to cost
+DEFAULT_BUDGET_MS = 150.0
+
+
+def measure_import_time(runs: int = DEFAULT_RUNS) -> list[float]:
+    """
+    Imports AirbrakeSystem in a new interpreter `runs` times
+    :return: the import time of each run in milliseconds
+    """
+    times = []
+    for _ in range(runs):
+        # Run from somewhere other than the repo root to make sure nothing depends on the working directory
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT],
+            cwd=os.path.dirname(REPO_ROOT),
+            env={**os.environ, "PYTHONPATH": REPO_ROOT},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(int(result.stdout.strip()) / 1e6)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the import time of AirbrakeSystem")
+    parser.add_argument("-n", "--runs", type=int, default=DEFAULT_RUNS, help="Number of imports to time")
+    parser.add_argument("-b", "--budget", type=float, default=DEFAULT_BUDGET_MS, help="Budget in milliseconds")
+    args = parser.parse_args()
+
+    times = measure_import_time(args.runs)
+    median = statistics.median(times)
+    print(f"import AirbrakeSystem: median {median:.1f} ms, min {min(times):.1f} ms, max {max(times):.1f} ms")
+
+    if median > args.budget:
+        print(f"Import time is over the budget of {args.budget:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
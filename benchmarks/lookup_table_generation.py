@@ -0,0 +1,245 @@
+"""
+Checks that Scripts/generate_lookup_table.py makes every lookup table from the command line.
+
+Run as `python -m benchmarks.lookup_table_generation` from the repo root. It runs the script's main
+with `-p --simulator native` on a small grid, written to a temporary folder, and checks that the
+tables and the apogee model come out, load, and make physical sense. The bang bang table is also
+made from the log of a flight flown through Airbrakes with main.py's logging (--log), and both
+ways are checked against working it out the slow way, one velocity at a time. --adaptive has to
+come within its tolerance of the evenly spaced table with fewer simulations. Last, the apogee model
+fitted to the repo's table is too far off it, so it must be neither saved nor loaded.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import csv
+import glob
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from .standins import install
+
+install()
+
+import main as airbrakes_main  # noqa: E402
+from AirbrakeSystem import Airbrakes, debug  # noqa: E402
+from AirbrakeSystem.apogee_model import MAX_RESIDUAL, ApogeeModel  # noqa: E402
+from AirbrakeSystem.lookup_table_control import (  # noqa: E402
+    PID_LOOKUP_TABLE_PATH,
+    ApogeeGrid,
+    BangBangTable,
+    load_compiled_table,
+)
+from AirbrakeSystem.mock.NativeSimulation import NativeDeploymentSimulator  # noqa: E402
+from Scripts import generate_lookup_table  # noqa: E402
+from Scripts.fit_apogee_model import fit_and_save  # noqa: E402
+from Scripts.log_catalog import DEFAULT_LOG_FOLDER, LogCatalog  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Small enough to simulate in a few seconds
+MAX_VELOCITY = 6
+
+
+def generate(*arguments: str) -> tuple[str, str]:
+    """
+    Runs generate_lookup_table with the arguments, writing to a new temporary folder
+    :return: the folder, and what the script printed
+    """
+    output_directory = tempfile.mkdtemp()
+    args = generate_lookup_table.parser.parse_args(
+        ["--simulator", "native", "--no_checkpoint", "-o", output_directory, *arguments]
+    )
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        generate_lookup_table.main(args)
+    return output_directory, output.getvalue()
+
+
+def get_changes_in_altitude_slowly(altitudes: list, velocities: list) -> list:
+    """
+    What get_changes_in_altitude works out all at once, one velocity at a time
+    :return: [velocity, change in altitude] for every velocity on the way up
+    """
+    apogee_index = next(
+        (i for i in range(1, len(altitudes)) if altitudes[i] <= altitudes[i - 1]), len(altitudes) - 1
+    )
+    rows = []
+    for velocity in velocities:
+        if velocity <= 0:
+            break
+        deploy_index = next((i for i in range(apogee_index + 1) if velocities[i] <= velocity), apogee_index)
+        rows.append([velocity, altitudes[apogee_index] - altitudes[deploy_index]])
+    return rows
+
+
+def check_bang_bang_csv(name: str, output_directory: str, altitudes: list, velocities: list) -> list:
+    """
+    :return: what went wrong, if anything
+    """
+    with open(os.path.join(output_directory, "bang_bang_lookup_table.csv"), "r") as file:
+        rows = [[float(value) for value in row] for row in list(csv.reader(file))[1:]]
+    expected = get_changes_in_altitude_slowly(altitudes, velocities)
+    if len(rows) != len(expected):
+        return [f"{name}: the bang bang table has {len(rows)} rows instead of {len(expected)}"]
+    worst = max(abs(row[1] - expected_row[1]) for row, expected_row in zip(rows, expected))
+    if worst > 1e-9 or any(row[0] != expected_row[0] for row, expected_row in zip(rows, expected)):
+        return [f"{name}: the bang bang table is off by up to {worst} m"]
+    return []
+
+
+def fly_logged_flight() -> str:
+    """
+    Flies the native simulation through Airbrakes, logging the same way as main.py
+    :return: the path of the data log
+    """
+    log_directory = tempfile.mkdtemp()
+    # setup_logging reads the config and writes the logs relative to the working directory
+    shutil.copy(os.path.join(REPO_ROOT, "logging_config.json"), log_directory)
+    original_directory = os.getcwd()
+    os.chdir(log_directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            debug.set_level(debug.OFF)
+            listener = airbrakes_main.setup_logging("csv", console=False)
+            airbrakes = Airbrakes(mock_servo=True, mock_imu=True, simulator="native")
+            airbrakes_main.CSVFormatter.airbrakes = airbrakes
+            airbrakes_main.AirbrakesQueueHandler.airbrakes = airbrakes
+            while not airbrakes.ready_to_shutdown:
+                airbrakes.update()
+            airbrakes.shutdown()
+            listener.stop()
+    finally:
+        os.chdir(original_directory)
+    (log_path,) = glob.glob(os.path.join(log_directory, "logs", "*.log"))
+    return log_path
+
+
+def check_tables(name: str, output_directory: str) -> list:
+    """
+    :return: what went wrong, if anything
+    """
+    problems = []
+    grid = ApogeeGrid.load(os.path.join(output_directory, "lookup_table.npy"))
+    bang_bang_table = BangBangTable.load(os.path.join(output_directory, "bang_bang_lookup_table.npy"))
+    _, model_header = load_compiled_table(os.path.join(output_directory, "apogee_model.npy"), "apogee_model")
+    if model_header["residuals"]["max"] > MAX_RESIDUAL:
+        problems.append(f"{name}: saved an apogee model that is {model_header['residuals']['max']:.1f} m off")
+
+    if grid.velocities[0] != 1.0 or grid.velocities[-1] != MAX_VELOCITY:
+        problems.append(f"{name}: the PID table goes from {grid.velocities[0]} to {grid.velocities[-1]} m/s")
+    if grid.extensions[0] != 0.0 or grid.extensions[-1] != 1.0:
+        problems.append(f"{name}: the PID table has extensions {grid.extensions.tolist()}")
+    # Faster goes higher, and more airbrake goes less high
+    if not (np.diff(grid.changes_in_altitude, axis=0) > 0).all():
+        problems.append(f"{name}: the change in altitude doesn't go up with velocity")
+    if not (np.diff(grid.changes_in_altitude, axis=1) <= 0).all():
+        problems.append(f"{name}: the change in altitude doesn't go down with extension")
+
+    # From burnout, which is over 100 m/s for the nominal rocket, down to apogee
+    if bang_bang_table.velocities[-1] < 100.0 or bang_bang_table.velocities[0] > 1.0:
+        problems.append(
+            f"{name}: the bang bang table goes from {bang_bang_table.velocities[0]:.1f} to "
+            f"{bang_bang_table.velocities[-1]:.1f} m/s"
+        )
+    if not (np.diff(bang_bang_table.changes_in_altitude) >= 0).all():
+        problems.append(f"{name}: the bang bang change in altitude doesn't go up with velocity")
+
+    print(
+        f"{name:<12}{len(grid.velocities)}x{len(grid.extensions)} PID table, "
+        f"{len(bang_bang_table.velocities)} row bang bang table"
+    )
+    return problems
+
+
+def check_adaptive(even_directory: str, adaptive_directory: str) -> list:
+    """
+    :return: what went wrong, if anything
+    """
+    problems = []
+    even_grid = ApogeeGrid.load(os.path.join(even_directory, "lookup_table.npy"))
+    adaptive_grid = ApogeeGrid.load(os.path.join(adaptive_directory, "lookup_table.npy"))
+    if adaptive_grid.changes_in_altitude.size >= even_grid.changes_in_altitude.size:
+        problems.append(
+            f"--adaptive: simulated {adaptive_grid.changes_in_altitude.size} cells, the evenly spaced table "
+            f"only needs {even_grid.changes_in_altitude.size}"
+        )
+    velocities, extensions = np.meshgrid(even_grid.velocities, even_grid.extensions, indexing="ij")
+    error = np.abs(adaptive_grid.estimate_batch(velocities, extensions) - even_grid.changes_in_altitude).max()
+    if error > generate_lookup_table.DEFAULT_TOLERANCE:
+        problems.append(f"--adaptive: off from the evenly spaced table by up to {error:.3f} m")
+    print(f"--adaptive is within {error:.3f} m of the evenly spaced table")
+    return problems
+
+
+def check_model_refused() -> list:
+    """
+    :return: what went wrong, if anything
+    """
+    problems = []
+    model_path = os.path.join(tempfile.mkdtemp(), "apogee_model.npy")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fit_and_save(PID_LOOKUP_TABLE_PATH, model_path)
+        problems.append("the apogee model for the repo's table was saved, even though it's too far off")
+    except ValueError:
+        pass
+    if os.path.exists(model_path):
+        problems.append(f"a refused apogee model was written to {model_path}")
+
+    # Saved anyway, like the one that used to be in the repo
+    with contextlib.redirect_stdout(io.StringIO()):
+        fit_and_save(PID_LOOKUP_TABLE_PATH, model_path, max_residual=float("inf"))
+    try:
+        ApogeeModel.load(model_path)
+        problems.append("an apogee model that is too far off its table was loaded")
+    except ValueError:
+        pass
+    print(f"the apogee model of the repo's table is refused, it's over {MAX_RESIDUAL:g} m off")
+    return problems
+
+
+def main():
+    problems = []
+    even_directory, _ = generate("-p", "--max_velocity", str(MAX_VELOCITY))
+    problems += check_tables("-p", even_directory)
+    problems += check_bang_bang_csv("-p", even_directory, *NativeDeploymentSimulator().simulate_coast())
+
+    # The log gets indexed in the logs folder of the repo, see log_catalog.py
+    cache_folder = LogCatalog().cache_folder
+    had_cache = os.path.isdir(cache_folder)
+    log_path = fly_logged_flight()
+    try:
+        output_directory, _ = generate("-p", "--max_velocity", str(MAX_VELOCITY), "--log", log_path)
+        problems += check_tables("--log", output_directory)
+        altitudes, velocities = generate_lookup_table.load_control_data_points(log_path)
+        problems += check_bang_bang_csv("--log", output_directory, altitudes.tolist(), velocities.tolist())
+    finally:
+        shutil.rmtree(os.path.dirname(os.path.dirname(log_path)))
+        if had_cache:
+            # Forgets the log now that it's gone
+            LogCatalog().scan()
+        else:
+            shutil.rmtree(cache_folder, ignore_errors=True)
+            with contextlib.suppress(OSError):
+                os.rmdir(DEFAULT_LOG_FOLDER)
+
+    adaptive_directory, _ = generate("-p", "--adaptive", "--max_velocity", str(MAX_VELOCITY))
+    problems += check_tables("--adaptive", adaptive_directory)
+    problems += check_adaptive(even_directory, adaptive_directory)
+    problems += check_model_refused()
+
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Checks that the replay interface (AirbrakeSystem/mock/ReplayMSCLInterface.py) reads every kind of
+est IMU log: the CSV with a timestamp column that MSCLInterface writes now, the CSV from before the
+timestamp column was added, and the binary log.
+
+Run as `python -m benchmarks.replay_logs` from the repo root. A flight is written in each format,
+replayed as fast as possible through Airbrakes, and checked to have come back with every data point
+and to have gone through the flight to FreefallState. A log with rows that can't be read has to
+raise instead of replaying nothing.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+from .standins import install
+
+install()
+
+from AirbrakeSystem import Airbrakes, debug  # noqa: E402
+from AirbrakeSystem.log_writer import LogWriter  # noqa: E402
+from AirbrakeSystem.mock.ReplayMSCLInterface import read_log  # noqa: E402
+
+from . import synthetic  # noqa: E402
+
+
+def write_binary_est_log(file_path: str, data_points: list) -> None:
+    with open(file_path, "wb") as file:
+        log_writer = LogWriter(file, binary=True)
+        log_writer.start()
+        log_writer.write_row(["timestamp"] + synthetic.EST_CHANNELS)
+        for data_point in data_points:
+            channels = {name: 0.125 for name in synthetic.EST_CHANNELS}
+            channels["estPressureAlt"] = data_point.altitude
+            channels["estLinearAccelX"] = -data_point.accel
+            log_writer.write_row([data_point.timestamp] + [channels[name] for name in synthetic.EST_CHANNELS])
+        log_writer.stop()
+
+
+def replay(log_path: str, sample_rate: float) -> tuple[str, int]:
+    """
+    :return: the state the airbrakes ended in and how many data points they got
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        airbrakes = Airbrakes(
+            mock_servo=True,
+            mock_imu=True,
+            simulator="replay",
+            replay_log=log_path,
+            replay_speed=0,
+            replay_rate=sample_rate,
+        )
+        interface = airbrakes.interface
+        while not airbrakes.ready_to_shutdown:
+            airbrakes.update()
+        airbrakes.shutdown()
+    return type(airbrakes.state).__name__, interface.replayed
+
+
+def check_format(name: str, log_path: str, data_points: list, sample_rate: float, exact_timestamps: bool) -> list:
+    """
+    :return: what went wrong, if anything
+    """
+    problems = []
+    records = [record for chunk in read_log(log_path, sample_rate) for record in chunk]
+    if len(records) != len(data_points):
+        problems.append(f"{name}: read {len(records)} of {len(data_points)} rows")
+    else:
+        first_timestamp = data_points[0].timestamp
+        for record, data_point in zip(records, data_points):
+            if record["accel"] != -data_point.accel or record["altitude"] != data_point.altitude:
+                problems.append(f"{name}: the values of the row at {data_point.timestamp} changed")
+                break
+            # Without timestamps they start at 0 and only the spacing is the same
+            expected = data_point.timestamp if exact_timestamps else data_point.timestamp - first_timestamp
+            if abs(int(record["timestamp"]) - expected) > 1000:
+                problems.append(f"{name}: row timestamp {record['timestamp']} should be {expected}")
+                break
+
+    state, replayed = replay(log_path, sample_rate)
+    print(f"{name:<28}{len(records):>8} rows{replayed:>8} replayed   ended in {state}")
+    if state != "FreefallState":
+        problems.append(f"{name}: ended in {state}")
+    if replayed != len(data_points):
+        problems.append(f"{name}: replayed {replayed} of {len(data_points)} data points")
+    return problems
+
+
+def main():
+    debug.set_level(debug.OFF)
+    data_points = synthetic.make_flight()
+    sample_rate = 1e9 / (data_points[1].timestamp - data_points[0].timestamp)
+    folder = tempfile.mkdtemp()
+
+    problems = []
+    csv_path = os.path.join(folder, "flight_estLORDlog.csv")
+    synthetic.write_est_log(csv_path, data_points)
+    problems += check_format("CSV", csv_path, data_points, sample_rate, exact_timestamps=True)
+
+    old_csv_path = os.path.join(folder, "old_estLORDlog.csv")
+    synthetic.write_est_log(old_csv_path, data_points, timestamps=False)
+    problems += check_format("CSV without timestamps", old_csv_path, data_points, sample_rate, exact_timestamps=False)
+
+    binary_path = os.path.join(folder, "flight_estLORDlog.ablog")
+    write_binary_est_log(binary_path, data_points)
+    problems += check_format("binary", binary_path, data_points, sample_rate, exact_timestamps=True)
+
+    unreadable_path = os.path.join(folder, "unreadable_estLORDlog.csv")
+    with open(unreadable_path, "w") as file:
+        file.write("timestamp," + ",".join(synthetic.EST_CHANNELS) + ",\n")
+        file.write("\n".join("not a number," + ",".join(["x"] * len(synthetic.EST_CHANNELS)) for _ in range(10)))
+    try:
+        list(read_log(unreadable_path))
+        problems.append("A log without a single readable row didn't raise")
+    except ValueError as error:
+        print(f"Unreadable log raised: {error}")
+
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Stand-ins for the hardware libraries (`mscl` and `RPi.GPIO`), so the hardware modules can be
+imported and benchmarked on a plain Linux box. They are only installed when the real library
+can't be imported, and don't talk to any hardware.
+"""
+
+import importlib
+import sys
+import types
+
+
+class FakeTimestamp:
+    def __init__(self, nanoseconds: int):
+        self._nanoseconds = nanoseconds
+
+    def nanoseconds(self) -> int:
+        return self._nanoseconds
+
+
+class FakeDataPoint:
+    """
+    Same methods as mscl.MipDataPoint that MSCLInterface uses
+    """
+
+    def __init__(self, channel_name: str, value: float):
+        self._channel_name = channel_name
+        self._value = value
+
+    def channelName(self) -> str:
+        return self._channel_name
+
+    def as_float(self) -> float:
+        return self._value
+
+
+class FakePacket:
+    """
+    Same methods as mscl.MipDataPacket that MSCLInterface uses
+    """
+
+    def __init__(self, timestamp: int, channels: dict):
+        self._timestamp = FakeTimestamp(timestamp)
+        self._data = [FakeDataPoint(name, value) for name, value in channels.items()]
+
+    def collectedTimestamp(self) -> FakeTimestamp:
+        return self._timestamp
+
+    def data(self) -> list:
+        return self._data
+
+
+class _FakeConnection:
+    @staticmethod
+    def Serial(port):
+        return _FakeConnection()
+
+
+class _FakeInertialNode:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def getDataPackets(self, timeout):
+        return []
+
+
+class _FakePWM:
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+
+    def start(self, duty_cycle):
+        pass
+
+    def ChangeDutyCycle(self, duty_cycle):
+        pass
+
+    def stop(self):
+        pass
+
+
+def _make_mscl() -> types.ModuleType:
+    mscl = types.ModuleType("mscl")
+    mscl.Connection = _FakeConnection
+    mscl.InertialNode = _FakeInertialNode
+    mscl.MipDataPackets = list
+    mscl.MipDataPacket = FakePacket
+    mscl.MipDataPoint = FakeDataPoint
+    return mscl
+
+
+def _make_gpio() -> types.ModuleType:
+    gpio = types.ModuleType("RPi.GPIO")
+    gpio.BOARD = "BOARD"
+    gpio.BCM = "BCM"
+    gpio.OUT = "OUT"
+    gpio.setmode = lambda mode: None
+    gpio.setwarnings = lambda enabled: None
+    gpio.setup = lambda pin, mode: None
+    gpio.cleanup = lambda *pins: None
+    gpio.PWM = _FakePWM
+    return gpio
+
+
+def install() -> list[str]:
+    """
+    Puts the stand-ins in sys.modules for the libraries that aren't installed
+    :return: the names of the modules that were replaced
+    """
+    installed = []
+    try:
+        importlib.import_module("mscl")
+    except ImportError:
+        sys.modules["mscl"] = _make_mscl()
+        installed.append("mscl")
+
+    try:
+        importlib.import_module("RPi.GPIO")
+    except ImportError:
+        rpi = types.ModuleType("RPi")
+        rpi.GPIO = _make_gpio()
+        sys.modules["RPi"] = rpi
+        sys.modules["RPi.GPIO"] = rpi.GPIO
+        installed.append("RPi.GPIO")
+
+    return installed
@@ -0,0 +1,124 @@
+"""
+Synthetic inputs for the benchmarks: a recorded flight from the native simulator, an interface that
+plays it back, IMU packets, and data and IMU logs in the same formats main.py writes.
+"""
+
+from __future__ import annotations
+
+from AirbrakeSystem.data import ABDataPoint
+from AirbrakeSystem.mock.NativeSimulation import FlightSimulation
+
+from .standins import FakePacket
+
+# Channels of a typical estimated data packet from the 3DMCX5-AR
+EST_CHANNELS = [
+    "estPressureAlt",
+    "estLinearAccelX",
+    "estLinearAccelY",
+    "estLinearAccelZ",
+    "estAngularRateX",
+    "estAngularRateY",
+    "estAngularRateZ",
+    "estOrientQuaternion",
+    "estFilterState",
+    "estFilterStatusFlags",
+]
+
+
+def make_flight(pad_time: float = 3.0, seed: int = 0) -> list[ABDataPoint]:
+    """
+    Flies the nominal rocket with noisy sensors and no airbrakes until it lands
+    """
+    simulation = FlightSimulation(pad_time=pad_time, acceleration_noise=0.5, altitude_noise=1.0, seed=seed)
+    data_points = []
+    while (data_point := simulation.step(0.0)) is not None:
+        data_points.append(data_point)
+    return data_points
+
+
+def make_pad_data_points(count: int) -> list[ABDataPoint]:
+    """
+    Data points of a rocket sitting on the pad
+    """
+    return [ABDataPoint(0.01 * (i % 7 - 3), i * 10_000_000, 0.0, 0.0) for i in range(count)]
+
+
+def make_est_packets(data_points: list[ABDataPoint]) -> list[FakePacket]:
+    packets = []
+    for data_point in data_points:
+        channels = {name: 0.125 for name in EST_CHANNELS}
+        channels["estPressureAlt"] = data_point.altitude
+        channels["estLinearAccelX"] = data_point.accel
+        packets.append(FakePacket(data_point.timestamp, channels))
+    return packets
+
+
+def write_data_log(file_path: str, data_points: list[ABDataPoint], target_apogee: float = 700.0) -> None:
+    """
+    Writes a data log like the one main.py makes with the CSV format, with the state changes
+    at about the right times and a prediction and servo command for every data point in control
+    """
+    control_start = next(i for i, data_point in enumerate(data_points) if data_point.accel > 20.0) + 170
+    apogee_index = max(range(len(data_points)), key=lambda i: data_points[i].altitude)
+    lines = ["", "", f"{data_points[0].timestamp},State Change,StandbyState"]
+    velocity = 0.0
+    for i, data_point in enumerate(data_points):
+        velocity += data_point.accel * 0.01
+        lines.append(f"{data_point.timestamp},Data point,{data_point.altitude},{data_point.accel},{velocity}")
+        if i == control_start - 170:
+            lines.append(f"{data_point.timestamp},State Change,LiftoffState")
+        elif i == control_start:
+            lines.append(f"{data_point.timestamp},Target Apogee,{target_apogee}")
+            lines.append(f"{data_point.timestamp},State Change,ControlState")
+        elif control_start < i < apogee_index:
+            lines.append(f"{data_point.timestamp},Predicted Apogee,{data_point.altitude + 50.0:.3f}")
+            lines.append(f"{data_point.timestamp},Servo Control,{1.0:.3f}")
+        elif i == apogee_index + 100:
+            lines.append(f"{data_point.timestamp},State Change,FreefallState")
+    with open(file_path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def write_est_log(file_path: str, data_points: list[ABDataPoint], timestamps: bool = True) -> None:
+    """
+    Writes an est IMU log like MSCLInterface does with the CSV format. Without timestamps it's in the
+    format from before the timestamp column was added, which only has the channels.
+    The IMU is upside down, so the logged acceleration is the opposite of the data point's.
+    """
+    lines = [",".join((["timestamp"] if timestamps else []) + EST_CHANNELS) + ","]
+    for data_point in data_points:
+        channels = {name: 0.125 for name in EST_CHANNELS}
+        channels["estPressureAlt"] = data_point.altitude
+        channels["estLinearAccelX"] = -data_point.accel
+        values = [str(float(channels[name])) for name in EST_CHANNELS]
+        lines.append(",".join(([str(data_point.timestamp)] if timestamps else []) + values) + ",")
+    with open(file_path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+class RecordedInterface:
+    """
+    Plays back recorded data points in batches, in place of an IMU interface
+    """
+
+    def __init__(self, data_points: list[ABDataPoint], batch_size: int = 1):
+        self.data_points = data_points
+        self.batch_size = batch_size
+        self.index = 0
+        self.last_time = 0
+
+    def pop_data_points(self, max_count: int = None, timeout: float = 0.0) -> list:
+        count = self.batch_size if max_count is None else min(self.batch_size, max_count)
+        batch = self.data_points[self.index : self.index + count]
+        self.index += count
+        if batch:
+            self.last_time = batch[-1].timestamp
+        if self.index >= len(self.data_points):
+            batch.append("Done")
+        return batch
+
+    def start_logging_loop_thread(self):
+        pass
+
+    def stop_logging_loop(self):
+        pass
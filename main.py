@@ -3,12 +3,15 @@ import argparse
 from datetime import datetime
 import json
 import logging.config
+import logging.handlers
 from pathlib import Path
+import queue
 import sys
 
 
 sys.path.append("/usr/share/python3-mscl")
-from AirbrakeSystem import Airbrakes
+from AirbrakeSystem import Airbrakes, debug
+from AirbrakeSystem.state import ControlState
 
 # Uses input arguments to choose between mock and real hardware
 # e.g. run as python main.py -si to run using mock servo and mock imu
@@ -18,8 +21,59 @@ parser = argparse.ArgumentParser(
 )
 parser.add_argument("-s", "--mock_servo", action="store_true", help="Use mock servo")
 parser.add_argument("-i", "--mock_imu", action="store_true", help="Use mock IMU")
-
-args = parser.parse_args()
+parser.add_argument(
+    "--simulator",
+    default="openrocket",
+    choices=["openrocket", "native", "replay"],
+    help="Simulator for the mock IMU, native is a python flight model that doesn't need OpenRocket "
+    "and replay plays back the IMU log given with --replay_log",
+)
+parser.add_argument(
+    "--replay_log", default=None, help="The _estLORDlog.csv or .ablog of a flight, for --simulator replay"
+)
+parser.add_argument(
+    "--replay_speed",
+    type=float,
+    default=1.0,
+    help="How many times faster than real time to replay the log, 0 for as fast as possible",
+)
+parser.add_argument(
+    "--replay_rate",
+    type=float,
+    default=100.0,
+    help="For replayed CSV logs from before the timestamp column was logged, the rate in Hz they were logged at",
+)
+parser.add_argument(
+    "--apogee_estimator",
+    default=ControlState.apogee_estimator_name,
+    choices=["table", "model"],
+    help="Predict apogee with the PID lookup table or the polynomial fitted to it (Scripts/fit_apogee_model.py)",
+)
+parser.add_argument(
+    "--log_format",
+    default="csv",
+    choices=["csv", "binary"],
+    help="Format of the flight logs, binary is smaller and faster to write (see AirbrakeSystem/flight_log.py)",
+)
+parser.add_argument(
+    "--timing", action="store_true", help="Measure the latency of each stage of the control loop, printed at shutdown"
+)
+parser.add_argument(
+    "--timing_log_interval",
+    type=float,
+    default=0.0,
+    help="With --timing, also log the latency summaries every this many seconds",
+)
+parser.add_argument(
+    "--realtime",
+    action="store_true",
+    help="Pin to CPU cores, ask for real time priority, lock memory and pause the garbage collector in flight",
+)
+parser.add_argument(
+    "-q", "--quiet", action="store_true", help="Flight mode, nothing is printed to the console while flying"
+)
+# Long only, -v used to be the deploy velocity of a lookup table simulation
+parser.add_argument("--verbose", action="store_true", help="Also print (rate limited) details of the data points")
 
 
 class CSVFormatter(logging.Formatter):
@@ -28,8 +82,16 @@ class CSVFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         # Format as `unix millis,message`
         # support string interpolation for the message
-        if self.airbrakes is not None:
-            return f"{self.airbrakes.interface.last_time},{record.getMessage()}"
+        # Records that went through the AirbrakesQueueHandler already have the time from when they were logged
+        if hasattr(record, "last_time"):
+            last_time = record.last_time
+        elif self.airbrakes is not None:
+            last_time = self.airbrakes.interface.last_time
+        else:
+            last_time = None
+
+        if last_time is not None:
+            return f"{last_time},{record.getMessage()}"
         else:
             return ""
 
@@ -39,49 +101,130 @@ class AirbrakesDataFilter(logging.Filter):
         return record.name == "airbrakes_data"
 
 
-def setup_logging():
+class AirbrakesQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a queue for a QueueListener to write on another thread, so the control loop
+    never waits on the SD card. The airbrakes time is saved on the record when it's logged, since
+    it will have moved on by the time the record gets formatted.
+    """
+
+    airbrakes: Airbrakes = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare, this doesn't format the message here, that's done on the
+        # listener thread. The arguments are just numbers and strings, so they won't change.
+        record.last_time = self.airbrakes.interface.last_time if self.airbrakes is not None else None
+        return record
+
+
+# The handler in logging_config.json that writes the airbrakes data for each log format
+LOG_HANDLERS = {"csv": "file", "binary": "binary_file"}
+
+
+def setup_logging(log_format: str = "csv", console: bool = True) -> logging.handlers.QueueListener | None:
+    """
+    Sets up logging from logging_config.json. The handlers listed in its "queue_handlers" are
+    moved behind an AirbrakesQueueHandler and run on a QueueListener thread.
+    :param console: whether to also log to stdout, which is off in flight mode
+    :return: the QueueListener, which has to be stopped at shutdown to write the last records,
+        or None if nothing is queued
+    """
     # Set up logging
     with open("logging_config.json", "r") as f:
         logging_config = json.load(f)
 
+    queued_handler_names = logging_config.pop("queue_handlers", [])
+
+    # Only keep the file handler for the chosen format, otherwise both files would get created
+    handler_name = LOG_HANDLERS[log_format]
+    for other_handler_name in LOG_HANDLERS.values():
+        if other_handler_name != handler_name:
+            del logging_config["handlers"][other_handler_name]
+    logging_config["loggers"]["root"]["handlers"] = ["stdout", handler_name] if console else [handler_name]
+
     # Make sure logs dir exists
     Path("./logs").mkdir(parents=True, exist_ok=True)
 
     if (1==0): #args.velocity is not None and args.extension is not None:
         Path("./logs/lookup_table_logs").mkdir(parents=True, exist_ok=True)
-        log_file_path = logging_config["handlers"]["file"].get("filename")
+        log_file_path = logging_config["handlers"][handler_name].get("filename")
         log_file_path = log_file_path.replace(
             "{filename}", f"lookup_table_logs/vel{args.velocity}ext{args.extension}"
         )
     else:
         # Set up file handler with ISO 8601 datetime in filename
-        log_file_path = logging_config["handlers"]["file"].get("filename")
+        log_file_path = logging_config["handlers"][handler_name].get("filename")
         log_file_path = log_file_path.replace(
             "{filename}", datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         )
 
-    logging_config["handlers"]["file"]["filename"] = log_file_path
+    logging_config["handlers"][handler_name]["filename"] = log_file_path
 
     logging.config.dictConfig(config=logging_config)
 
+    root_logger = logging.getLogger()
+    queued_handlers = [handler for handler in root_logger.handlers if handler.name in queued_handler_names]
+    if not queued_handlers:
+        return None
 
-def main(args):
-    setup_logging()
+    log_queue = queue.SimpleQueue()
+    for handler in queued_handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(AirbrakesQueueHandler(log_queue))
 
-    airbrakes = Airbrakes(args.mock_servo, args.mock_imu)
+    listener = logging.handlers.QueueListener(log_queue, *queued_handlers, respect_handler_level=True)
+    listener.start()
+    return listener
 
-    # inject the airbrakes object into the CSVFormatter
+
+def main(args):
+    if args.quiet:
+        debug.set_level(debug.OFF)
+    elif args.verbose:
+        debug.set_level(debug.VERBOSE)
+
+    listener = setup_logging(args.log_format, console=not args.quiet)
+
+    ControlState.apogee_estimator_name = args.apogee_estimator
+
+    airbrakes = Airbrakes(
+        args.mock_servo,
+        args.mock_imu,
+        args.simulator,
+        args.log_format,
+        args.timing,
+        args.timing_log_interval,
+        args.realtime,
+        args.replay_log,
+        args.replay_speed,
+        args.replay_rate,
+    )
+
+    # inject the airbrakes object into the CSVFormatter (or the binary handler)
     # so that we can have accurate time in sim
-    logging.getHandlerByName("file").formatter.airbrakes = airbrakes
+    if args.log_format == "binary":
+        logging.getHandlerByName("binary_file").airbrakes = airbrakes
+    else:
+        logging.getHandlerByName("file").formatter.airbrakes = airbrakes
+    AirbrakesQueueHandler.airbrakes = airbrakes
 
-    while not airbrakes.ready_to_shutdown:
-        try:
-            airbrakes.update()
-        except KeyboardInterrupt:
-            break
+    try:
+        while not airbrakes.ready_to_shutdown:
+            try:
+                airbrakes.update()
+            except KeyboardInterrupt:
+                break
 
-    airbrakes.shutdown()
+        airbrakes.shutdown()
+    finally:
+        # Writes whatever is still in the queue
+        if listener is not None:
+            listener.stop()
 
 
 if __name__ == "__main__":
+    # Parsed here so that main can be imported, e.g. by benchmarks/flight_mode_output.py
+    args = parser.parse_args()
+    if args.simulator == "replay" and (args.replay_log is None or not args.mock_imu):
+        parser.error("--simulator replay needs the mock IMU (-i) and a --replay_log")
     main(args)